@@ -0,0 +1,141 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class PoolSaturated(Exception):
+    """Raised when the analysis queue is full; carries a Retry-After hint in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Analysis queue is full")
+        self.retry_after = int(retry_after)
+
+
+class AnalysisPool:
+    """Bounded worker pool for CPU-bound scan analysis.
+
+    Work runs on threads so the YOLO runtime cache and scoring state stay shared with
+    the API process; PIL decode, NumPy and torch release the GIL for the heavy parts.
+    At most `workers + max_queue` jobs are admitted; beyond that `run` fails fast.
+    """
+
+    def __init__(self, workers: int, max_queue: int, thread_name_prefix: str = "analysis"):
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self._thread_name_prefix = thread_name_prefix
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+        self._service_ewma = 0.0
+
+    @classmethod
+    def from_env(cls) -> "AnalysisPool":
+        default_workers = min(4, os.cpu_count() or 1)
+        workers = int(os.environ.get("DRAGON_DETECT_WORKERS", str(default_workers)) or default_workers)
+        max_queue = int(os.environ.get("DRAGON_DETECT_MAX_QUEUE", "16") or 16)
+        return cls(workers=workers, max_queue=max_queue)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix=self._thread_name_prefix,
+                )
+            return self._executor
+
+    def _retry_after(self) -> int:
+        # Rough time for the backlog to drain, never less than a second.
+        backlog = max(1, self._pending - self.workers + 1)
+        est = (self._service_ewma or 1.0) * backlog / float(self.workers)
+        return int(max(1, math.ceil(est)))
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise PoolSaturated(self._retry_after())
+            self._pending += 1
+
+    def _timed(self, submitted_at: float, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        # Runs on the worker thread and frees the admission slot when the job itself ends,
+        # even if the request awaiting it was cancelled long before.
+        started = time.perf_counter()
+        wait = started - submitted_at
+        with self._lock:
+            self._running += 1
+            self._wait_total += wait
+            self._wait_last = wait
+            self._wait_max = max(self._wait_max, wait)
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._running -= 1
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+                a = 0.2
+                self._service_ewma = elapsed if self._service_ewma <= 0 else (a * elapsed + (1 - a) * self._service_ewma)
+                self._pending -= 1
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> asyncio.Future:
+        """Admit a job (or raise PoolSaturated) and return an awaitable for its result."""
+        self._admit()
+        try:
+            loop = asyncio.get_running_loop()
+            job = self._get_executor().submit(self._timed, time.perf_counter(), fn, args, kwargs)
+        except BaseException:
+            self._release()
+            raise
+        # A job cancelled before it started never reaches _timed, so release it here.
+        job.add_done_callback(lambda f: self._release() if f.cancelled() else None)
+        return asyncio.wrap_future(job, loop=loop)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await self.submit(fn, *args, **kwargs)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self._completed + self._failed + self._running
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._pending,
+                "running": self._running,
+                "queue_depth": max(0, self._pending - self._running),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "wait_ms_avg": round((self._wait_total / started) * 1000.0, 3) if started else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000.0, 3),
+                "wait_ms_last": round(self._wait_last * 1000.0, 3),
+                "service_ms_ewma": round(self._service_ewma * 1000.0, 3),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,130 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+# Scores compared with an absolute tolerance; categorical fields must match exactly.
+NUMERIC_FIELDS = (
+    "quality_score",
+    "ripeness_score",
+    "defect_probability",
+    "grade_score",
+    "insect_risk_score",
+    "estimated_price_per_kg",
+    "fruit_area_ratio",
+)
+CATEGORICAL_FIELDS = ("is_valid_fruit", "grade", "defect_level", "size_category", "fruit_status")
+
+
+def _list_images(root: Path) -> list[Path]:
+    exts = {".jpg", ".jpeg", ".png", ".webp"}
+    return sorted(p for p in root.rglob("*") if p.is_file() and p.suffix.lower() in exts)
+
+
+def _compare(full: dict, bounded: dict, tolerances: dict[str, float]) -> tuple[list[str], dict[str, float]]:
+    issues: list[str] = []
+    deltas: dict[str, float] = {}
+    for k in CATEGORICAL_FIELDS:
+        if full.get(k) != bounded.get(k):
+            issues.append(f"{k}: {full.get(k)} -> {bounded.get(k)}")
+    for k in NUMERIC_FIELDS:
+        a = full.get(k)
+        b = bounded.get(k)
+        if a is None or b is None:
+            if a != b:
+                issues.append(f"{k}: {a} -> {b}")
+            continue
+        d = abs(float(a) - float(b))
+        deltas[k] = d
+        if d > tolerances.get(k, 0.0):
+            issues.append(f"{k}: {a} -> {b} (|d|={d:.4g})")
+    return issues, deltas
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare /detect results at full resolution against the bounded analysis resolution."
+    )
+    here = Path(__file__).resolve().parent
+    parser.add_argument("--images", default=str(here / "training_uploads" / "images"))
+    parser.add_argument("--max-side", type=int, default=1024)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--source", default=None, help="Scan source, e.g. mobile_app (stricter validity gate)")
+    parser.add_argument("--score-tol", type=float, default=3.0, help="Tolerance for 0-100 scores")
+    parser.add_argument("--price-tol", type=float, default=8.0, help="Tolerance for PHP/kg price")
+    parser.add_argument("--area-tol", type=float, default=0.02, help="Tolerance for fruit_area_ratio")
+    parser.add_argument("--insect-tol", type=float, default=10.0, help="Tolerance for insect_risk_score")
+    parser.add_argument("--out", default=None, help="Optional JSON report path")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(here))
+    import main as api  # noqa: E402
+
+    tolerances = {
+        "quality_score": args.score_tol,
+        "ripeness_score": args.score_tol,
+        "defect_probability": args.score_tol,
+        "grade_score": args.score_tol,
+        "insect_risk_score": args.insect_tol,
+        "estimated_price_per_kg": args.price_tol,
+        "fruit_area_ratio": args.area_tol,
+    }
+
+    images = _list_images(Path(args.images))
+    if args.limit is not None:
+        images = images[: int(args.limit)]
+    if not images:
+        print(f"No images found under {args.images}")
+        return 1
+
+    rows = []
+    failures = 0
+    t_full = 0.0
+    t_bounded = 0.0
+    max_deltas: dict[str, float] = {}
+    for path in images:
+        contents = path.read_bytes()
+        t0 = time.perf_counter()
+        full = api._analyze_upload(contents, source=args.source, max_side=0)["result"]
+        t1 = time.perf_counter()
+        bounded = api._analyze_upload(contents, source=args.source, max_side=args.max_side)["result"]
+        t2 = time.perf_counter()
+        t_full += t1 - t0
+        t_bounded += t2 - t1
+
+        issues, deltas = _compare(full, bounded, tolerances)
+        for k, d in deltas.items():
+            max_deltas[k] = max(max_deltas.get(k, 0.0), d)
+        failures += 1 if issues else 0
+        rows.append(
+            {
+                "image": str(path),
+                "size": [full.get("width"), full.get("height")],
+                "grade": [full.get("grade"), bounded.get("grade")],
+                "full_ms": round((t1 - t0) * 1000.0, 1),
+                "bounded_ms": round((t2 - t1) * 1000.0, 1),
+                "issues": issues,
+            }
+        )
+        status = "OK  " if not issues else "FAIL"
+        print(f"{status} {path.name}: grade {full.get('grade')}->{bounded.get('grade')} "
+              f"{(t1 - t0) * 1000.0:.0f}ms->{(t2 - t1) * 1000.0:.0f}ms {'; '.join(issues)}")
+
+    summary = {
+        "images": len(images),
+        "failures": failures,
+        "max_side": int(args.max_side),
+        "speedup": round(t_full / max(1e-9, t_bounded), 2),
+        "max_abs_delta": {k: round(v, 4) for k, v in sorted(max_deltas.items())},
+        "tolerances": tolerances,
+    }
+    print(json.dumps(summary, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "rows": rows}, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
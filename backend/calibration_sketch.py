@@ -0,0 +1,310 @@
+import json
+import math
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+from segmented_log import read_log
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts: only the in-process lock applies
+    fcntl = None
+
+
+class KLLSketch:
+    """Mergeable streaming quantile sketch (KLL: Karnin, Lang & Liberty 2016).
+
+    Items live in levels of compactors; an item at level h stands for 2**h inputs. When
+    the sketch outgrows its budget, the lowest over-full level is sorted and every other
+    item (random offset) is promoted, so memory stays O(k) however long the stream is
+    and rank error stays around 1/k. Until the first compaction every input is kept and
+    `percentile` equals np.percentile of the inputs exactly.
+    """
+
+    def __init__(self, k: int = 200, seed: int | None = None):
+        self.k = max(8, int(k))
+        self.n = 0
+        self.levels: list[list[float]] = [[]]
+        self._rng = random.Random(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    @property
+    def retained(self) -> int:
+        return sum(len(items) for items in self.levels)
+
+    def _compress(self) -> None:
+        while self.retained > sum(self._capacity(h) for h in range(len(self.levels))):
+            for h, items in enumerate(self.levels):
+                if len(items) >= self._capacity(h):
+                    break
+            if h + 1 == len(self.levels):
+                self.levels.append([])
+            items.sort()
+            # An odd item out stays behind so the total weight is still exactly n.
+            keep = [items.pop()] if len(items) % 2 else []
+            self.levels[h + 1].extend(items[self._rng.random() < 0.5 :: 2])
+            self.levels[h] = keep
+
+    def add(self, value: float) -> None:
+        self.levels[0].append(float(value))
+        self.n += 1
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def update(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "KLLSketch") -> None:
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.n += other.n
+        self._compress()
+
+    def percentile(self, q: float) -> float:
+        """Estimate of np.percentile(inputs, q) (linear interpolation between ranks)."""
+        if self.n == 0:
+            raise ValueError("percentile of an empty sketch")
+        if len(self.levels) == 1:
+            return float(np.percentile(self.levels[0], q))
+        values = np.concatenate([np.asarray(items, dtype=float) for items in self.levels])
+        weights = np.concatenate([np.full(len(items), 1 << h, dtype=np.int64) for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        values = values[order]
+        cum = np.cumsum(weights[order])
+        total = int(cum[-1])
+        vi = (total - 1) * (float(q) / 100.0)
+        lo = int(np.floor(vi))
+        a = float(values[np.searchsorted(cum, lo, side="right")])
+        if lo + 1 >= total:
+            return a
+        b = float(values[np.searchsorted(cum, lo + 1, side="right")])
+        gamma = vi - lo
+        return b - (b - a) * (1 - gamma) if gamma >= 0.5 else a + (b - a) * gamma
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"k": self.k, "n": self.n, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "KLLSketch":
+        sketch = cls(int(data.get("k") or 200))
+        sketch.levels = [[float(v) for v in items] for items in data.get("levels") or [[]]] or [[]]
+        sketch.n = int(data.get("n") or sum((1 << h) * len(items) for h, items in enumerate(sketch.levels)))
+        return sketch
+
+
+class CalibrationSketches:
+    """defect_probability / quality_score quantiles of graded scans, for scoring calibration.
+
+    Persisted as a small JSON file (a few KB however long the scans log gets) that is
+    the shared copy when several worker processes serve the app. Each process adds its
+    scans to a local delta; `save` takes an exclusive flock on `<path>.lock`, merges the
+    delta into the sketches on disk, writes them back and keeps the merged result, so no
+    worker's observations are overwritten. Percentiles are read from that merged copy,
+    so every worker calibrates from the same data. When the file does not exist yet it
+    is seeded by streaming the scans log (sealed segments included) once.
+    """
+
+    FIELDS = ("defect_probability", "quality_score")
+
+    def __init__(self, path: str, k: int = 200, save_every: int = 50):
+        self.path = path
+        self.k = int(k)
+        self.save_every = max(1, int(save_every))
+        self.sketches = self._empty()
+        self._delta = self._empty()
+        self._lock = threading.Lock()
+        # Serializes save() within the process; the flock serializes it across processes.
+        self._save_lock = threading.Lock()
+        self._saves = 0
+        self._loaded_from: str | None = None
+
+    @classmethod
+    def from_env(cls, path: str) -> "CalibrationSketches":
+        return cls(
+            path,
+            int(os.environ.get("DRAGON_CALIBRATION_SKETCH_K", "200") or 200),
+            int(os.environ.get("DRAGON_CALIBRATION_SAVE_EVERY", "50") or 50),
+        )
+
+    def _empty(self) -> dict[str, KLLSketch]:
+        return {name: KLLSketch(self.k) for name in self.FIELDS}
+
+    @property
+    def n(self) -> int:
+        with self._lock:
+            return self.sketches["quality_score"].n
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _read(self) -> dict[str, KLLSketch] | None:
+        try:
+            data = json.loads(Path(self.path).read_text(encoding="utf-8"))
+            return {name: KLLSketch.from_dict(data[name]) for name in self.FIELDS}
+        except Exception:
+            return None
+
+    def load(self, scans_path: str | None = None) -> None:
+        with self._save_lock, self._file_lock():
+            merged = self._read()
+            if merged is not None:
+                with self._lock:
+                    self.sketches = merged
+                self._loaded_from = "sketch"
+                return
+            if scans_path:
+                # Under the lock: the first worker seeds the file, the others then read it.
+                self._seed(scans_path)
+                self._loaded_from = "scans"
+                if self.unsaved:
+                    self._save_locked()
+
+    def _seed(self, scans_path: str) -> None:
+        # Same selection the scan-time updates use: graded scans with stored features.
+        for record in read_log(scans_path):
+            if not isinstance(record, dict) or not isinstance(record.get("features"), dict):
+                continue
+            prediction = record.get("prediction")
+            if not isinstance(prediction, dict) or str(prediction.get("grade", "")).upper() == "N/A":
+                continue
+            self._add(record["features"])
+
+    def _add(self, features: dict) -> bool:
+        with self._lock:
+            for name in self.FIELDS:
+                self._delta[name].add(float(features.get(name) or 0.0))
+            return self._delta["quality_score"].n >= self.save_every
+
+    def observe(self, features: dict) -> None:
+        if self._add(features):
+            self.save()
+
+    @property
+    def unsaved(self) -> int:
+        with self._lock:
+            return self._delta["quality_score"].n
+
+    def percentile(self, name: str, q: float) -> float:
+        """Percentile of the merged sketches as of the last load() or save()."""
+        with self._lock:
+            return self.sketches[name].percentile(q)
+
+    def save(self) -> bool:
+        """Merge this process's new observations into the file and reload the merged sketches.
+
+        Returns whether the file was written; with nothing to add it only re-reads it, which
+        picks up what other workers saved.
+        """
+        with self._save_lock, self._file_lock():
+            return self._save_locked()
+
+    def _save_locked(self) -> bool:
+        # Caller holds the save lock and the file lock.
+        with self._lock:
+            delta = self._delta
+            self._delta = self._empty()
+        merged = self._read()
+        if not delta["quality_score"].n and merged is not None:
+            with self._lock:
+                self.sketches = merged
+            return False
+        merged = merged or self._empty()
+        for name in self.FIELDS:
+            merged[name].merge(delta[name])
+        payload = json.dumps({name: s.to_dict() for name, s in merged.items()}, separators=(",", ":"))
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp, self.path)
+        except OSError:
+            # Keep the observations for the next save.
+            with self._lock:
+                for name in self.FIELDS:
+                    self._delta[name].merge(delta[name])
+            return False
+        with self._lock:
+            self.sketches = merged
+        self._saves += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "n": self.sketches["quality_score"].n,
+                "retained": {name: s.retained for name, s in self.sketches.items()},
+                "unsaved": self._delta["quality_score"].n,
+                "saves": self._saves,
+                "loaded_from": self._loaded_from,
+            }
+
+
+class CalibrationRefresher:
+    """Daemon thread that calls `refresh` every `interval_s` seconds until stopped."""
+
+    def __init__(self, refresh, interval_s: float):
+        self.refresh = refresh
+        self.interval_s = max(0.0, float(interval_s))
+        self.runs = 0
+        self.errors = 0
+        self.last_run_at: float | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def from_env(cls, refresh) -> "CalibrationRefresher":
+        return cls(refresh, float(os.environ.get("DRAGON_CALIBRATION_REFRESH_S", "300") or 0))
+
+    def start(self) -> None:
+        if self.interval_s <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="calibration-refresh", daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.refresh()
+                self.runs += 1
+            except Exception:
+                self.errors += 1
+            self.last_run_at = time.time()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "interval_s": self.interval_s,
+            "running": self._thread is not None,
+            "runs": self.runs,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+        }
@@ -0,0 +1,271 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Iterable, Mapping
+
+import numpy as np
+
+from scoring import (
+    DEFAULT_CALIBRATION,
+    GATE_DECISIONS,
+    GRADES,
+    SCORE_DTYPE,
+    SORTING_LANES,
+    gate_decisions,
+    rows_from_records,
+    score_decided,
+    score_rows,
+)
+from segmented_log import read_log
+
+PRICE_QUANTILES = (10, 50, 90)
+# Scored (point, row) cells per chunk; bounds the (points, rows) temporaries to tens of MB.
+CHUNK_CELLS = 1 << 22
+
+
+def load_history(path: str | Path, since: str | None = None, until: str | None = None) -> np.ndarray:
+    """SCORE_DTYPE rows for every scan of a scans log (sealed segments included) that
+    stored its scoring_inputs, optionally only those stamped within [since, until)."""
+    records = []
+    for record in read_log(str(path), since, until):
+        inputs = record.get("scoring_inputs") if isinstance(record, dict) else None
+        if isinstance(inputs, dict):
+            records.append(inputs)
+    return rows_from_records(records)
+
+
+def calibration_grid(
+    grid: Mapping[str, Iterable[float]] | None = None,
+    points: Iterable[Mapping[str, float]] | None = None,
+    base: Mapping[str, float] | None = None,
+    max_points: int | None = None,
+) -> dict[str, np.ndarray]:
+    """(G,) arrays per calibration parameter.
+
+    `grid` maps parameters to candidate values and contributes their cartesian product;
+    `points` lists explicit parameter sets. Parameters a point leaves out keep `base`
+    (default DEFAULT_CALIBRATION).
+    """
+    base = {**DEFAULT_CALIBRATION, **{k: float(v) for k, v in (base or {}).items() if k in DEFAULT_CALIBRATION}}
+    sets: list[dict[str, float]] = []
+    if grid:
+        names = list(grid)
+        values = [[float(v) for v in grid[k]] for k in names]
+        total = int(np.prod([len(v) for v in values]))
+        if max_points is not None and total > max_points:
+            raise ValueError(f"Grid has {total} points (max {max_points}).")
+        _check_names(names)
+        sets.extend({**base, **dict(zip(names, combo))} for combo in itertools.product(*values))
+    for point in points or []:
+        _check_names(point)
+        sets.append({**base, **{k: float(v) for k, v in point.items()}})
+    if not sets:
+        raise ValueError("Empty calibration grid.")
+    if max_points is not None and len(sets) > max_points:
+        raise ValueError(f"Grid has {len(sets)} points (max {max_points}).")
+    out = {k: np.array([s[k] for s in sets], dtype=float) for k in DEFAULT_CALIBRATION}
+    if not all(np.isfinite(v).all() for v in out.values()):
+        raise ValueError("Calibration values must be finite numbers.")
+    return out
+
+
+def _check_names(names: Iterable[str]) -> None:
+    unknown = [k for k in names if k not in DEFAULT_CALIBRATION]
+    if unknown:
+        raise ValueError(f"Unknown calibration parameters: {', '.join(unknown)}")
+
+
+def _distribution(grades: np.ndarray, prices: np.ndarray) -> dict[str, Any]:
+    counts = np.bincount(grades, minlength=len(GRADES))
+    return {
+        "grades": {g: int(c) for g, c in zip(GRADES, counts)},
+        "lanes": {lane: int(c) for lane, c in zip(SORTING_LANES, counts)},
+        "price": _price_summary(prices),
+    }
+
+
+def _price_summary(prices: np.ndarray) -> dict[str, float] | None:
+    # Prices of the valid (graded) scans only; N/A scans are priced at zero.
+    if prices.size == 0:
+        return None
+    quantiles = np.percentile(prices, PRICE_QUANTILES)
+    out = {"mean": round(float(prices.mean()), 2)}
+    out.update({f"p{q}": round(float(v), 2) for q, v in zip(PRICE_QUANTILES, quantiles)})
+    return out
+
+
+def sweep(
+    rows: np.ndarray,
+    grid: Mapping[str, np.ndarray],
+    price_model: Mapping[str, Any] | None = None,
+    baseline: Mapping[str, float] | None = None,
+) -> dict[str, Any]:
+    """Grade, lane and price distributions of `rows` under every calibration in `grid`.
+
+    Calibration only enters scoring through the threshold outcomes in GATE_DECISIONS,
+    so each (point, row) cell reduces to a 7-bit state. Cells are scored once per distinct
+    (state, row) pair - a few per row, however many points there are - and every point's
+    distribution is gathered from that table. Results equal score_rows() per point.
+    """
+    t0 = time.perf_counter()
+    n = int(rows.shape[0])
+    n_points = int(len(next(iter(grid.values()))))
+    valid = rows["is_valid_fruit"]
+    base = score_rows(rows, baseline, price_model)
+    out: dict[str, Any] = {
+        "n_scans": n,
+        "n_valid": int(np.count_nonzero(valid)),
+        "n_points": n_points,
+        "baseline": {
+            "calibration": {k: float(v) for k, v in {**DEFAULT_CALIBRATION, **(baseline or {})}.items()},
+            **_distribution(base["grade"], base["estimated_price_per_kg"][valid]),
+        },
+        "points": [],
+    }
+    if n == 0:
+        out["points"] = [
+            {"calibration": {k: float(v[g]) for k, v in grid.items()}, **_distribution(base["grade"], base["estimated_price_per_kg"]), "regraded": 0}
+            for g in range(n_points)
+        ]
+        out["elapsed_ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+        return out
+
+    n_keys = n << len(GATE_DECISIONS)
+    key_dtype = np.int32 if n_keys <= np.iinfo(np.int32).max else np.int64
+    row_ids = np.arange(n, dtype=key_dtype)
+    table_index = np.full(n_keys, -1, dtype=np.int32)
+    table_grade = np.zeros(0, dtype=np.int8)
+    table_price = np.zeros(0, dtype=np.float64)
+    step = max(1, CHUNK_CELLS // n)
+    for g0 in range(0, n_points, step):
+        g1 = min(n_points, g0 + step)
+        decided = gate_decisions(rows, {k: v[g0:g1, None] for k, v in grid.items()})
+        state = np.zeros((g1 - g0, n), dtype=np.uint8)
+        for bit, name in enumerate(GATE_DECISIONS):
+            state |= decided[name].view(np.uint8) << np.uint8(bit)
+        keys = state.astype(key_dtype) * key_dtype(n) + row_ids
+        idx = table_index[keys]
+        missing = idx < 0
+        if missing.any():
+            new_keys = np.unique(keys[missing])
+            new_state, new_rows = np.divmod(new_keys, n)
+            scored = score_decided(
+                rows[new_rows],
+                {name: ((new_state >> bit) & 1).astype(bool) for bit, name in enumerate(GATE_DECISIONS)},
+                price_model,
+            )
+            table_index[new_keys] = np.arange(table_grade.size, table_grade.size + new_keys.size, dtype=np.int32)
+            table_grade = np.concatenate([table_grade, scored["grade"]])
+            table_price = np.concatenate([table_price, scored["estimated_price_per_kg"]])
+            idx = table_index[keys]
+        grades = table_grade[idx]
+        regraded = np.count_nonzero(grades != base["grade"], axis=1)
+        prices = table_price[idx[:, valid]]
+        quantiles = np.percentile(prices, PRICE_QUANTILES, axis=1) if prices.shape[1] else None
+        means = prices.mean(axis=1) if prices.shape[1] else None
+        counts = np.bincount(
+            (grades.astype(np.intp) + np.arange(g1 - g0)[:, None] * len(GRADES)).ravel(),
+            minlength=(g1 - g0) * len(GRADES),
+        ).reshape(g1 - g0, len(GRADES))
+        for j in range(g1 - g0):
+            price = None
+            if quantiles is not None:
+                price = {"mean": round(float(means[j]), 2)}
+                price.update({f"p{q}": round(float(quantiles[i, j]), 2) for i, q in enumerate(PRICE_QUANTILES)})
+            out["points"].append(
+                {
+                    "calibration": {k: float(v[g0 + j]) for k, v in grid.items()},
+                    "grades": {g: int(c) for g, c in zip(GRADES, counts[j])},
+                    "lanes": {lane: int(c) for lane, c in zip(SORTING_LANES, counts[j])},
+                    "price": price,
+                    "regraded": int(regraded[j]),
+                }
+            )
+    out["scored_cells"] = int(table_grade.size)
+    out["elapsed_ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+    return out
+
+
+def _check(rows: np.ndarray, grid: Mapping[str, np.ndarray], result: dict, price_model, picks: Iterable[int]) -> list[str]:
+    # Re-score sampled points directly and compare against the sweep.
+    valid = rows["is_valid_fruit"]
+    issues = []
+    for g in picks:
+        scored = score_rows(rows, {k: float(v[g]) for k, v in grid.items()}, price_model)
+        expected = _distribution(scored["grade"], scored["estimated_price_per_kg"][valid])
+        got = result["points"][g]
+        for key in ("grades", "lanes", "price"):
+            if expected[key] != got[key]:
+                issues.append(f"point {g}: {key} differs")
+    return issues
+
+
+def _synthetic_rows(n: int, rng: np.random.Generator) -> np.ndarray:
+    rows = np.zeros(n, dtype=SCORE_DTYPE)
+    rows["is_valid_fruit"] = rng.random(n) < 0.95
+    rows["quality_score"] = rng.uniform(40.0, 99.0, n).round(2)
+    rows["ripeness_score"] = rng.uniform(40.0, 99.0, n).round(2)
+    rows["defect_probability"] = rng.uniform(0.0, 80.0, n).round(2)
+    rows["fruit_area_ratio"] = rng.uniform(0.0, 0.5, n).round(4)
+    rows["color_score"] = rng.uniform(0.0, 10.0, n).round(2)
+    rows["shape_score"] = rng.choice([5, 8, 10], n)
+    rows["best_yolo_conf"] = rng.random(n).round(3)
+    rows["yolo_bad_best_conf"] = (rng.random(n) * 0.95).round(3)
+    rows["yolo_bad_count"] = rng.choice([0, 0, 0, 1, 2], n)
+    rows["insect_risk_level"] = rng.integers(0, 3, n)
+    rows["insect_risk_score"] = rng.integers(0, 100, n)
+    return rows
+
+
+def _default_grid(points: int) -> dict[str, list[float]]:
+    # About `points` sets spread over the ranges _load_scoring_calibration can produce.
+    ranges = {
+        "defect_medium_gate": (34.0, 48.0),
+        "defect_high_gate": (56.0, 72.0),
+        "fresh_quality_floor": (78.0, 85.0),
+        "fresh_defect_cap": (24.0, 34.0),
+        "grade_floor_c_quality": (70.0, 80.0),
+        "grade_floor_b_quality": (78.0, 88.0),
+    }
+    per_axis = max(1, int(round(points ** (1.0 / len(ranges)))))
+    return {k: np.linspace(lo, hi, per_axis).round(2).tolist() for k, (lo, hi) in ranges.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep scoring calibrations over historical scans.")
+    parser.add_argument("--scans", default=None, help="scans.jsonl to replay (default: synthetic rows)")
+    parser.add_argument("--synthetic", type=int, default=100_000, help="Synthetic scans when --scans is not given")
+    parser.add_argument("--grid", default=None, help='JSON {"param": [values, ...]} (cartesian product)')
+    parser.add_argument("--points", type=int, default=1000, help="Approximate size of the default grid")
+    parser.add_argument("--price-model", default=None, help="price_model.json for the price blend")
+    parser.add_argument("--check", type=int, default=3, help="Points to re-score directly and compare")
+    parser.add_argument("--full", action="store_true", help="Print every point, not just the summary")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    t0 = time.perf_counter()
+    rows = load_history(args.scans) if args.scans else _synthetic_rows(args.synthetic, rng)
+    load_ms = round((time.perf_counter() - t0) * 1000.0, 3)
+    price_model = json.loads(Path(args.price_model).read_text(encoding="utf-8")) if args.price_model else None
+    grid = calibration_grid(json.loads(args.grid) if args.grid else _default_grid(args.points))
+
+    result = sweep(rows, grid, price_model)
+    n_points = result["n_points"]
+    issues = _check(rows, grid, result, price_model, rng.choice(n_points, size=min(args.check, n_points), replace=False))
+    if issues:
+        print("; ".join(issues))
+        return 1
+
+    if not args.full:
+        regraded = [p["regraded"] for p in result["points"]]
+        result["points"] = {"regraded_min": min(regraded), "regraded_max": max(regraded)}
+    result["load_ms"] = load_ms
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
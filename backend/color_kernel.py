@@ -0,0 +1,287 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    import numba  # type: ignore
+except Exception:  # optional accelerator
+    numba = None
+
+# Per-pixel colour classes, one bit each, so a pixel can belong to several.
+PINK_RED = 1
+YELLOW = 2
+GREEN = 4
+WHITE = 8
+CLASS_BITS = {"pink_red": PINK_RED, "yellow": YELLOW, "green": GREEN, "white": WHITE}
+
+# Thresholds of the colour rules. The lookup table is compiled from these and is
+# rebuilt (and re-cached) whenever they change.
+COLOR_RULES = {
+    # Pink/Red (skin): red dominant, green low
+    "pink_red": {"r_over_g": 1.2, "r_over_b": 0.8, "r_min": 50},
+    # Yellow (yellow pitaya): red + green high, blue low
+    "yellow": {"r_min": 100, "g_min": 100, "b_max": 100},
+    # Green (wings/scales): green dominant
+    "green": {"g_over_r": 1.05, "g_over_b": 1.05, "g_min": 40},
+    # White (flesh): high brightness, low saturation
+    "white": {"min": 150, "max_diff": 30},
+}
+_DEFAULT_RULES = copy.deepcopy(COLOR_RULES)
+# Bump when the rule expressions below change, so cached tables are not reused.
+_LUT_VERSION = 1
+
+# Rows per tile for the NumPy paths; keeps the temporaries cache-sized.
+_TILE_PIXELS = 1 << 16
+
+# The reference masks compare uint8 channels against float products (R > G * 1.2 ...).
+# For integer channels these are exactly the integer inequalities used below
+# (5R > 6G, 5R > 4B, 20G > 21R, 20G > 21B), checked over all 256x256 pairs. The white
+# test `np.abs(R - G) < 30` runs on uint8, so R - G wraps mod 256 and abs is a no-op;
+# the kernels reproduce that with `(R - G) & 255`. These fused kernels hard-code the
+# default COLOR_RULES; the lookup table handles any thresholds.
+
+
+def _rule_bits(R: np.ndarray, G: np.ndarray, B: np.ndarray, rules: dict) -> np.ndarray:
+    # The rules written exactly as the original masks (uint8 channels, float products).
+    p, y, g, w = rules["pink_red"], rules["yellow"], rules["green"], rules["white"]
+    bits = ((R > G * p["r_over_g"]) & (R > B * p["r_over_b"]) & (R > p["r_min"])).astype(np.uint8)
+    bits |= (((R > y["r_min"]) & (G > y["g_min"]) & (B < y["b_max"])).astype(np.uint8) << 1)
+    bits |= (((G > R * g["g_over_r"]) & (G > B * g["g_over_b"]) & (G > g["g_min"])).astype(np.uint8) << 2)
+    white = (R > w["min"]) & (G > w["min"]) & (B > w["min"])
+    white &= (np.abs(R - G) < w["max_diff"]) & (np.abs(G - B) < w["max_diff"])
+    bits |= (white.astype(np.uint8) << 3)
+    return bits
+
+
+def _fingerprint(rules: dict) -> tuple:
+    return tuple((name, tuple(sorted(rule.items()))) for name, rule in sorted(rules.items()))
+
+
+_DEFAULT_FINGERPRINT = _fingerprint(_DEFAULT_RULES)
+# (id(rules), fingerprint, key) of the last rules hashed; the fingerprint catches in-place edits.
+_KEY_CACHE: tuple[int, tuple, str] | None = None
+
+
+def _rules_key(rules: dict) -> str:
+    global _KEY_CACHE
+    fingerprint = _fingerprint(rules)
+    cached = _KEY_CACHE
+    if cached is not None and cached[0] == id(rules) and cached[1] == fingerprint:
+        return cached[2]
+    blob = json.dumps({"v": _LUT_VERSION, "rules": rules}, sort_keys=True).encode("utf-8")
+    key = hashlib.sha256(blob).hexdigest()[:16]
+    _KEY_CACHE = (id(rules), fingerprint, key)
+    return key
+
+
+def build_color_lut(rules: dict | None = None) -> np.ndarray:
+    """Class bits for every 24-bit colour, indexed by (R << 16) | (G << 8) | B."""
+    rules = COLOR_RULES if rules is None else rules
+    lut = np.empty(1 << 24, dtype=np.uint8)
+    v = np.arange(1 << 16, dtype=np.uint32)
+    G = ((v >> 8) & 255).astype(np.uint8)
+    B = (v & 255).astype(np.uint8)
+    for r in range(256):
+        R = np.full(v.shape, r, dtype=np.uint8)
+        lut[r << 16:(r + 1) << 16] = _rule_bits(R, G, B, rules)
+    return lut
+
+
+def _lut_dir() -> str:
+    default = os.path.join(os.path.dirname(__file__), "data", "cache")
+    return os.environ.get("DRAGON_COLOR_LUT_DIR", default) or default
+
+
+_LUT: np.ndarray | None = None
+_LUT_KEY: str | None = None
+_LUT_LOCK = threading.Lock()
+
+
+def _load_or_build(key: str) -> np.ndarray:
+    path = os.path.join(_lut_dir(), f"color_lut_{key}.npy")
+    try:
+        lut = np.load(path)
+        if lut.dtype == np.uint8 and lut.shape == (1 << 24,):
+            return lut
+    except Exception:
+        pass
+    lut = build_color_lut(COLOR_RULES)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, lut)
+        os.replace(tmp, path)
+        # Tables for superseded thresholds are never read again.
+        for name in os.listdir(os.path.dirname(path)):
+            if name.startswith("color_lut_") and name.endswith(".npy") and name != os.path.basename(path):
+                os.remove(os.path.join(os.path.dirname(path), name))
+    except Exception:
+        pass
+    return lut
+
+
+def get_color_lut() -> np.ndarray:
+    """The 16 MiB class-bit table for the current COLOR_RULES, from disk cache or built."""
+    global _LUT, _LUT_KEY
+    key = _rules_key(COLOR_RULES)
+    if _LUT is not None and _LUT_KEY == key:
+        return _LUT
+    with _LUT_LOCK:
+        if _LUT is None or _LUT_KEY != key:
+            _LUT = _load_or_build(key)
+            _LUT_KEY = key
+        return _LUT
+
+
+def _use_lut() -> bool:
+    # Opt-in: the fused kernels are faster for the default rules (8.6 vs 15.4 ms per frame
+    # in color_kernel_bench.py); the table is for tuned thresholds.
+    return str(os.environ.get("DRAGON_COLOR_LUT", "0")).strip().lower() in ("1", "true", "yes")
+
+
+def lut_in_use() -> bool:
+    """Whether classify_colors() reads the lookup table (opted in, or non-default rules)."""
+    return _use_lut() or _fingerprint(COLOR_RULES) != _DEFAULT_FINGERPRINT
+
+
+def _classify_lut(img: np.ndarray, lut: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    h, w = img.shape[:2]
+    labels = np.empty((h, w), dtype=np.uint8)
+    hist = np.zeros(16, dtype=np.int64)
+    rows = max(1, _TILE_PIXELS // max(1, w))
+    for y0 in range(0, h, rows):
+        tile = img[y0:y0 + rows]
+        idx = tile[..., 0].astype(np.int32)
+        idx <<= 8
+        idx |= tile[..., 1]
+        idx <<= 8
+        idx |= tile[..., 2]
+        out = labels[y0:y0 + rows]
+        np.take(lut, idx, out=out)
+        hist += np.bincount(out.ravel(), minlength=16)
+    return labels, hist
+
+
+def _or_bit(out: np.ndarray, mask: np.ndarray, shift: int) -> None:
+    # Bool arrays are 0/1 bytes: shift in place and OR, no fancy-index temporaries.
+    m8 = mask.view(np.uint8)
+    m8 <<= shift
+    out |= m8
+
+
+def _classify_tile(rgb: np.ndarray, out: np.ndarray) -> None:
+    r = rgb[..., 0].astype(np.int16)
+    g = rgb[..., 1].astype(np.int16)
+    b = rgb[..., 2].astype(np.int16)
+    r5 = r * 5
+    g20 = g * 20
+
+    m = r5 > g * 6
+    m &= r5 > b * 4
+    m &= r > 50
+    np.copyto(out, m)
+
+    m = r > 100
+    m &= g > 100
+    m &= b < 100
+    _or_bit(out, m, 1)
+
+    m = g20 > r * 21
+    m &= g20 > b * 21
+    m &= g > 40
+    _or_bit(out, m, 2)
+
+    m = r > 150
+    m &= g > 150
+    m &= b > 150
+    d = r - g
+    d &= 255
+    m &= d < 30
+    np.subtract(g, b, out=d)
+    d &= 255
+    m &= d < 30
+    _or_bit(out, m, 3)
+
+
+def _classify_numpy(img: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    h, w = img.shape[:2]
+    labels = np.empty((h, w), dtype=np.uint8)
+    hist = np.zeros(16, dtype=np.int64)
+    rows = max(1, _TILE_PIXELS // max(1, w))
+    for y0 in range(0, h, rows):
+        out = labels[y0:y0 + rows]
+        _classify_tile(img[y0:y0 + rows], out)
+        # Counted per tile: bincount widens its input to intp.
+        hist += np.bincount(out.ravel(), minlength=16)
+    return labels, hist
+
+
+def _classify_loop(img, labels, hist):
+    h, w = labels.shape
+    for y in range(h):
+        for x in range(w):
+            r = np.int32(img[y, x, 0])
+            g = np.int32(img[y, x, 1])
+            b = np.int32(img[y, x, 2])
+            v = 0
+            if 5 * r > 6 * g and 5 * r > 4 * b and r > 50:
+                v |= 1
+            if r > 100 and g > 100 and b < 100:
+                v |= 2
+            if 20 * g > 21 * r and 20 * g > 21 * b and g > 40:
+                v |= 4
+            if r > 150 and g > 150 and b > 150 and ((r - g) & 255) < 30 and ((g - b) & 255) < 30:
+                v |= 8
+            labels[y, x] = v
+            hist[v] += 1
+
+
+_NUMBA_KERNEL = None
+
+
+def _numba_kernel():
+    global _NUMBA_KERNEL
+    if _NUMBA_KERNEL is None:
+        _NUMBA_KERNEL = numba.njit(cache=True, nogil=True)(_classify_loop)
+    return _NUMBA_KERNEL
+
+
+def _use_numba() -> bool:
+    if numba is None:
+        return False
+    return str(os.environ.get("DRAGON_COLOR_NUMBA", "1")).strip().lower() not in ("0", "false", "no")
+
+
+def classify_colors(img_array: np.ndarray) -> tuple[np.ndarray, dict[str, int]]:
+    """Colour-class label image (uint8 bit set per pixel) and pixel counts per class.
+
+    Matches the pink/red, yellow, green and white masks of the original verification
+    block bit for bit. Counts include "any" (pixels in at least one class) and "total".
+    Runs the fused arithmetic kernel (numba, else tiled NumPy) for the default rules,
+    and the precomputed lookup table (one gather per pixel) with DRAGON_COLOR_LUT=1 or
+    when COLOR_RULES were tuned away from the defaults the fused kernels hard-code.
+    """
+    img = np.ascontiguousarray(img_array[..., :3], dtype=np.uint8)
+    h, w = img.shape[:2]
+    if lut_in_use():
+        labels, hist = _classify_lut(img, get_color_lut())
+    elif _use_numba():
+        labels = np.empty((h, w), dtype=np.uint8)
+        hist = np.zeros(16, dtype=np.int64)
+        _numba_kernel()(img, labels, hist)
+    else:
+        labels, hist = _classify_numpy(img)
+
+    counts = {name: int(hist[[v for v in range(16) if v & bit]].sum()) for name, bit in CLASS_BITS.items()}
+    counts["any"] = int(h * w - hist[0])
+    counts["total"] = int(h * w)
+    return labels, counts
+
+
+def class_mask(labels: np.ndarray, name: str) -> np.ndarray:
+    return (labels & CLASS_BITS[name]) != 0
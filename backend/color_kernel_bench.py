@@ -0,0 +1,123 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+import color_kernel
+
+
+def _reference(img_array: np.ndarray) -> dict:
+    # The masks exactly as the /detect verification block used to build them.
+    R = img_array[:, :, 0]
+    G = img_array[:, :, 1]
+    B = img_array[:, :, 2]
+    mask_pink_red = (R > G * 1.2) & (R > B * 0.8) & (R > 50)
+    mask_yellow = (R > 100) & (G > 100) & (B < 100)
+    mask_green = (G > R * 1.05) & (G > B * 1.05) & (G > 40)
+    mask_white = (R > 150) & (G > 150) & (B > 150) & (np.abs(R - G) < 30) & (np.abs(G - B) < 30)
+    dragon_fruit_pixels = np.sum(mask_pink_red | mask_yellow | mask_green | mask_white)
+    return {
+        "pink_red": mask_pink_red,
+        "yellow": mask_yellow,
+        "green": mask_green,
+        "white": mask_white,
+        "any": int(dragon_fruit_pixels),
+        "pink_count": int(np.sum(mask_pink_red)),
+        "green_count": int(np.sum(mask_green)),
+    }
+
+
+def _fused(img: np.ndarray):
+    return color_kernel._classify_numpy(img)
+
+
+def _lut(img: np.ndarray):
+    return color_kernel._classify_lut(img, color_kernel.get_color_lut())
+
+
+def _check(img: np.ndarray) -> list[str]:
+    ref = _reference(img)
+    issues = []
+    for path, fn in (("fused", _fused), ("lut", _lut)):
+        labels, hist = fn(img)
+        for name in color_kernel.CLASS_BITS:
+            if not np.array_equal(color_kernel.class_mask(labels, name), ref[name]):
+                issues.append(f"{path}: {name} mask differs")
+        if int(labels.size - hist[0]) != ref["any"]:
+            issues.append(f"{path}: any count differs")
+    labels, counts = color_kernel.classify_colors(img)
+    if counts["pink_red"] != ref["pink_count"] or counts["green"] != ref["green_count"]:
+        issues.append("class counts differ")
+    return issues
+
+
+def _all_colors() -> np.ndarray:
+    v = np.arange(1 << 24, dtype=np.uint32)
+    rgb = np.stack([(v >> 16) & 255, (v >> 8) & 255, v & 255], axis=-1).astype(np.uint8)
+    return rgb.reshape(4096, 4096, 3)
+
+
+def _bench(fn, img: np.ndarray, repeat: int) -> dict:
+    fn(img)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(img)
+    elapsed = (time.perf_counter() - t0) / repeat
+    tracemalloc.start()
+    fn(img)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ms": round(elapsed * 1000.0, 3), "peak_alloc_kib": round(peak / 1024.0, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the colour-class kernels (fused and lookup table) against the old masks.")
+    parser.add_argument("--image", default=None, help="Optional photo to benchmark on (default: random noise)")
+    parser.add_argument("--size", default="1024x768", help="WxH of the random test frame")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip-exhaustive", action="store_true", help="Skip the all-2^24-colours equality check")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    color_kernel.get_color_lut()
+    print(f"lookup table ready in {(time.perf_counter() - t0) * 1000.0:.0f} ms")
+
+    if not args.skip_exhaustive:
+        issues = _check(_all_colors())
+        print("exhaustive:", "OK" if not issues else "; ".join(issues))
+        if issues:
+            return 1
+
+    if args.image:
+        from image_decode import open_image
+
+        image, _ = open_image(Path(args.image).read_bytes())
+        img = np.array(image)
+    else:
+        w, h = (int(v) for v in args.size.lower().split("x"))
+        img = np.random.default_rng(7).integers(0, 256, size=(h, w, 3), dtype=np.uint8)
+
+    issues = _check(img)
+    if issues:
+        print("frame:", "; ".join(issues))
+        return 1
+
+    report = {
+        "frame": list(img.shape[:2]),
+        "numba": bool(color_kernel._use_numba()),
+        "reference": _bench(_reference, img, args.repeat),
+        "fused": _bench(_fused, img, args.repeat),
+        "lut": _bench(_lut, img, args.repeat),
+    }
+    for k in ("fused", "lut"):
+        report[f"{k}_speedup"] = round(report["reference"]["ms"] / max(1e-9, report[k]["ms"]), 2)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
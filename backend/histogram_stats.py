@@ -0,0 +1,88 @@
+import numpy as np
+
+# Grayscale as the heuristics define it is the channel mean (R + G + B) / 3, so the
+# integer sum R + G + B (0..765) is an exact code for every gray level.
+GRAY_BINS = 3 * 255 + 1
+GRAY_DIVISOR = 3
+
+
+def gray_codes(pixels: np.ndarray) -> np.ndarray:
+    """R + G + B of uint8 (..., 3) pixels as uint16; gray == codes / 3 exactly."""
+    # Column adds are several times faster than a reduction over the short last axis.
+    codes = pixels[..., 0].astype(np.uint16)
+    codes += pixels[..., 1]
+    codes += pixels[..., 2]
+    return codes
+
+
+class Histogram:
+    """Exact statistics of values k / divisor (k = 0..nbins-1) from their counts.
+
+    Built in one np.bincount pass, after which percentiles, counts below a threshold,
+    mean and variance cost O(nbins) instead of a sort or partition of every pixel.
+    `percentile` reproduces np.percentile's default linear method bit for bit, and
+    `count_below` the elementwise `values < thr` comparison.
+    """
+
+    def __init__(self, counts: np.ndarray, divisor: float = 1):
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.divisor = divisor
+        self._cum = np.cumsum(self.counts)
+        self.n = int(self._cum[-1]) if self._cum.size else 0
+
+    @classmethod
+    def of(cls, codes: np.ndarray, nbins: int, divisor: float = 1) -> "Histogram":
+        return cls(np.bincount(codes.reshape(-1), minlength=nbins)[:nbins], divisor)
+
+    @classmethod
+    def gray(cls, pixels: np.ndarray) -> "Histogram":
+        """Histogram of the channel-mean gray of uint8 (..., 3) pixels."""
+        return cls.of(gray_codes(pixels), GRAY_BINS, GRAY_DIVISOR)
+
+    @property
+    def values(self) -> np.ndarray:
+        return np.arange(self.counts.size) / self.divisor
+
+    def _value_at(self, rank: int) -> float:
+        # Value of the rank-th smallest sample.
+        return int(np.searchsorted(self._cum, rank, side="right")) / self.divisor
+
+    def percentile(self, q: float) -> float:
+        if self.n == 0:
+            raise ValueError("percentile of an empty histogram")
+        vi = (self.n - 1) * (float(q) / 100.0)
+        if vi >= self.n - 1:
+            return self._value_at(self.n - 1)
+        lo = int(np.floor(vi))
+        a = self._value_at(lo)
+        b = self._value_at(lo + 1)
+        gamma = vi - lo
+        diff = b - a
+        # np.lerp form: interpolate from the nearer neighbour.
+        return b - diff * (1 - gamma) if gamma >= 0.5 else a + diff * gamma
+
+    def code_below(self, thr: float) -> int:
+        """Smallest code whose value is not < thr; codes below it are exactly `values < thr`."""
+        return int(np.count_nonzero(self.values < thr))
+
+    def count_below(self, thr: float) -> int:
+        k = self.code_below(thr)
+        return int(self._cum[k - 1]) if k > 0 else 0
+
+    def mean(self) -> float:
+        """Mean value; exact (equal to np.mean) whenever divisor is 1."""
+        if self.n == 0:
+            return float("nan")
+        total = int(self.counts @ np.arange(self.counts.size, dtype=np.int64))
+        return total / self.n / self.divisor if self.divisor != 1 else total / self.n
+
+    def var(self) -> float:
+        if self.n == 0:
+            return float("nan")
+        mu = self.mean()
+        return float(self.counts @ np.square(self.values - mu)) / self.n
+
+
+def channel_histograms(pixels: np.ndarray) -> list[Histogram]:
+    """One 256-bin Histogram per channel of uint8 (N, 3) pixels."""
+    return [Histogram.of(pixels[:, c], 256) for c in range(pixels.shape[-1])]
@@ -0,0 +1,99 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from histogram_stats import Histogram, channel_histograms, gray_codes
+
+_QS = (0, 1, 5, 8, 10, 25, 50, 75, 90, 95, 99.5, 100)
+
+
+def _reference(pixels: np.ndarray, q: float) -> tuple[float, int]:
+    # The defect heuristic exactly as _grade_fruit used to run it.
+    gray = np.mean(pixels, axis=1)
+    p = float(np.percentile(gray, q))
+    thr = max(35.0, p - 18.0)
+    return p, int(np.sum(gray < thr))
+
+
+def _histogram(pixels: np.ndarray, q: float) -> tuple[float, int]:
+    hist = Histogram.gray(pixels)
+    p = hist.percentile(q)
+    return p, hist.count_below(max(35.0, p - 18.0))
+
+
+def _check(pixels: np.ndarray, rng: np.random.Generator) -> list[str]:
+    gray = np.mean(pixels, axis=1)
+    hist = Histogram.gray(pixels)
+    codes = gray_codes(pixels)
+    issues = []
+    for q in _QS + tuple(float(v) for v in rng.random(4) * 100.0):
+        if hist.percentile(q) != float(np.percentile(gray, q)):
+            issues.append(f"percentile {q} differs")
+    for thr in (20.0, 35.0, float(gray[0]), float(np.percentile(gray, 10)) - 18.0, float(rng.random() * 255.0)):
+        if hist.count_below(thr) != int(np.sum(gray < thr)):
+            issues.append(f"count_below {thr} differs")
+        if not np.array_equal(codes < hist.code_below(thr), gray < thr):
+            issues.append(f"code_below {thr} differs")
+    means = [h.mean() for h in channel_histograms(pixels)]
+    if not np.array_equal(np.array(means), pixels.mean(axis=0)):
+        issues.append("channel means differ")
+    if not np.isclose(hist.var(), float(np.var(gray)), rtol=1e-9, atol=1e-9):
+        issues.append("variance differs")
+    return issues
+
+
+def _bench(fn, pixels: np.ndarray, repeat: int) -> float:
+    fn(pixels, 10)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(pixels, 10)
+    return round((time.perf_counter() - t0) / repeat * 1000.0, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time histogram statistics against np.percentile / np.mean.")
+    parser.add_argument("--image", default=None, help="Optional photo to benchmark on (default: random noise)")
+    parser.add_argument("--pixels", type=int, default=400_000, help="Region size for the random benchmark")
+    parser.add_argument("--trials", type=int, default=200, help="Random regions to check")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    for t in range(args.trials):
+        n = int(rng.integers(1, 20_000))
+        hi = 256 if t % 2 else int(rng.integers(2, 64))
+        issues = _check(rng.integers(0, hi, size=(n, 3), dtype=np.uint8), rng)
+        if issues:
+            print(f"trial {t} (n={n}):", "; ".join(issues))
+            return 1
+    print(f"random regions: OK ({args.trials})")
+
+    if args.image:
+        from image_decode import open_image
+
+        image, _ = open_image(Path(args.image).read_bytes())
+        pixels = np.array(image).reshape(-1, 3)
+    else:
+        pixels = rng.integers(0, 256, size=(args.pixels, 3), dtype=np.uint8)
+
+    issues = _check(pixels, rng)
+    if issues:
+        print("frame:", "; ".join(issues))
+        return 1
+
+    report = {
+        "pixels": int(pixels.shape[0]),
+        "reference_ms": _bench(_reference, pixels, args.repeat),
+        "histogram_ms": _bench(_histogram, pixels, args.repeat),
+    }
+    report["speedup"] = round(report["reference_ms"] / max(1e-9, report["histogram_ms"]), 2)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import io
+import os
+from pathlib import Path
+
+from PIL import Image
+
+# EXIF orientation -> transpose that brings the pixels upright (same table as ImageOps.exif_transpose).
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+_SWAPPED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an image header declares more pixels than the configured ceiling."""
+
+    def __init__(self, pixels: int, max_pixels: int):
+        super().__init__(f"Image has {pixels} pixels; the limit is {max_pixels}.")
+        self.pixels = int(pixels)
+        self.max_pixels = int(max_pixels)
+
+
+def max_image_pixels() -> int:
+    # 64 MP covers current phone sensors; 0 disables the check.
+    return int(os.environ.get("DRAGON_MAX_IMAGE_PIXELS", "64000000") or 0)
+
+
+def _orientation(image: Image.Image) -> int:
+    try:
+        return int(image.getexif().get(0x0112, 1) or 1)
+    except Exception:
+        return 1
+
+
+def open_image(
+    source: bytes | str | Path,
+    max_side: int | None = None,
+    max_pixels: int | None = None,
+) -> tuple[Image.Image, tuple[int, int]]:
+    """Decode an upload to RGB, at reduced scale when the full resolution is not needed.
+
+    Only the header is read before the pixel ceiling is enforced, so oversized or
+    decompression-bomb files are rejected without allocating their pixels. With
+    `max_side`, JPEGs decode through libjpeg DCT scaling (1/2, 1/4, 1/8) and other
+    formats through `reduce`, never going below `max_side` on the longest edge; the
+    caller does any final resize. EXIF orientation is applied after the reduction.
+
+    Returns the decoded image and the original (orientation-corrected) size.
+    """
+    fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    limit = max_image_pixels() if max_pixels is None else int(max_pixels)
+    try:
+        image = Image.open(fp)
+    except Image.DecompressionBombError as e:
+        # PIL's own guard (2x Image.MAX_IMAGE_PIXELS) fired while parsing the header.
+        raise ImageTooLarge(2 * int(Image.MAX_IMAGE_PIXELS or 0), limit) from e
+    w, h = image.size
+    if limit > 0 and w * h > limit:
+        image.close()
+        raise ImageTooLarge(w * h, limit)
+
+    orientation = _orientation(image)
+    full_size = (h, w) if orientation in _SWAPPED_ORIENTATIONS else (w, h)
+
+    side = int(max_side or 0)
+    if side > 0 and max(w, h) > side:
+        scale = float(side) / float(max(w, h))
+        if image.format == "JPEG":
+            # draft() picks the smallest DCT scale that still covers the requested size.
+            image.draft("RGB", (max(1, int(w * scale + 0.999)), max(1, int(h * scale + 0.999))))
+        else:
+            factor = int(max(w, h) // side)
+            if factor >= 2:
+                # reduce() box-averages channel values, which is meaningless for palette images.
+                if image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                image = image.reduce(factor)
+
+    image = image.convert("RGB")
+    if orientation in _ORIENTATION_TRANSPOSE:
+        image = image.transpose(_ORIENTATION_TRANSPOSE[orientation])
+    return image, full_size
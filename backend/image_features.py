@@ -0,0 +1,208 @@
+import threading
+from typing import Any, Callable
+
+import numpy as np
+
+from color_kernel import classify_colors
+from histogram_stats import GRAY_BINS, GRAY_DIVISOR, Histogram, channel_histograms, gray_codes
+
+
+class Region:
+    """Pixels of one boolean mask over an ImageFeatures frame, gathered once.
+
+    The mask may be a crop: it covers the window whose top-left corner is `offset`
+    (x, y) in the frame, and everything outside it counts as unmasked. `rgb` is the
+    row-major (N, 3) gather of the window, so the pixels of any band of rows are a
+    prefix/slice of it and per-row counts locate them.
+    """
+
+    def __init__(self, features: "ImageFeatures", mask: np.ndarray, offset: tuple[int, int] = (0, 0)):
+        self._features = features
+        self.mask = mask
+        self.offset = (int(offset[0]), int(offset[1]))
+
+    def _memo(self, name: str, build: Callable[[], Any], full_frame: bool = False) -> Any:
+        # Work over a cropped mask scales with the fruit, not the photo, and is not counted.
+        pass_name = name if full_frame and self.is_full_frame else None
+        return self._features._memo(("region", id(self.mask), self.offset, name), build, pass_name)
+
+    @property
+    def is_full_frame(self) -> bool:
+        return self.mask.shape == (self._features.height, self._features.width)
+
+    @property
+    def window(self) -> np.ndarray:
+        """The frame pixels under the mask's window (a view)."""
+        ox, oy = self.offset
+        h, w = self.mask.shape
+        return self._features.rgb[oy:oy + h, ox:ox + w]
+
+    @property
+    def row_counts(self) -> np.ndarray:
+        """Mask pixels per window row."""
+        return self._memo("row_counts", lambda: np.count_nonzero(self.mask, axis=1), full_frame=True)
+
+    @property
+    def pixels(self) -> int:
+        return self._memo("pixels", lambda: int(self.row_counts.sum()))
+
+    @property
+    def bbox(self) -> tuple[int, int, int, int] | None:
+        """Inclusive (x0, y0, x1, y1) of the mask in frame coordinates, or None when empty."""
+
+        def _build():
+            rows = np.flatnonzero(self.row_counts)
+            if rows.size == 0:
+                return None
+            y0, y1 = int(rows[0]), int(rows[-1])
+            cols = np.flatnonzero(self.mask[y0:y1 + 1].any(axis=0))
+            ox, oy = self.offset
+            return (int(cols[0]) + ox, y0 + oy, int(cols[-1]) + ox, y1 + oy)
+
+        return self._memo("bbox", _build)
+
+    @property
+    def rgb(self) -> np.ndarray:
+        return self._memo("rgb", lambda: self.window[self.mask], full_frame=True)
+
+    @property
+    def gray_codes(self) -> np.ndarray:
+        """R + G + B of the gathered pixels (gray * 3, see histogram_stats)."""
+        return self._memo("gray_codes", lambda: gray_codes(self.rgb))
+
+    @property
+    def gray_hist(self) -> Histogram:
+        return self._memo("gray_hist", lambda: Histogram.of(self.gray_codes, GRAY_BINS, GRAY_DIVISOR))
+
+    @property
+    def channel_hists(self) -> list[Histogram]:
+        return self._memo("channel_hists", lambda: channel_histograms(self.rgb))
+
+    def rows_prefix(self, last_row: int) -> np.ndarray:
+        """Gathered pixels of the frame rows up to and including `last_row`."""
+        n = int(self.row_counts[: max(0, int(last_row) - self.offset[1] + 1)].sum())
+        return self.rgb[:n]
+
+    def scatter(self, values: np.ndarray, dtype=np.bool_) -> np.ndarray:
+        """Window-sized array holding `values` at the mask pixels and zero elsewhere."""
+        out = np.zeros(self.mask.shape, dtype=dtype)
+        out[self.mask] = values
+        if self.is_full_frame:
+            self._features._count("scatter")
+        return out
+
+
+def crop_mask(mask: np.ndarray) -> tuple[np.ndarray, tuple[int, int]]:
+    """(mask cropped to its bounding box, (x, y) offset); an empty mask crops to 0x0."""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return mask[:0, :0], (0, 0)
+    cols = np.flatnonzero(mask[rows[0]:rows[-1] + 1].any(axis=0))
+    y0, y1, x0, x1 = int(rows[0]), int(rows[-1]), int(cols[0]), int(cols[-1])
+    return mask[y0:y1 + 1, x0:x1 + 1], (x0, y0)
+
+
+class ImageFeatures:
+    """Derived views of one decoded frame, built lazily and at most once per scan.
+
+    The stages of a scan run concurrently and share one instance, so every view is
+    built under its own lock and later readers get the memoized value. `passes`
+    counts the full-frame operations that were actually performed, by view name.
+    """
+
+    def __init__(self, rgb: np.ndarray):
+        self.rgb = rgb
+        self.height, self.width = rgb.shape[:2]
+        self.passes: dict[str, int] = {}
+        self._values: dict[Any, Any] = {}
+        self._locks: dict[Any, threading.Lock] = {}
+        self._regions: dict[tuple, Region] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.passes[name] = self.passes.get(name, 0) + 1
+
+    def _memo(self, key: Any, build: Callable[[], Any], pass_name: str | None = None) -> Any:
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+            value = build()
+            with self._lock:
+                self._values[key] = value
+                if pass_name:
+                    self.passes[pass_name] = self.passes.get(pass_name, 0) + 1
+            return value
+
+    @property
+    def full_frame_passes(self) -> int:
+        with self._lock:
+            return sum(self.passes.values())
+
+    @property
+    def colors(self) -> tuple[np.ndarray, dict[str, int]]:
+        """(labels, counts) from color_kernel.classify_colors."""
+        return self._memo("colors", lambda: classify_colors(self.rgb), "colors")
+
+    @property
+    def color_union(self) -> np.ndarray:
+        """Pixels matching any dragon-fruit colour class."""
+        return self._memo("color_union", lambda: self.colors[0] != 0, "color_union")
+
+    @property
+    def gray_hist(self) -> Histogram:
+        """Whole-frame histogram of the channel-mean gray the defect/insect heuristics use."""
+        return self._memo("gray_hist", lambda: Histogram.gray(self.rgb), "gray_hist")
+
+    @property
+    def channel_hists(self) -> list[Histogram]:
+        return self._memo("channel_hists", lambda: channel_histograms(self.rgb.reshape(-1, 3)), "channel_hists")
+
+    @property
+    def luma(self) -> np.ndarray:
+        """float32 Rec.601 luma, as selftrain.collector.compute_image_quality builds it."""
+
+        def _build():
+            arr = self.rgb.astype(np.float32)
+            return (0.299 * arr[..., 0] + 0.587 * arr[..., 1] + 0.114 * arr[..., 2]).astype(np.float32)
+
+        return self._memo("luma", _build, "luma")
+
+    def region(self, mask: np.ndarray, offset: tuple[int, int] = (0, 0)) -> Region:
+        """Memoized Region for a (possibly cropped) mask, by identity; the mask must not be mutated."""
+        key = (id(mask), int(offset[0]), int(offset[1]))
+        with self._lock:
+            region = self._regions.get(key)
+            if region is None or region.mask is not mask:
+                region = Region(self, mask, offset)
+                self._regions[key] = region
+            return region
+
+
+_STATS: dict[str, float] = {"scans": 0, "passes_total": 0, "passes_ewma": 0.0, "passes_max": 0}
+_BY_VIEW: dict[str, int] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def record_passes(features: ImageFeatures) -> None:
+    with features._lock:
+        passes = dict(features.passes)
+    n = sum(passes.values())
+    with _STATS_LOCK:
+        _STATS["scans"] += 1
+        _STATS["passes_total"] += n
+        _STATS["passes_ewma"] = float(n) if _STATS["scans"] == 1 else round(0.2 * n + 0.8 * _STATS["passes_ewma"], 3)
+        _STATS["passes_max"] = max(_STATS["passes_max"], n)
+        for name, count in passes.items():
+            _BY_VIEW[name] = _BY_VIEW.get(name, 0) + count
+
+
+def feature_stats() -> dict:
+    """Full-frame passes per scan (EWMA/max) and totals by view."""
+    with _STATS_LOCK:
+        return {**_STATS, "by_view": dict(sorted(_BY_VIEW.items()))}
@@ -0,0 +1,330 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, Iterable
+
+from segmented_log import SegmentedLog
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+class JsonlWriter:
+    """Group-commit appender for one JSONL log, run by its own background thread.
+
+    Callers serialize and enqueue; the writer thread takes everything queued (up to
+    `max_batch` records, waiting at most `max_delay_s` for a batch to fill) and appends
+    it with one write on a file it keeps open. Records of one log are therefore never
+    interleaved, and requests never wait on disk. `fsync` is "always" (every batch),
+    "interval" (at most every `fsync_interval_s`) or "never" (leave it to the OS).
+    `flush()` waits until everything enqueued so far is written to the file (readable by
+    other readers) and cuts the batching delay short; `close()` drains.
+
+    When a batch write fails, the lines that did not land whole are retried once after
+    `retry_delay_s`, behind a newline so a partly written line cannot swallow the first
+    retried record (readers skip blank and malformed lines). Records still unwritten
+    after the retry are counted as dropped, and `flush()` returns False when any record
+    it waited for was dropped.
+
+    With `segments`, the writer thread also seals the file into compressed segments
+    between batches, whenever the next batch starts a new time window or the file
+    reached its size cap (see SegmentedLog).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_batch: int = 256,
+        max_delay_s: float = 0.05,
+        fsync: str = "interval",
+        fsync_interval_s: float = 1.0,
+        max_queue: int = 10000,
+        segments: SegmentedLog | None = None,
+        retry_delay_s: float = 0.1,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}; got {fsync!r}")
+        self.path = path
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay_s = max(0.0, float(max_delay_s))
+        self.fsync = fsync
+        self.fsync_interval_s = max(0.0, float(fsync_interval_s))
+        self.max_queue = max(1, int(max_queue))
+        self.segments = segments
+        self.retry_delay_s = max(0.0, float(retry_delay_s))
+        self._queue: deque[tuple[float, str, str | None]] = deque()
+        self._cond = threading.Condition()
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._retries = 0
+        # Records taken off the queue (written or dropped), and that count after the last drop.
+        self._done = 0
+        self._last_drop_end = 0
+        self._closed = False
+        self._flush_waiters = 0
+        self._file = None
+        self._inode = None
+        self._last_fsync = 0.0
+        self._batches = 0
+        self._fsyncs = 0
+        self._errors = 0
+        self._blocked = 0
+        self._lag_ewma_ms = 0.0
+        self._lag_max_ms = 0.0
+        self._thread = threading.Thread(target=self._loop, name=f"jsonl-{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def append(self, record: dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        ts = record.get("timestamp") if self.segments is not None else None
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"JSONL writer for {self.path} is closed")
+            if len(self._queue) >= self.max_queue:
+                # Backpressure rather than dropping log records.
+                self._blocked += 1
+                while len(self._queue) >= self.max_queue and not self._closed:
+                    self._cond.wait()
+            self._queue.append((time.monotonic(), line, ts if isinstance(ts, str) else None))
+            self._enqueued += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout: float | None = 5.0) -> bool:
+        """Block until every record enqueued before the call has been written.
+
+        False on timeout, or when a record enqueued before the call was dropped.
+        """
+        with self._cond:
+            target = self._enqueued
+            start = self._done
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                done = self._cond.wait_for(lambda: self._done >= target or not self._thread.is_alive(), timeout)
+                return bool(done) and self._done >= target and self._last_drop_end <= start
+            finally:
+                self._flush_waiters -= 1
+
+    def close(self, timeout: float | None = 5.0) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _take_batch(self) -> list[tuple[float, str, str | None]] | None:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            # Group commit: give concurrent appenders a moment to join this batch.
+            deadline = self._queue[0][0] + self.max_delay_s
+            while len(self._queue) < self.max_batch and not self._closed and not self._flush_waiters:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            self._cond.notify_all()
+            return batch
+
+    def _open(self):
+        # Reopen when the log was removed or rotated under us.
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            inode = None
+        if self._file is None or inode != self._inode:
+            if self._file is not None:
+                self._file.close()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._inode = os.fstat(self._file.fileno()).st_ino
+        return self._file
+
+    def _seal(self, next_ts: str | None) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                self._errors += 1
+            self._file = None
+        try:
+            self.segments.seal(next_ts)
+        except Exception:
+            self._errors += 1
+
+    def _discard_file(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+
+    def _unwritten(self, offset: int | None, text: str) -> str:
+        # After a failed write of `text` at `offset`: the lines of it that did not land whole.
+        if offset is None:
+            return text
+        encoded = text.encode("utf-8")
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                landed = f.read(len(encoded))
+        except OSError:
+            return text
+        if not encoded.startswith(landed):
+            # Someone else appended in between; retry it all rather than guess.
+            return text
+        return encoded[landed.rfind(b"\n") + 1:].decode("utf-8")
+
+    def _write(self, batch: list[tuple[float, str, str | None]]) -> None:
+        segments = self.segments
+        if segments is not None and segments.due(batch[0][2]):
+            self._seal(batch[0][2])
+        pending = "".join(line for _, line, _ in batch)
+        for attempt in range(2):
+            if attempt:
+                time.sleep(self.retry_delay_s)
+                with self._cond:
+                    self._retries += 1
+                # Terminate a partly written line so it cannot swallow the first retried record.
+                pending = "\n" + pending
+            offset = None
+            try:
+                # Shared with other appenders and readers; only sealing is exclusive.
+                with segments.lock(shared=True) if segments is not None else nullcontext():
+                    f = self._open()
+                    offset = os.fstat(f.fileno()).st_size
+                    f.write(pending)
+                    f.flush()
+                    now = time.monotonic()
+                    if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval_s):
+                        os.fsync(f.fileno())
+                        self._last_fsync = now
+                        self._fsyncs += 1
+                    full = segments is not None and segments.max_bytes and f.tell() >= segments.max_bytes
+            except Exception:
+                self._errors += 1
+                self._discard_file()
+                pending = self._unwritten(offset, pending)
+                if not pending.strip():
+                    break
+                continue
+            pending = ""
+            if full:
+                self._seal(None)
+            break
+        dropped = sum(1 for line in pending.split("\n") if line.strip())
+        lag_ms = (time.monotonic() - batch[0][0]) * 1000.0
+        with self._cond:
+            self._written += len(batch) - dropped
+            if dropped:
+                self._dropped += dropped
+                self._last_drop_end = self._done + len(batch)
+            self._done += len(batch)
+            self._batches += 1
+            self._lag_ewma_ms = lag_ms if self._batches == 1 else 0.2 * lag_ms + 0.8 * self._lag_ewma_ms
+            self._lag_max_ms = max(self._lag_max_ms, lag_ms)
+            self._cond.notify_all()
+
+    def _loop(self) -> None:
+        if self.segments is not None:
+            try:
+                self.segments.recover()
+            except Exception:
+                self._errors += 1
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                break
+            self._write(batch)
+        if self._file is not None:
+            try:
+                self._file.flush()
+                if self.fsync != "never":
+                    os.fsync(self._file.fileno())
+                self._file.close()
+            except Exception:
+                self._errors += 1
+            self._file = None
+
+    def stats(self) -> dict:
+        with self._cond:
+            oldest = self._queue[0][0] if self._queue else None
+            stats = {
+                "queued": len(self._queue),
+                "oldest_queued_ms": round((time.monotonic() - oldest) * 1000.0, 3) if oldest is not None else 0.0,
+                "written": self._written,
+                "batches": self._batches,
+                "dropped": self._dropped,
+                "retries": self._retries,
+                "avg_batch": round(self._done / self._batches, 2) if self._batches else 0.0,
+                "lag_ewma_ms": round(self._lag_ewma_ms, 3),
+                "lag_max_ms": round(self._lag_max_ms, 3),
+                "fsyncs": self._fsyncs,
+                "blocked_appends": self._blocked,
+                "errors": self._errors,
+            }
+        if self.segments is not None:
+            stats["segments"] = self.segments.stats()
+        return stats
+
+
+class JsonlWriters:
+    """One JsonlWriter per log path, created on first append; all drained at exit.
+
+    Logs listed in `segmented` are rotated into compressed segments (SegmentedLog.from_env).
+    """
+
+    def __init__(self, segmented: Iterable[str] = (), **options):
+        self.options = options
+        self.segmented = {os.path.abspath(p) for p in segmented}
+        self._writers: dict[str, JsonlWriter] = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, segmented: Iterable[str] = ()) -> "JsonlWriters":
+        return cls(
+            segmented,
+            max_batch=int(os.environ.get("DRAGON_JSONL_MAX_BATCH", "256") or 256),
+            max_delay_s=float(os.environ.get("DRAGON_JSONL_MAX_DELAY_MS", "50") or 0) / 1000.0,
+            fsync=(os.environ.get("DRAGON_JSONL_FSYNC", "interval") or "interval").strip().lower(),
+            fsync_interval_s=float(os.environ.get("DRAGON_JSONL_FSYNC_INTERVAL_S", "1.0") or 0),
+            max_queue=int(os.environ.get("DRAGON_JSONL_MAX_QUEUE", "10000") or 10000),
+        )
+
+    def writer(self, path: str) -> JsonlWriter:
+        key = os.path.abspath(path)
+        with self._lock:
+            writer = self._writers.get(key)
+            if writer is None:
+                segments = SegmentedLog.from_env(path) if key in self.segmented else None
+                writer = JsonlWriter(path, segments=segments, **self.options)
+                self._writers[key] = writer
+            return writer
+
+    def append(self, path: str, record: dict[str, Any]) -> None:
+        self.writer(path).append(record)
+
+    def flush(self, path: str | None = None, timeout: float | None = 5.0) -> bool:
+        with self._lock:
+            writers = list(self._writers.values()) if path is None else [self._writers.get(os.path.abspath(path))]
+        return all(w.flush(timeout) for w in writers if w is not None)
+
+    def close(self) -> None:
+        with self._lock:
+            writers = list(self._writers.values())
+            self._writers.clear()
+        for writer in writers:
+            writer.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            writers = dict(self._writers)
+        return {os.path.basename(path): w.stats() for path, w in writers.items()}
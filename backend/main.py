@@ -1,17 +1,49 @@
-from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from PIL import Image, ImageOps
+from PIL import Image
+import asyncio
 import base64
-import io
+import copy
+import hashlib
 import json
 import os
 import random
+import threading
+import time
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import numpy as np
 
+from analysis_pool import AnalysisPool, PoolSaturated
+from calibration_sketch import CalibrationRefresher, CalibrationSketches
+from calibration_sweep import calibration_grid, load_history, sweep
+from phash_index import NearDuplicateIndex, NearDuplicateSessions, dhash
+from price_model import PriceModelTrainer
+from preview import PreviewStore, preview_mode, render_preview
+from response_stats import ResponseStats
+from result_cache import ResultCache, content_version
+from scan_store import ScanStore
+from segmented_log import log_version, read_log
+from scoring import DEFAULT_CALIBRATION, rows_from_columns, rows_from_records, score_rows, scored_row
+from scoring import (
+    PRICE_OUTPUTS,
+    manifest_records,
+    price_inputs_from_columns,
+    price_inputs_from_records,
+    price_inputs_record,
+    price_rows,
+)
+from scoring import labels as score_labels
+from color_kernel import get_color_lut, lut_in_use
+from image_decode import ImageTooLarge, open_image
+from image_features import ImageFeatures, Region, crop_mask, feature_stats, record_passes
+from jsonl_writer import JsonlWriters
+from stage_graph import StageGraph, get_stage_executor, shutdown_stage_executor, stage_stats
+
 try:
     from yolo_runtime import get_yolo_runtime, detections_to_mask, reset_yolo_runtime
 except Exception:
@@ -20,9 +52,10 @@ except Exception:
     reset_yolo_runtime = None
 
 try:
-    from selftrain.collector import compute_image_quality, save_training_sample, should_collect_sample
+    from selftrain.collector import compute_image_quality, quality_view, save_training_sample, should_collect_sample
 except Exception:
     compute_image_quality = None
+    quality_view = None
     save_training_sample = None
     should_collect_sample = None
 
@@ -69,26 +102,50 @@ def _startup_check():
     except Exception:
         print("AI: YOLO model check failed. Using heuristic fallback.")
 
-ANALYSIS_HISTORY = []
-MAX_HISTORY = 20
+
+@app.on_event("startup")
+def _warm_color_lut():
+    # Load (or build and cache) the colour-class table before the first scan needs it.
+    if not lut_in_use():
+        return
+    try:
+        get_color_lut()
+    except Exception:
+        print("AI: colour lookup table build failed; it will be retried on the first scan.")
+
+
+@app.on_event("startup")
+def _start_calibration_refresh():
+    CALIBRATION_REFRESHER.start()
+    PRICE_REFITTER.start()
+    PRICE_SYNC.start()
+
+
+@app.on_event("shutdown")
+def _shutdown_pools():
+    ANALYSIS_POOL.shutdown()
+    shutdown_stage_executor()
+
+
+@app.on_event("shutdown")
+def _shutdown_calibration_refresh():
+    CALIBRATION_REFRESHER.stop()
+    PRICE_REFITTER.stop()
+    PRICE_SYNC.stop()
+    CALIBRATION_SKETCHES.save()
+
+
+@app.on_event("shutdown")
+def _drain_jsonl_writers():
+    JSONL_WRITERS.close()
+
 LABELED_CORRECTIONS = []
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+DATA_DIR = os.environ.get("DRAGON_DATA_DIR") or os.path.join(os.path.dirname(__file__), "data")
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "ml_models")
 LABELS_JSONL_PATH = os.path.join(DATA_DIR, "labels.jsonl")
 SCANS_JSONL_PATH = os.path.join(DATA_DIR, "scans.jsonl")
 PRICE_MODEL_PATH = os.path.join(MODEL_DIR, "price_model.json")
 DEFAULT_CURRENCY = "PHP"
-# Calibrated retail reference range for PH dragon fruit (PHP/kg), refreshed for current market behavior.
-PH_RETAIL_GOOD_MIN = 135.09
-PH_RETAIL_GOOD_MAX = 243.16
-PH_RETAIL_BAD_MIN = 35.0
-PH_GRADE_PRICE_BANDS = {
-    "A": (195.0, 243.16),
-    "B": (155.0, 205.0),
-    "C": (115.0, 165.0),
-    "D": (75.0, 120.0),
-    "E": (40.0, 85.0),
-}
 TRAINING_UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "training_uploads", "images")
 # Prefer own-tuned weights for deployment defaults.
 YOLO_BEST_WEIGHTS_PATH = os.path.join(os.path.dirname(__file__), "ml_models", "yolo_best_own.pt")
@@ -97,6 +154,22 @@ YOLO_BAD_WEIGHTS_PATH = os.path.join(os.path.dirname(__file__), "ml_models", "yo
 # Active-learning queue (opt-in via env)
 SELFTRAIN_QUEUE_JSONL = os.path.join(DATA_DIR, "selftrain_queue.jsonl")
 
+# CPU-bound /detect work runs here so the event loop stays free for /health and friends.
+ANALYSIS_POOL = AnalysisPool.from_env()
+# Previews served by /scans/{id}/preview (rendered, or deferred in preview mode "lazy"),
+# kept under DATA_DIR so every worker can serve them.
+PREVIEW_STORE = PreviewStore.from_env(os.path.join(DATA_DIR, "previews"))
+RESPONSE_STATS = ResponseStats()
+# Resubmitted photos (mobile retries, proxy retries) reuse the analysis of identical bytes.
+RESULT_CACHE = ResultCache.from_env()
+# Burst frames sent to /detect one by one by the same client reuse the fruit-model boxes.
+NEAR_DUP_SESSIONS = NearDuplicateSessions.from_env()
+# Background appenders for scans/labels/uploads logs (one thread per file).
+# scans.jsonl and labels.jsonl are read back, so they rotate into compressed, indexed segments.
+JSONL_WRITERS = JsonlWriters.from_env(segmented=(SCANS_JSONL_PATH, LABELS_JSONL_PATH))
+# Every scan result, queried by /history, /batches, /reports and /admin/label (shared across workers).
+SCAN_STORE = ScanStore.from_env(os.path.join(DATA_DIR, "scans.sqlite3"))
+
 
 def _ensure_dirs():
     os.makedirs(DATA_DIR, exist_ok=True)
@@ -105,25 +178,13 @@ def _ensure_dirs():
 
 
 def _append_jsonl(path: str, payload: dict):
-    _ensure_dirs()
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    # Queued for the log's group-commit writer; use JSONL_WRITERS.flush(path) before reading it back.
+    JSONL_WRITERS.append(path, payload)
 
 
-def _read_jsonl(path: str) -> list[dict]:
-    if not os.path.exists(path):
-        return []
-    items = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                items.append(json.loads(line))
-            except Exception:
-                continue
-    return items
+def _read_jsonl(path: str, since: str | None = None, until: str | None = None) -> list[dict]:
+    # Sealed segments (only those overlapping [since, until)) and then the active file.
+    return list(read_log(path, since, until))
 
 
 def _grade_num(grade: str | None) -> float:
@@ -141,34 +202,6 @@ def _grade_num(grade: str | None) -> float:
     return 0.0
 
 
-def _grade_rank(grade: str | None) -> int:
-    order = ["A", "B", "C", "D", "E"]
-    g = (grade or "").upper()
-    try:
-        return order.index(g)
-    except Exception:
-        return len(order) - 1
-
-
-def _downgrade_grade(grade: str, steps: int = 1) -> str:
-    order = ["A", "B", "C", "D", "E"]
-    idx = _grade_rank(grade)
-    return order[min(len(order) - 1, idx + max(1, int(steps)))]
-
-
-def _upgrade_grade_floor(grade: str, floor_grade: str) -> str:
-    order = ["A", "B", "C", "D", "E"]
-    g = (grade or "E").upper()
-    f = (floor_grade or "E").upper()
-    if g not in order:
-        g = "E"
-    if f not in order:
-        f = "E"
-    if order.index(g) > order.index(f):
-        return f
-    return g
-
-
 def _grade_from_index(score: float) -> str:
     s = float(np.clip(score, 0.0, 100.0))
     if s >= 78:
@@ -182,16 +215,6 @@ def _grade_from_index(score: float) -> str:
     return "E"
 
 
-def _grade_from_index_abc(score: float) -> str:
-    # Production-facing grading band focused on market-usable categories.
-    s = float(np.clip(score, 0.0, 100.0))
-    if s >= 75:
-        return "A"
-    if s >= 55:
-        return "B"
-    return "C"
-
-
 def _grade_from_area_ratio(fruit_area_ratio: float) -> str:
     # Area-driven grade anchor from segmentation preview coverage.
     ratio = float(np.clip(float(fruit_area_ratio), 0.0, 1.0))
@@ -204,18 +227,6 @@ def _grade_from_area_ratio(fruit_area_ratio: float) -> str:
     return "A"
 
 
-def _grade_cap_by_area(grade: str, area_grade: str) -> str:
-    # Final grade cannot be better than the area-derived anchor grade.
-    order = ["A", "B", "C", "D", "E"]
-    g = (grade or "E").upper()
-    a = (area_grade or "E").upper()
-    if g not in order:
-        g = "E"
-    if a not in order:
-        a = "E"
-    return order[max(order.index(g), order.index(a))]
-
-
 def _size_num(size_category: str | None) -> float:
     s = (size_category or "").lower()
     if s == "large":
@@ -227,19 +238,6 @@ def _size_num(size_category: str | None) -> float:
     return 0.0
 
 
-def _ridge_fit(X: np.ndarray, y: np.ndarray, lam: float) -> np.ndarray:
-    n_features = X.shape[1]
-    reg = np.eye(n_features, dtype=float) * float(lam)
-    reg[0, 0] = 0.0
-    XtX = X.T @ X
-    Xty = X.T @ y
-    return np.linalg.solve(XtX + reg, Xty)
-
-
-def _ridge_predict(X: np.ndarray, coef: np.ndarray) -> np.ndarray:
-    return X @ coef
-
-
 def _load_price_model() -> dict:
     _ensure_dirs()
     if os.path.exists(PRICE_MODEL_PATH):
@@ -277,40 +275,17 @@ PRICE_MODEL = _load_price_model()
 
 
 def _load_scoring_calibration() -> dict:
-    defaults = {
-        "defect_medium_gate": 42.0,
-        "defect_high_gate": 60.0,
-        "fresh_quality_floor": 82.0,
-        "fresh_defect_cap": 35.0,
-        "grade_floor_c_quality": 70.0,
-        "grade_floor_b_quality": 80.0,
-    }
+    defaults = dict(DEFAULT_CALIBRATION)
 
     try:
-        rows = _read_jsonl(SCANS_JSONL_PATH)
-        valid = [
-            r for r in rows
-            if isinstance(r, dict)
-            and isinstance(r.get("features"), dict)
-            and isinstance(r.get("prediction"), dict)
-            and str((r.get("prediction") or {}).get("grade", "")).upper() != "N/A"
-        ]
-        if len(valid) < 12:
+        # Percentiles over graded scans, from the streaming sketches rather than a reread of scans.jsonl.
+        if CALIBRATION_SKETCHES.n < 12:
             return defaults
 
-        defect_values = [
-            float((r.get("features") or {}).get("defect_probability") or 0.0)
-            for r in valid
-        ]
-        quality_values = [
-            float((r.get("features") or {}).get("quality_score") or 0.0)
-            for r in valid
-        ]
-
-        p75_defect = float(np.percentile(defect_values, 75))
-        p90_defect = float(np.percentile(defect_values, 90))
-        p25_quality = float(np.percentile(quality_values, 25))
-        p50_quality = float(np.percentile(quality_values, 50))
+        p75_defect = CALIBRATION_SKETCHES.percentile("defect_probability", 75)
+        p90_defect = CALIBRATION_SKETCHES.percentile("defect_probability", 90)
+        p25_quality = CALIBRATION_SKETCHES.percentile("quality_score", 25)
+        p50_quality = CALIBRATION_SKETCHES.percentile("quality_score", 50)
 
         defect_medium_gate = float(np.clip(max(34.0, p75_defect + 6.0), 34.0, 48.0))
         defect_high_gate = float(np.clip(max(56.0, p90_defect + 16.0), 56.0, 72.0))
@@ -331,9 +306,22 @@ def _load_scoring_calibration() -> dict:
         return defaults
 
 
+CALIBRATION_SKETCHES = CalibrationSketches.from_env(os.path.join(DATA_DIR, "calibration_sketches.json"))
+CALIBRATION_SKETCHES.load(SCANS_JSONL_PATH)
 SCORING_CALIBRATION = _load_scoring_calibration()
 
 
+def _refresh_scoring_calibration():
+    # Merge this worker's scans into the shared sketches first, so every worker derives
+    # its gates from the same merged file rather than from the scans it happened to see.
+    global SCORING_CALIBRATION
+    CALIBRATION_SKETCHES.save()
+    SCORING_CALIBRATION = _load_scoring_calibration()
+
+
+CALIBRATION_REFRESHER = CalibrationRefresher.from_env(_refresh_scoring_calibration)
+
+
 def _price_features(features: dict) -> list[float]:
     return [
         1.0,
@@ -347,119 +335,51 @@ def _price_features(features: dict) -> list[float]:
     ]
 
 
-def _predict_price_per_kg(features: dict) -> float:
-    coef = PRICE_MODEL.get("coef") or []
-    if not isinstance(coef, list) or not coef:
-        return 0.0
-    x = np.array(_price_features(features), dtype=float)
-    c = np.array(coef, dtype=float)
-    if x.shape[0] != c.shape[0]:
-        return 0.0
-    return float(x @ c)
-
-
-def _clamp(v: float, lo: float, hi: float) -> float:
-    if v < lo:
-        return lo
-    if v > hi:
-        return hi
-    return v
-
-
-def _price_bounds_per_kg(
-    grade: str,
-    defect_level: str,
-    is_valid_fruit: bool,
-    insect_risk_level: str | None = None,
-) -> tuple[float, float]:
-    if not is_valid_fruit:
-        return (0.0, 0.0)
-
-    band = PH_GRADE_PRICE_BANDS.get((grade or "").upper(), PH_GRADE_PRICE_BANDS["C"])
-    lo, hi = float(band[0]), float(band[1])
-
-    if defect_level == "high":
-        lo, hi = lo * 0.88, hi * 0.82
-    elif defect_level == "medium":
-        lo, hi = lo * 0.95, hi * 0.92
-
-    risk = str(insect_risk_level or "low").lower()
-    if risk == "high":
-        lo, hi = lo * 0.90, hi * 0.88
-    elif risk == "medium":
-        lo, hi = lo * 0.96, hi * 0.95
+def _price_sample(label: dict) -> tuple[list[float], float] | None:
+    price = label.get("correct_price_per_kg")
+    feats = label.get("features")
+    currency = label.get("currency")
+    if price is None or feats is None:
+        return None
+    if currency and str(currency).upper() != DEFAULT_CURRENCY:
+        return None
+    return _price_features(feats), float(price)
 
-    lo = max(float(PH_RETAIL_BAD_MIN), lo)
-    hi = max(lo + 1.0, min(float(PH_RETAIL_GOOD_MAX), hi))
-    return (float(lo), float(hi))
 
+def _label_samples():
+    # Everything observed so far was enqueued first, so after the flush the log has it all.
+    JSONL_WRITERS.flush(LABELS_JSONL_PATH)
+    for label in read_log(LABELS_JSONL_PATH):
+        sample = _price_sample(label)
+        if sample is not None:
+            yield sample
 
-def _baseline_price_per_kg(
-    grade: str,
-    quality_score: float,
-    ripeness_score: float,
-    defect_probability: float,
-    defect_level: str,
-    insect_risk_level: str | None = None,
-) -> float:
-    q = float(np.clip(float(quality_score) / 100.0, 0.0, 1.0))
-    d = float(np.clip(float(defect_probability) / 100.0, 0.0, 1.0))
-    r = float(np.clip(float(ripeness_score), 0.0, 100.0))
 
-    lo, hi = _price_bounds_per_kg(grade, defect_level, True, insect_risk_level)
-    anchor = (lo + hi) / 2.0
-    ripeness_penalty = min(0.35, abs(r - 88.0) / 100.0)
-    quality_factor = 0.74 + (0.34 * q)
-    defect_factor = 1.0 - (0.28 * d)
-    ripeness_factor = 1.0 - ripeness_penalty
+def _publish_price_model(model: dict) -> None:
+    global PRICE_MODEL
+    PRICE_MODEL = model
 
-    risk = str(insect_risk_level or "low").lower()
-    insect_factor = 1.0
-    if risk == "high":
-        insect_factor = 0.84
-    elif risk == "medium":
-        insect_factor = 0.93
 
-    price = anchor * quality_factor * defect_factor * ripeness_factor * insect_factor
-    return float(_clamp(float(price), lo, hi))
+# Keeps XᵀX/Xᵀy of the labelled prices: /admin/label re-solves the 8×8 system instead of
+# rereading labels.jsonl; full refits (which also measure MAE and cross-validate lambda)
+# run in the background.
+PRICE_TRAINER = PriceModelTrainer.from_env(
+    PRICE_MODEL,
+    PRICE_MODEL_PATH,
+    os.path.join(DATA_DIR, "price_model_stats.json"),
+    publish=_publish_price_model,
+)
 
 
 def _retrain_price_model() -> dict | None:
-    rows = _read_jsonl(LABELS_JSONL_PATH)
-    train = []
-    for r in rows:
-        price = r.get("correct_price_per_kg")
-        feats = r.get("features")
-        currency = r.get("currency")
-        if price is None or feats is None:
-            continue
-        if currency and str(currency).upper() != DEFAULT_CURRENCY:
-            continue
-        train.append((feats, float(price)))
+    return PRICE_TRAINER.refit(_label_samples)
 
-    if len(train) < 5:
-        return None
 
-    X = np.array([_price_features(feats) for feats, _ in train], dtype=float)
-    y = np.array([p for _, p in train], dtype=float)
-    lam = float(PRICE_MODEL.get("lambda") or 1.0)
-    coef = _ridge_fit(X, y, lam)
-    pred = _ridge_predict(X, coef)
-    mae = float(np.mean(np.abs(pred - y)))
-
-    updated = {
-        **PRICE_MODEL,
-        "coef": [float(v) for v in coef.tolist()],
-        "n_samples": int(len(train)),
-        "metrics": {"mae": mae},
-        "trained_at": datetime.now(timezone.utc).isoformat(),
-    }
-
-    _ensure_dirs()
-    with open(PRICE_MODEL_PATH, "w", encoding="utf-8") as f:
-        json.dump(updated, f, ensure_ascii=False, indent=2)
-
-    return updated
+if not PRICE_TRAINER.load():
+    _retrain_price_model()
+PRICE_REFITTER = CalibrationRefresher(_retrain_price_model, float(os.environ.get("DRAGON_PRICE_REFIT_S", "3600") or 0))
+# With several workers, picks up models another worker trained from a label it received.
+PRICE_SYNC = CalibrationRefresher(PRICE_TRAINER.refresh, float(os.environ.get("DRAGON_PRICE_SYNC_S", "5") or 0))
 
 
 def _segmentation_mask_from_colors(masks: list[np.ndarray]) -> np.ndarray:
@@ -511,17 +431,6 @@ def _segmentation_mask_from_colors(masks: list[np.ndarray]) -> np.ndarray:
     return mask
 
 
-def _mask_bbox(mask: np.ndarray, width: int, height: int) -> tuple[int, int, int, int]:
-    ys, xs = np.where(mask)
-    if len(xs) == 0 or len(ys) == 0:
-        return (0, 0, width - 1, height - 1)
-    x0 = int(xs.min())
-    x1 = int(xs.max())
-    y0 = int(ys.min())
-    y1 = int(ys.max())
-    return (x0, y0, x1, y1)
-
-
 def _bbox_pad(b: tuple[int, int, int, int], width: int, height: int, pad_frac: float = 0.08) -> tuple[int, int, int, int]:
     x0, y0, x1, y1 = b
     bw = max(1, x1 - x0)
@@ -535,16 +444,16 @@ def _bbox_pad(b: tuple[int, int, int, int], width: int, height: int, pad_frac: f
     return (x0, y0, x1, y1)
 
 
-def _bbox_to_mask(b: tuple[int, int, int, int], width: int, height: int) -> np.ndarray:
+def _bbox_window(b: tuple[int, int, int, int], width: int, height: int) -> tuple[int, int, int, int]:
+    # Clamped (x0, y0, x1, y1) slice bounds, end-exclusive; an empty window when degenerate.
     x0, y0, x1, y1 = b
     x0 = max(0, min(int(x0), width - 1))
     x1 = max(0, min(int(x1), width - 1))
     y0 = max(0, min(int(y0), height - 1))
     y1 = max(0, min(int(y1), height - 1))
-    m = np.zeros((height, width), dtype=bool)
     if x1 > x0 and y1 > y0:
-        m[y0:y1, x0:x1] = True
-    return m
+        return (x0, y0, x1, y1)
+    return (x0, y0, x0, y0)
 
 
 def _bbox_iou(a: tuple[int, int, int, int], b: tuple[int, int, int, int]) -> float:
@@ -600,45 +509,14 @@ def _filter_disease_detections_for_fruit(
     return filtered
 
 
-def _segmentation_preview_base64(image: Image.Image, mask: np.ndarray, bbox: tuple[int, int, int, int]) -> str | None:
+def _segmentation_preview_jpeg(
+    image: Image.Image,
+    mask: np.ndarray,
+    bbox: tuple[int, int, int, int],
+    offset: tuple[int, int] = (0, 0),
+) -> bytes | None:
     try:
-        preview = image.copy().convert("RGBA")
-        arr = np.array(preview)
-        alpha = np.zeros((arr.shape[0], arr.shape[1]), dtype=np.uint8)
-        alpha[mask] = 90
-        overlay = np.zeros_like(arr)
-        overlay[..., 0] = 230
-        overlay[..., 1] = 0
-        overlay[..., 2] = 92
-        overlay[..., 3] = alpha
-        blended = Image.alpha_composite(Image.fromarray(arr), Image.fromarray(overlay))
-
-        x0, y0, x1, y1 = bbox
-        x0 = max(0, min(x0, blended.size[0] - 1))
-        x1 = max(0, min(x1, blended.size[0] - 1))
-        y0 = max(0, min(y0, blended.size[1] - 1))
-        y1 = max(0, min(y1, blended.size[1] - 1))
-
-        border = blended.load()
-        for x in range(x0, x1 + 1):
-            if 0 <= y0 < blended.size[1]:
-                border[x, y0] = (255, 255, 255, 220)
-            if 0 <= y1 < blended.size[1]:
-                border[x, y1] = (255, 255, 255, 220)
-        for y in range(y0, y1 + 1):
-            if 0 <= x0 < blended.size[0]:
-                border[x0, y] = (255, 255, 255, 220)
-            if 0 <= x1 < blended.size[0]:
-                border[x1, y] = (255, 255, 255, 220)
-
-        max_w = 720
-        if blended.size[0] > max_w:
-            ratio = max_w / blended.size[0]
-            blended = blended.resize((max_w, int(blended.size[1] * ratio)))
-
-        buf = io.BytesIO()
-        blended.convert("RGB").save(buf, format="JPEG", quality=82)
-        return base64.b64encode(buf.getvalue()).decode("ascii")
+        return render_preview(image, mask, bbox, offset=offset)
     except Exception:
         return None
 
@@ -680,24 +558,21 @@ def _recommendations(ripeness_score: float, defect_level: str, size_category: st
     return tips
 
 
-def _inspect_wings_signal(img_array: np.ndarray, seg_mask: np.ndarray) -> tuple[str, float]:
-    ys, xs = np.where(seg_mask)
-    if len(xs) == 0 or len(ys) == 0:
+def _inspect_wings_signal(region: Region) -> tuple[str, float]:
+    box = region.bbox
+    if box is None:
         return ("Unknown", 0.0)
 
-    y0 = int(ys.min())
-    y1 = int(ys.max())
+    y0 = box[1]
+    y1 = box[3]
     h = max(1, y1 - y0 + 1)
 
     # Use the top section of the segmented fruit where wing tips are commonly visible.
+    # The gathered fruit pixels are row-major, so that band is a prefix of them.
     wing_bottom = y0 + int(round(h * 0.35))
-    wing_mask = seg_mask.copy()
-    wing_mask[wing_bottom + 1 :, :] = False
-
-    if int(np.sum(wing_mask)) < 40:
-        wing_mask = seg_mask
-
-    pix = img_array[wing_mask] if int(np.sum(wing_mask)) > 0 else img_array[seg_mask]
+    pix = region.rows_prefix(wing_bottom)
+    if len(pix) < 40:
+        pix = region.rgb
     if pix.size == 0:
         return ("Unknown", 0.0)
 
@@ -719,23 +594,24 @@ def _inspect_wings_signal(img_array: np.ndarray, seg_mask: np.ndarray) -> tuple[
     return (label, round(tip_signal, 2))
 
 
-def _estimate_insect_risk(gray: np.ndarray, seg_mask: np.ndarray) -> tuple[str, int]:
-    roi = gray[seg_mask] if int(np.sum(seg_mask)) > 0 else gray.reshape(-1)
-    if roi.size == 0:
+def _estimate_insect_risk(region: Region) -> tuple[str, int]:
+    fruit_pixels = region.pixels
+    if fruit_pixels == 0:
+        # Spots are confined to the fruit mask, so an empty mask scores zero.
         return ("low", 0)
 
-    p8 = float(np.percentile(roi, 8))
+    gray_hist = region.gray_hist
+    p8 = gray_hist.percentile(8)
     thr = max(20.0, p8 - 12.0)
-    spots = (gray < thr) & seg_mask
-    spot_pixels = int(np.sum(spots))
-    fruit_pixels = max(1, int(np.sum(seg_mask)))
+    spot_pixels = gray_hist.count_below(thr)
     spot_ratio = float(spot_pixels / fruit_pixels)
 
     blob_count = 0
     try:
         import cv2
 
-        s = (spots.astype(np.uint8) * 255)
+        dark = region.gray_codes < gray_hist.code_below(thr)
+        s = region.scatter(dark.view(np.uint8) * np.uint8(255), dtype=np.uint8)
         num_labels, _, stats, _ = cv2.connectedComponentsWithStats(s, connectivity=8)
         if num_labels > 1:
             for i in range(1, num_labels):
@@ -757,116 +633,6 @@ def _estimate_insect_risk(gray: np.ndarray, seg_mask: np.ndarray) -> tuple[str,
     return ("low", score)
 
 
-def _ripeness_fit_score(ripeness_score: float) -> float:
-    # Best market quality is usually around mature-ripe, not overly underripe or overripe.
-    fit = 100.0 - (abs(float(ripeness_score) - 88.0) * 2.0)
-    return float(np.clip(fit, 0.0, 100.0))
-
-
-def _assess_disease_status(
-    defect_probability: float,
-    yolo_bad_best_conf: float,
-    yolo_bad_count: int,
-    quality_score: float,
-    ripeness_score: float,
-    insect_risk_level: str,
-    insect_risk_score: int,
-) -> tuple[str, str]:
-    defect = float(np.clip(float(defect_probability), 0.0, 100.0))
-    conf = float(np.clip(float(yolo_bad_best_conf), 0.0, 1.0))
-    q = float(np.clip(float(quality_score), 0.0, 100.0))
-    r = float(np.clip(float(ripeness_score), 0.0, 100.0))
-    i_score = int(np.clip(int(insect_risk_score), 0, 100))
-    i_level = str(insect_risk_level or "low").lower()
-    bad_count = max(0, int(yolo_bad_count))
-
-    cal = SCORING_CALIBRATION if isinstance(SCORING_CALIBRATION, dict) else {}
-    defect_medium_gate = float(cal.get("defect_medium_gate", 42.0))
-    defect_high_gate = float(cal.get("defect_high_gate", 60.0))
-
-    strong_model_evidence = bool(conf >= 0.90 or (conf >= 0.80 and bad_count >= 2))
-    moderate_model_evidence = bool(conf >= 0.72 or (conf >= 0.66 and bad_count >= 2))
-    weak_model_evidence = bool(conf >= 0.58 or bad_count >= 1)
-
-    low_light_context = q < 74.0
-    high_defect_context = defect >= defect_high_gate and low_light_context and i_score >= 72
-    medium_defect_context = defect >= defect_medium_gate and (low_light_context or i_score >= 72)
-
-    if strong_model_evidence:
-        return ("high", "High disease risk (rot/fungal)")
-
-    if moderate_model_evidence and defect >= max(30.0, defect_medium_gate - 10.0):
-        return ("medium", "Possible early disease signs")
-
-    if high_defect_context and (i_level == "high" or i_score >= 80):
-        return ("high", "High disease risk (rot/fungal)")
-
-    if medium_defect_context or (weak_model_evidence and defect >= max(36.0, defect_medium_gate)):
-        return ("medium", "Surface blemish detected")
-
-    # High defect without model support on bright/clear fruit is often surface texture or shadow.
-    if defect >= 32.0 and conf < 0.52 and q >= 80.0 and r >= 70.0 and i_score < 70:
-        return ("low", "Healthy")
-
-    return ("low", "Healthy")
-
-
-def _compute_quality_index(
-    quality_score: float,
-    ripeness_score: float,
-    defect_probability: float,
-    fruit_area_ratio: float,
-    insect_risk_score: int,
-    yolo_bad_best_conf: float,
-    best_yolo_conf: float,
-    shape_score: int,
-    size_category: str,
-    color_score: float,
-    defect_level: str,
-) -> float:
-    q = float(np.clip(float(quality_score), 0.0, 100.0))
-    ripeness_fit = _ripeness_fit_score(ripeness_score)
-    defect_component = float(np.clip(100.0 - (float(defect_probability) * 1.15), 0.0, 100.0))
-    insect_component = float(np.clip(100.0 - (float(insect_risk_score) * 0.75), 0.0, 100.0))
-    shape_component = float(np.clip((float(shape_score) / 10.0) * 100.0, 0.0, 100.0))
-    detect_component = float(np.clip(float(best_yolo_conf) * 100.0, 45.0, 100.0))
-    area_component = float(np.clip(((float(fruit_area_ratio) - 0.06) / 0.38) * 100.0, 0.0, 100.0))
-
-    quality_index = (
-        (0.30 * q)
-        + (0.19 * ripeness_fit)
-        + (0.21 * defect_component)
-        + (0.09 * insect_component)
-        + (0.07 * shape_component)
-        + (0.06 * detect_component)
-        + (0.08 * area_component)
-    )
-
-    if size_category == "Large":
-        quality_index += 1.5
-    elif size_category == "Medium":
-        quality_index += 0.8
-    else:
-        quality_index -= 0.8
-
-    if float(color_score) >= 7.0:
-        quality_index += 0.8
-    elif float(color_score) <= 2.5:
-        quality_index -= 0.8
-
-    if defect_level == "high":
-        quality_index -= 7.0
-    elif defect_level == "medium":
-        quality_index -= 2.5
-
-    if float(yolo_bad_best_conf) >= 0.86:
-        quality_index -= 5.0
-    elif float(yolo_bad_best_conf) >= 0.68:
-        quality_index -= 2.0
-
-    return float(np.clip(quality_index, 0.0, 100.0))
-
-
 def _compute_confidence_score(
     is_valid_fruit: bool,
     best_yolo_conf: float,
@@ -934,6 +700,25 @@ def health_check():
         "selftrain_enabled": os.environ.get("DRAGON_SELFTRAIN_ENABLED") == "1",
         "bootstrap_training": os.environ.get("DRAGON_MODEL_BOOTSTRAP") == "1",
         "scoring_calibration": SCORING_CALIBRATION,
+        "calibration_sketches": {**CALIBRATION_SKETCHES.stats(), "refresh": CALIBRATION_REFRESHER.stats()},
+        "price_model": {**PRICE_TRAINER.stats(), "refit": PRICE_REFITTER.stats(), "sync": PRICE_SYNC.stats()},
+        "detect_pool": ANALYSIS_POOL.stats(),
+        "preview_store": PREVIEW_STORE.stats(),
+        "responses": RESPONSE_STATS.stats(),
+        "result_cache": RESULT_CACHE.stats(),
+        "jsonl_writers": JSONL_WRITERS.stats(),
+        "scan_store": SCAN_STORE.stats(),
+        "detect_stages": stage_stats(),
+        "image_features": feature_stats(),
+        "yolo_batching": {
+            "best": rt_best.batching_stats() if rt_best and hasattr(rt_best, "batching_stats") else None,
+            "bad": rt_bad.batching_stats() if rt_bad and hasattr(rt_bad, "batching_stats") else None,
+        },
+        "yolo_near_duplicates": {
+            "enabled": NearDuplicateIndex.from_env().enabled,
+            **NearDuplicateIndex.totals(),
+            "detect_sessions": NEAR_DUP_SESSIONS.stats(),
+        },
     }
 
 
@@ -953,6 +738,13 @@ def reload_yolo(x_admin_token: str | None = Header(None, alias="X-Admin-Token"))
 async def train_upload(file: UploadFile = File(...), source: str | None = Form(None)):
     _ensure_dirs()
     contents = await file.read()
+    try:
+        # Small draft decode: validates the file and enforces the pixel ceiling cheaply.
+        open_image(contents, max_side=256)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Uploaded file is not a readable image.")
     ext = (file.filename or "").rsplit(".", 1)[-1].lower() if file.filename and "." in file.filename else "jpg"
     if ext not in ("jpg", "jpeg", "png", "webp"):
         ext = "jpg"
@@ -978,777 +770,1121 @@ def train_pending():
     return {"pending_images": count}
 
 
-@app.post("/detect")
-async def detect_quality(
-    file: UploadFile = File(...),
-    batch_id: str | None = Form(None),
-    lat: float | None = Form(None),
-    lon: float | None = Form(None),
-    require_yolo: int | None = Form(None),
-    require_dual_yolo: int | None = Form(None),
-    require_weights: str | None = Form(None),
-    require_bad_weights: str | None = Form(None),
-    source: str | None = Form(None),
-):
+def _check_yolo_requirements(
+    yolo_runtime,
+    yolo_bad_runtime,
+    source: str | None,
+    require_yolo: int | None,
+    require_dual_yolo: int | None,
+    require_weights: str | None,
+    require_bad_weights: str | None,
+) -> None:
+    is_mobile_source = (str(source or "").strip().lower() == "mobile_app")
+    strict_mobile_requirements = (
+        str(os.environ.get("DRAGON_REQUIRE_YOLO_FOR_MOBILE", "0")).strip().lower() in ("1", "true", "yes")
+    )
+    # By default, mobile scans may fall back to heuristic mode when YOLO is unavailable.
+    yolo_required = bool(require_yolo == 1 or (is_mobile_source and strict_mobile_requirements))
+    dual_yolo_required = bool(require_dual_yolo == 1 or (is_mobile_source and strict_mobile_requirements))
+    required_weights_name = str(require_weights or "yolo_best_own.pt").strip().lower()
+    required_bad_weights_name = str(require_bad_weights or "yolo_bad_own.pt").strip().lower()
+    active_weights_path = str(getattr(yolo_runtime, "weights_path", "") or "")
+    active_weights_name = os.path.basename(active_weights_path).lower() if active_weights_path else ""
+    active_bad_weights_path = str(getattr(yolo_bad_runtime, "weights_path", "") or "")
+    active_bad_weights_name = os.path.basename(active_bad_weights_path).lower() if active_bad_weights_path else ""
+    if yolo_required and not yolo_runtime:
+        raise HTTPException(
+            status_code=503,
+            detail=(
+                "YOLO model is required for mobile scanning but is not loaded. "
+                "Ensure backend/ml_models/yolo_best_own.pt exists and restart the AI service."
+            ),
+        )
+    if yolo_required and required_weights_name and active_weights_name != required_weights_name:
+        raise HTTPException(
+            status_code=503,
+            detail=(
+                f"Mobile scan requires {required_weights_name} but active model is "
+                f"{active_weights_name or 'none'}."
+            ),
+        )
+    if dual_yolo_required and not yolo_bad_runtime:
+        raise HTTPException(
+            status_code=503,
+            detail=(
+                "Mobile scan requires disease model yolo_bad.pt but it is not loaded. "
+                "Ensure backend/ml_models/yolo_bad_own.pt exists and restart the AI service."
+            ),
+        )
+    if dual_yolo_required and required_bad_weights_name and active_bad_weights_name != required_bad_weights_name:
+        raise HTTPException(
+            status_code=503,
+            detail=(
+                f"Mobile scan requires {required_bad_weights_name} but active disease model is "
+                f"{active_bad_weights_name or 'none'}."
+            ),
+        )
+
+
+def _detections_as_dicts(dets) -> list[dict]:
+    return [
+        {
+            "x0": d.x0,
+            "y0": d.y0,
+            "x1": d.x1,
+            "y1": d.y1,
+            "conf": round(float(d.conf), 4),
+            "cls": int(d.cls),
+            "name": d.name,
+        }
+        for d in dets
+    ]
+
+
+def _fruit_model_output(dets, width: int, height: int) -> tuple[list[dict], np.ndarray | None]:
+    yolo_detections = _detections_as_dicts(dets)
+    yolo_mask = None
+    if dets and callable(detections_to_mask):
+        yolo_mask = detections_to_mask(dets, width, height)
+    return yolo_detections, yolo_mask
+
+
+def _frame_hash(image: Image.Image) -> int | None:
+    # Perceptual hash for a batch's or session's near-duplicate index (burst frames of one fruit).
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        # Handle phone orientation correctly (common for mobile captures)
+        return dhash(image)
+    except Exception:
+        return None
+
+
+def _run_fruit_model(
+    runtime,
+    image: Image.Image,
+    near_dups: NearDuplicateIndex | None = None,
+) -> tuple[list[dict], np.ndarray | None]:
+    width, height = image.size
+    yolo_detections = []
+    yolo_mask = None
+    if runtime:
+        try:
+            if near_dups is not None:
+                dets = runtime.predict(image, conf=0.35, phash=_frame_hash(image), near_dups=near_dups)
+            else:
+                dets = runtime.predict(image, conf=0.35)
+            yolo_detections, yolo_mask = _fruit_model_output(dets, width, height)
+        except Exception:
+            yolo_detections = []
+            yolo_mask = None
+    return yolo_detections, yolo_mask
+
+
+def _near_dup_session(runtime, source: str | None, batch_id: str | None, device_id: str | None):
+    # Only requests that name their batch or device share an index; anonymous ones never reuse.
+    if not runtime or not (batch_id or device_id):
+        return None
+    key = (str(getattr(runtime, "weights_path", "") or ""), source or "", batch_id or "", device_id or "")
+    return NEAR_DUP_SESSIONS.get(key)
+
+
+def _run_disease_model(runtime, image: Image.Image) -> list[dict]:
+    yolo_bad_detections = []
+    if runtime:
+        try:
+            bad_dets = runtime.predict(image, conf=0.45)
+            yolo_bad_detections = _detections_as_dicts(bad_dets)
+        except Exception:
+            yolo_bad_detections = []
+    return yolo_bad_detections
+
+
+def _run_fruit_model_batch(
+    runtime,
+    images: list[Image.Image],
+    phashes: list[int | None] | None = None,
+    near_dups: NearDuplicateIndex | None = None,
+) -> list[tuple[list[dict], np.ndarray | None]]:
+    if runtime and images:
         try:
-            image = ImageOps.exif_transpose(image)
+            per_image = runtime.predict_batch(images, conf=0.35, phashes=phashes, near_dups=near_dups)
+            return [_fruit_model_output(dets, im.size[0], im.size[1]) for dets, im in zip(per_image, images)]
         except Exception:
             pass
-        image = image.convert('RGB')
-        
-        # Real Heuristic Analysis (Non-Mock)
-        # 1. Image Properties
-        width, height = image.size
-        area = width * height
-        
-        # 2. Color Analysis for Ripeness
-        # Convert to numpy array for fast processing
-        img_array = np.array(image)
-        quality_metrics = None
-        if callable(compute_image_quality):
-            try:
-                quality_metrics = compute_image_quality(img_array)
-            except Exception:
-                quality_metrics = None
+    return [([], None) for _ in images]
 
-        yolo_runtime = get_yolo_runtime("best") if callable(get_yolo_runtime) else None
-        yolo_bad_runtime = get_yolo_runtime("bad") if callable(get_yolo_runtime) else None
-        is_mobile_source = (str(source or "").strip().lower() == "mobile_app")
-        strict_mobile_requirements = (
-            str(os.environ.get("DRAGON_REQUIRE_YOLO_FOR_MOBILE", "0")).strip().lower() in ("1", "true", "yes")
-        )
-        # By default, mobile scans may fall back to heuristic mode when YOLO is unavailable.
-        yolo_required = bool(require_yolo == 1 or (is_mobile_source and strict_mobile_requirements))
-        dual_yolo_required = bool(require_dual_yolo == 1 or (is_mobile_source and strict_mobile_requirements))
-        required_weights_name = str(require_weights or "yolo_best_own.pt").strip().lower()
-        required_bad_weights_name = str(require_bad_weights or "yolo_bad_own.pt").strip().lower()
-        active_weights_path = str(getattr(yolo_runtime, "weights_path", "") or "")
-        active_weights_name = os.path.basename(active_weights_path).lower() if active_weights_path else ""
-        active_bad_weights_path = str(getattr(yolo_bad_runtime, "weights_path", "") or "")
-        active_bad_weights_name = os.path.basename(active_bad_weights_path).lower() if active_bad_weights_path else ""
-        if yolo_required and not yolo_runtime:
-            raise HTTPException(
-                status_code=503,
-                detail=(
-                    "YOLO model is required for mobile scanning but is not loaded. "
-                    "Ensure backend/ml_models/yolo_best_own.pt exists and restart the AI service."
-                ),
-            )
-        if yolo_required and required_weights_name and active_weights_name != required_weights_name:
-            raise HTTPException(
-                status_code=503,
-                detail=(
-                    f"Mobile scan requires {required_weights_name} but active model is "
-                    f"{active_weights_name or 'none'}."
-                ),
-            )
-        if dual_yolo_required and not yolo_bad_runtime:
-            raise HTTPException(
-                status_code=503,
-                detail=(
-                    "Mobile scan requires disease model yolo_bad.pt but it is not loaded. "
-                    "Ensure backend/ml_models/yolo_bad_own.pt exists and restart the AI service."
-                ),
-            )
-        if dual_yolo_required and required_bad_weights_name and active_bad_weights_name != required_bad_weights_name:
-            raise HTTPException(
-                status_code=503,
-                detail=(
-                    f"Mobile scan requires {required_bad_weights_name} but active disease model is "
-                    f"{active_bad_weights_name or 'none'}."
-                ),
-            )
 
-        yolo_detections = []
-        yolo_mask = None
-        if yolo_runtime:
-            try:
-                dets = yolo_runtime.predict(image, conf=0.35)
-                yolo_detections = [
-                    {
-                        "x0": d.x0,
-                        "y0": d.y0,
-                        "x1": d.x1,
-                        "y1": d.y1,
-                        "conf": round(float(d.conf), 4),
-                        "cls": int(d.cls),
-                        "name": d.name,
-                    }
-                    for d in dets
-                ]
-                if dets and callable(detections_to_mask):
-                    yolo_mask = detections_to_mask(dets, width, height)
-            except Exception:
-                yolo_detections = []
-                yolo_mask = None
-
-        yolo_bad_detections = []
-        yolo_bad_best_conf = 0.0
-        if yolo_bad_runtime:
-            try:
-                bad_dets = yolo_bad_runtime.predict(image, conf=0.45)
-                yolo_bad_detections = [
-                    {
-                        "x0": d.x0,
-                        "y0": d.y0,
-                        "x1": d.x1,
-                        "y1": d.y1,
-                        "conf": round(float(d.conf), 4),
-                        "cls": int(d.cls),
-                        "name": d.name,
-                    }
-                    for d in bad_dets
-                ]
-            except Exception:
-                yolo_bad_detections = []
-                yolo_bad_best_conf = 0.0
-
-        # Pick the most reliable detection as the primary fruit region (handles multi-fruit frames).
-        primary_bbox = None
-        primary_bbox_area_ratio = 0.0
-        if yolo_detections:
-            best = max(yolo_detections, key=lambda d: float(d.get("conf", 0.0)))
-            try:
-                primary_bbox = (
-                    int(best.get("x0", 0)),
-                    int(best.get("y0", 0)),
-                    int(best.get("x1", width - 1)),
-                    int(best.get("y1", height - 1)),
-                )
-                primary_bbox = _bbox_pad(primary_bbox, width, height, pad_frac=0.10)
-                bw = max(0, int(primary_bbox[2]) - int(primary_bbox[0]))
-                bh = max(0, int(primary_bbox[3]) - int(primary_bbox[1]))
-                primary_bbox_area_ratio = float((bw * bh) / max(1, width * height))
-            except Exception:
-                primary_bbox = None
-                primary_bbox_area_ratio = 0.0
-
-        # Keep only disease detections that are likely inside the detected fruit.
-        yolo_bad_detections = _filter_disease_detections_for_fruit(yolo_bad_detections, primary_bbox)
-        if yolo_bad_detections:
-            yolo_bad_best_conf = max(float(d.get("conf", 0.0)) for d in yolo_bad_detections)
-        
-        # --- DRAGON FRUIT VERIFICATION LOGIC ---
-        # Heuristic: Check if image contains significant Dragon Fruit colors (Pink, Red, Yellow, Green)
-        # R, G, B channels
-        R = img_array[:, :, 0]
-        G = img_array[:, :, 1]
-        B = img_array[:, :, 2]
-
-        # Pink/Red (Skin): Red dominant, Green low
-        mask_pink_red = (R > G * 1.2) & (R > B * 0.8) & (R > 50)
-        
-        # Yellow (Yellow Pitaya): Red + Green high, Blue low
-        mask_yellow = (R > 100) & (G > 100) & (B < 100)
-        
-        # Green (Wings/Scales): Green dominant
-        mask_green = (G > R * 1.05) & (G > B * 1.05) & (G > 40)
-        
-        # White (Flesh): High brightness, low saturation (R~G~B > 150)
-        mask_white = (R > 150) & (G > 150) & (B > 150) & (np.abs(R - G) < 30) & (np.abs(G - B) < 30)
-
-        # Count pixels
-        dragon_fruit_pixels = np.sum(mask_pink_red | mask_yellow | mask_green | mask_white)
-        total_pixels = width * height
-        relevance_ratio = dragon_fruit_pixels / total_pixels
-        pink_ratio = float(np.sum(mask_pink_red) / max(1, total_pixels))
-        green_ratio = float(np.sum(mask_green) / max(1, total_pixels))
-        
-        is_valid_fruit = True
-        warning_message = None
-        best_yolo_conf = max([float(d.get("conf", 0.0)) for d in yolo_detections], default=0.0)
-
-        # Mobile scans: use a hybrid gate (YOLO + color profile) to reduce
-        # false negatives while still rejecting unrelated images.
-        if is_mobile_source:
-            yolo_box_reasonable_size = 0.015 <= float(primary_bbox_area_ratio) <= 0.92
-            has_strong_yolo = best_yolo_conf >= 0.52 and yolo_box_reasonable_size
-            has_yolo_plus_color = (
-                best_yolo_conf >= 0.40
-                and yolo_box_reasonable_size
-                and relevance_ratio >= 0.10
-                and (pink_ratio >= 0.015 or green_ratio >= 0.012)
-            )
-            has_multi_yolo_support = (
-                len(yolo_detections) >= 2
-                and best_yolo_conf >= 0.36
-                and relevance_ratio >= 0.12
-            )
-            has_strong_color_signature = (
-                len(yolo_detections) == 0
-                and relevance_ratio >= 0.36
-                and pink_ratio >= 0.11
-                and green_ratio >= 0.018
+def _run_disease_model_batch(runtime, images: list[Image.Image]) -> list[list[dict]]:
+    # Never answered from a near-duplicate index: a lesion barely moves the frame hash, and
+    # reusing a clean frame's empty result would grade a diseased fruit Healthy.
+    if runtime and images:
+        try:
+            return [_detections_as_dicts(dets) for dets in runtime.predict_batch(images, conf=0.45)]
+        except Exception:
+            pass
+    return [[] for _ in images]
+
+
+def _color_masks(features: ImageFeatures) -> dict:
+    height, width = features.height, features.width
+    # --- DRAGON FRUIT VERIFICATION LOGIC ---
+    # Heuristic: Check if image contains significant Dragon Fruit colors (Pink, Red, Yellow, Green)
+    # One fused pass classifies every pixel (see color_kernel for the exact rules):
+    #   pink/red (skin): R > 1.2G, R > 0.8B, R > 50
+    #   yellow (yellow pitaya): R, G > 100, B < 100
+    #   green (wings/scales): G > 1.05R, G > 1.05B, G > 40
+    #   white (flesh): R, G, B > 150 with R~G~B
+    labels, counts = features.colors
+
+    # Count pixels
+    total_pixels = width * height
+    relevance_ratio = counts["any"] / total_pixels
+    pink_ratio = float(counts["pink_red"] / max(1, total_pixels))
+    green_ratio = float(counts["green"] / max(1, total_pixels))
+    return {
+        "labels": labels,
+        "counts": counts,
+        "relevance_ratio": relevance_ratio,
+        "pink_ratio": pink_ratio,
+        "green_ratio": green_ratio,
+    }
+
+
+def _segment_fruit(
+    features: ImageFeatures,
+    yolo: tuple[list[dict], np.ndarray | None],
+    colors: dict,
+    width: int,
+    height: int,
+    is_mobile_source: bool,
+) -> dict:
+    yolo_detections, yolo_mask = yolo
+    relevance_ratio = colors["relevance_ratio"]
+    pink_ratio = colors["pink_ratio"]
+    green_ratio = colors["green_ratio"]
+    total_pixels = width * height
+    fruit_type = None
+
+    # Pick the most reliable detection as the primary fruit region (handles multi-fruit frames).
+    primary_bbox = None
+    primary_bbox_area_ratio = 0.0
+    if yolo_detections:
+        best = max(yolo_detections, key=lambda d: float(d.get("conf", 0.0)))
+        try:
+            primary_bbox = (
+                int(best.get("x0", 0)),
+                int(best.get("y0", 0)),
+                int(best.get("x1", width - 1)),
+                int(best.get("y1", height - 1)),
             )
-            if not (has_strong_yolo or has_yolo_plus_color or has_multi_yolo_support or has_strong_color_signature):
-                is_valid_fruit = False
-                warning_message = "No dragon fruit detected. Align the fruit in good lighting and try again."
-                grade = "N/A"
-                fruit_type = "No dragon fruit detected"
-        # Web/other sources can still use color fallback when YOLO is not available.
-        elif (not yolo_detections) and relevance_ratio < 0.24:
-            is_valid_fruit = False
-            warning_message = "No dragon fruit detected."
-            grade = "N/A"
-            fruit_type = "No dragon fruit detected"
-        
-        color_union = mask_pink_red | mask_yellow | mask_green | mask_white
-
-        # Prefer YOLO-guided region when available; intersect with color cues to reduce background.
-        if primary_bbox is not None:
-            bbox_mask = _bbox_to_mask(primary_bbox, width, height)
-            inter = bbox_mask & color_union
-            seg_mask = inter if int(np.sum(inter)) > 0 else bbox_mask
-        elif yolo_mask is not None and yolo_mask.shape == color_union.shape:
-            inter = yolo_mask & color_union
-            seg_mask = inter if int(np.sum(inter)) > 0 else yolo_mask.astype(bool)
-        else:
-            seg_mask = _segmentation_mask_from_colors([mask_pink_red, mask_yellow, mask_green, mask_white])
-        fruit_area_pixels = int(np.sum(seg_mask))
-        fruit_area_ratio = float(fruit_area_pixels / max(1, total_pixels))
-        area_grade_anchor = _grade_from_area_ratio(fruit_area_ratio)
-        if fruit_area_pixels <= 0 or float(fruit_area_ratio) <= 0.0:
+            primary_bbox = _bbox_pad(primary_bbox, width, height, pad_frac=0.10)
+            bw = max(0, int(primary_bbox[2]) - int(primary_bbox[0]))
+            bh = max(0, int(primary_bbox[3]) - int(primary_bbox[1]))
+            primary_bbox_area_ratio = float((bw * bh) / max(1, width * height))
+        except Exception:
+            primary_bbox = None
+            primary_bbox_area_ratio = 0.0
+
+    is_valid_fruit = True
+    warning_message = None
+    best_yolo_conf = max([float(d.get("conf", 0.0)) for d in yolo_detections], default=0.0)
+
+    # Mobile scans: use a hybrid gate (YOLO + color profile) to reduce
+    # false negatives while still rejecting unrelated images.
+    if is_mobile_source:
+        yolo_box_reasonable_size = 0.015 <= float(primary_bbox_area_ratio) <= 0.92
+        has_strong_yolo = best_yolo_conf >= 0.52 and yolo_box_reasonable_size
+        has_yolo_plus_color = (
+            best_yolo_conf >= 0.40
+            and yolo_box_reasonable_size
+            and relevance_ratio >= 0.10
+            and (pink_ratio >= 0.015 or green_ratio >= 0.012)
+        )
+        has_multi_yolo_support = (
+            len(yolo_detections) >= 2
+            and best_yolo_conf >= 0.36
+            and relevance_ratio >= 0.12
+        )
+        has_strong_color_signature = (
+            len(yolo_detections) == 0
+            and relevance_ratio >= 0.36
+            and pink_ratio >= 0.11
+            and green_ratio >= 0.018
+        )
+        if not (has_strong_yolo or has_yolo_plus_color or has_multi_yolo_support or has_strong_color_signature):
             is_valid_fruit = False
-            warning_message = "No dragon fruit detected."
-            grade = "N/A"
+            warning_message = "No dragon fruit detected. Align the fruit in good lighting and try again."
             fruit_type = "No dragon fruit detected"
+    # Web/other sources can still use color fallback when YOLO is not available.
+    elif (not yolo_detections) and relevance_ratio < 0.24:
+        is_valid_fruit = False
+        warning_message = "No dragon fruit detected."
+        fruit_type = "No dragon fruit detected"
+
+    # Prefer YOLO-guided region when available; intersect with color cues to reduce background.
+    # The mask is cropped to the fruit's window (top-left at seg_offset), so everything after
+    # segmentation scales with the fruit rather than the photo.
+    if primary_bbox is not None:
+        x0, y0, x1, y1 = _bbox_window(primary_bbox, width, height)
+        inter = colors["labels"][y0:y1, x0:x1] != 0
+        seg_mask = inter if np.count_nonzero(inter) > 0 else np.ones_like(inter)
+        seg_offset = (x0, y0)
+    elif yolo_mask is not None and yolo_mask.shape == (height, width):
+        inter = yolo_mask & features.color_union
+        seg_mask, seg_offset = crop_mask(inter if np.count_nonzero(inter) > 0 else yolo_mask.astype(bool))
+    else:
+        seg_mask, seg_offset = crop_mask(_segmentation_mask_from_colors([features.color_union]))
+    region = features.region(seg_mask, seg_offset)
+    fruit_area_pixels = region.pixels
+    fruit_area_ratio = float(fruit_area_pixels / max(1, total_pixels))
+    area_grade_anchor = _grade_from_area_ratio(fruit_area_ratio)
+    if fruit_area_pixels <= 0 or float(fruit_area_ratio) <= 0.0:
+        is_valid_fruit = False
+        warning_message = "No dragon fruit detected."
+        fruit_type = "No dragon fruit detected"
+
+    bbox = region.bbox or (0, 0, width - 1, height - 1)
+    # Final disease-filter pass uses the segmented fruit bbox when YOLO primary box is weak/missing.
+    final_fruit_bbox = primary_bbox if primary_bbox is not None else _bbox_pad(bbox, width, height, pad_frac=0.08)
+    return {
+        "primary_bbox": primary_bbox,
+        "is_valid_fruit": is_valid_fruit,
+        "warning_message": warning_message,
+        "fruit_type": fruit_type,
+        "best_yolo_conf": best_yolo_conf,
+        "seg_mask": seg_mask,
+        "seg_offset": seg_offset,
+        "fruit_area_pixels": fruit_area_pixels,
+        "fruit_area_ratio": fruit_area_ratio,
+        "area_grade_anchor": area_grade_anchor,
+        "bbox": bbox,
+        "final_fruit_bbox": final_fruit_bbox,
+    }
 
-        bbox = _mask_bbox(seg_mask, width, height)
-        # Final disease-filter pass using the segmented fruit bbox when YOLO primary box is weak/missing.
-        final_fruit_bbox = primary_bbox if primary_bbox is not None else _bbox_pad(bbox, width, height, pad_frac=0.08)
-        yolo_bad_detections = _filter_disease_detections_for_fruit(yolo_bad_detections, final_fruit_bbox)
-        yolo_bad_best_conf = max([float(d.get("conf", 0.0)) for d in yolo_bad_detections], default=0.0)
-        preview_b64 = _segmentation_preview_base64(image, seg_mask, bbox)
 
-        masked = img_array[seg_mask] if fruit_area_pixels > 0 else img_array.reshape(-1, 3)
-        avg_color = masked.mean(axis=0) if masked.size else img_array.mean(axis=(0, 1))
-        r, g, b = [float(v) for v in avg_color.tolist()]
-        
-        # Ripeness Heuristic: Dragon fruit turns from Green to Pink/Red
-        # Normalized Redness Index = (R - G) / (R + G)
-        # If Green > Red, it's unripe (negative index)
-        # If Red > Green, it's ripe (positive index)
-        
-        total_intensity = r + g + b + 0.1 # Avoid div by zero
-        redness_ratio = r / total_intensity
-        greenness_ratio = g / total_intensity
-        
-        # Ripeness Score (0-100)
-        # Assume ideal ripe is mostly red/pink (High R, Mod B, Low G)
-        # Unripe is High G
-        
-        if greenness_ratio > redness_ratio:
-            # Unripe
-            ripeness_score = max(10, 50 - (greenness_ratio * 100))
-            fruit_status = "Unripe"
-        else:
-            # Ripe
-            ripeness_score = min(99, 60 + (redness_ratio * 100))
-            fruit_status = "Ripe"
-            
-        # 3. Quality Score calibrated for real-world captures (brightness + color + model confidence)
-        brightness = (r + g + b) / 3
-        saturation = max(r, g, b) - min(r, g, b)
-        quality_score = (
-            56.0
-            + ((brightness / 255.0) * 26.0)
-            + ((saturation / 255.0) * 14.0)
-            + (max(0.0, best_yolo_conf - 0.45) * 30.0)
-        )
-        quality_score = float(np.clip(quality_score, 20.0, 99.0))
+def _grade_fruit(
+    features: ImageFeatures,
+    yolo: tuple[list[dict], np.ndarray | None],
+    yolo_bad_detections: list[dict],
+    segment: dict,
+    has_disease_model: bool,
+    batch_id: str | None,
+    lat: float | None,
+    lon: float | None,
+) -> dict:
+    img_array = features.rgb
+    height, width = img_array.shape[:2]
+    yolo_detections, _ = yolo
+    primary_bbox = segment["primary_bbox"]
+    is_valid_fruit = segment["is_valid_fruit"]
+    warning_message = segment["warning_message"]
+    fruit_type = segment["fruit_type"]
+    best_yolo_conf = segment["best_yolo_conf"]
+    seg_mask = segment["seg_mask"]
+    fruit_area_pixels = segment["fruit_area_pixels"]
+    fruit_area_ratio = segment["fruit_area_ratio"]
+    area_grade_anchor = segment["area_grade_anchor"]
+    bbox = segment["bbox"]
+
+    # Keep only disease detections that are likely inside the detected fruit.
+    yolo_bad_detections = _filter_disease_detections_for_fruit(yolo_bad_detections, primary_bbox)
+    yolo_bad_detections = _filter_disease_detections_for_fruit(yolo_bad_detections, segment["final_fruit_bbox"])
+    yolo_bad_best_conf = max([float(d.get("conf", 0.0)) for d in yolo_bad_detections], default=0.0)
+
+    # Channel means, brightness and the dark-pixel stats below all come from histograms
+    # of the fruit region (the whole frame when segmentation found nothing).
+    region = features.region(seg_mask, segment["seg_offset"])
+    stats_src = region if fruit_area_pixels > 0 else features
+    r, g, b = [h.mean() for h in stats_src.channel_hists]
+    
+    # Ripeness Heuristic: Dragon fruit turns from Green to Pink/Red
+    # Normalized Redness Index = (R - G) / (R + G)
+    # If Green > Red, it's unripe (negative index)
+    # If Red > Green, it's ripe (positive index)
+    
+    total_intensity = r + g + b + 0.1 # Avoid div by zero
+    redness_ratio = r / total_intensity
+    greenness_ratio = g / total_intensity
+    
+    # Ripeness Score (0-100)
+    # Assume ideal ripe is mostly red/pink (High R, Mod B, Low G)
+    # Unripe is High G
+    
+    if greenness_ratio > redness_ratio:
+        # Unripe
+        ripeness_score = max(10, 50 - (greenness_ratio * 100))
+        fruit_status = "Unripe"
+    else:
+        # Ripe
+        ripeness_score = min(99, 60 + (redness_ratio * 100))
+        fruit_status = "Ripe"
         
-        # 4. Defect Detection (Simple Blob/Contrast)
-        # Convert to grayscale (defects should be computed on the fruit region, not background)
-        gray = np.mean(img_array, axis=2)
-        gray_roi = gray[seg_mask] if fruit_area_pixels > 0 else gray.reshape(-1)
-        if gray_roi.size:
-            p10 = float(np.percentile(gray_roi, 10))
-            # Adaptive dark threshold: robust to lighting; keep a floor to avoid over-triggering.
-            thr = max(35.0, p10 - 18.0)
-            dark_pixels = int(np.sum(gray_roi < thr))
-            defect_ratio = (dark_pixels / max(1, int(gray_roi.size))) * 100.0
-        else:
-            defect_ratio = 0.0
+    # 3. Quality Score calibrated for real-world captures (brightness + color + model confidence)
+    brightness = (r + g + b) / 3
+    saturation = max(r, g, b) - min(r, g, b)
+    quality_score = (
+        56.0
+        + ((brightness / 255.0) * 26.0)
+        + ((saturation / 255.0) * 14.0)
+        + (max(0.0, best_yolo_conf - 0.45) * 30.0)
+    )
+    quality_score = float(np.clip(quality_score, 20.0, 99.0))
+    
+    # 4. Defect Detection (Simple Blob/Contrast)
+    # Convert to grayscale (defects should be computed on the fruit region, not background)
+    gray_hist = stats_src.gray_hist
+    if gray_hist.n:
+        p10 = gray_hist.percentile(10)
+        # Adaptive dark threshold: robust to lighting; keep a floor to avoid over-triggering.
+        thr = max(35.0, p10 - 18.0)
+        dark_pixels = gray_hist.count_below(thr)
+        defect_ratio = (dark_pixels / max(1, gray_hist.n)) * 100.0
+    else:
+        defect_ratio = 0.0
+
+    defect_probability = float(min(90.0, defect_ratio * 2.4))
+    # Do not let heuristic dark-pixel logic alone force severe defects without disease-model support.
+    if yolo_bad_best_conf < 0.45:
+        defect_probability = min(defect_probability, 36.0)
+    
+    if fruit_area_ratio < 0.08:
+        size_category = "Small"
+    elif fruit_area_ratio < 0.18:
+        size_category = "Medium"
+    else:
+        size_category = "Large"
 
-        defect_probability = float(min(90.0, defect_ratio * 2.4))
-        # Do not let heuristic dark-pixel logic alone force severe defects without disease-model support.
-        if yolo_bad_best_conf < 0.45:
-            defect_probability = min(defect_probability, 36.0)
+    weight_grams = int(round(np.clip(200.0 + 1650.0 * fruit_area_ratio, 180.0, 900.0)))
         
-        if fruit_area_ratio < 0.08:
-            size_category = "Small"
-        elif fruit_area_ratio < 0.18:
-            size_category = "Medium"
+    brightness_rgb = (r + g + b) / 3.0
+    sat_rgb = (max(r, g, b) - min(r, g, b))
+
+    if is_valid_fruit:
+        if (r > 110 and g > 110 and b < 120) and abs(r - g) < 70:
+            fruit_type = "Yellow (Selenicereus megalanthus)"
+        elif brightness_rgb > 175 and sat_rgb < 55:
+            fruit_type = "White (Hylocereus undatus)"
         else:
-            size_category = "Large"
+            fruit_type = "Pink (Hylocereus undatus)"
+    
+    # Shape Analysis
+    seg_w = max(1, int(bbox[2] - bbox[0] + 1))
+    seg_h = max(1, int(bbox[3] - bbox[1] + 1))
+    aspect_ratio = max(seg_w, seg_h) / max(1, min(seg_w, seg_h))
+    bbox_area = max(1, seg_w * seg_h)
+    fill_ratio = float(fruit_area_pixels / bbox_area)
+    if aspect_ratio <= 1.35 and fill_ratio >= 0.62:
+        shape_quality = "Perfectly Oval"
+        shape_score = 10
+    elif aspect_ratio <= 1.75 and fill_ratio >= 0.45:
+        shape_quality = "Slightly Irregular"
+        shape_score = 8
+    else:
+        shape_quality = "Irregular/Deformed"
+        shape_score = 5
+
+    # Wings inspection from segmented wing-tip region.
+    wings_condition, wing_tip_signal = _inspect_wings_signal(region)
+
+    insect_risk_level, insect_risk_score = _estimate_insect_risk(region)
+    color_score = float(np.clip((redness_ratio - greenness_ratio) * 10.0 + 3.5, 0.0, 10.0))
+
+    # Disease status, grade (A best -> E worst), market lane and price come from the scoring
+    # engine, the same vectorized code /score/batch runs, on this scan's single row.
+    scoring_inputs = {
+        "is_valid_fruit": bool(is_valid_fruit),
+        "quality_score": float(quality_score),
+        "ripeness_score": float(ripeness_score),
+        "defect_probability": float(defect_probability),
+        "fruit_area_ratio": float(fruit_area_ratio),
+        "color_score": color_score,
+        "shape_score": int(shape_score),
+        "best_yolo_conf": float(best_yolo_conf),
+        "yolo_bad_best_conf": float(yolo_bad_best_conf),
+        "yolo_bad_count": int(len(yolo_bad_detections)),
+        "insect_risk_level": insect_risk_level,
+        "insect_risk_score": int(insect_risk_score),
+    }
+    rows = rows_from_records([scoring_inputs])
+    scored_columns = score_rows(rows, SCORING_CALIBRATION, PRICE_MODEL)
+    scored = scored_row(scored_columns)
+    price_inputs = price_inputs_record(rows, scored_columns)
+    grade = scored["grade"]
+    quality_score = scored["quality_score"]
+    quality_index = scored["quality_index"]
+    defect_level = scored["defect_level"]
+    disease_status = scored["disease_status"]
+    insect_risk_level = scored["insect_risk_level"]
+    insect_risk_score = scored["insect_risk_score"]
+    market_value_label = scored["market_value_label"]
+    market_value_score = scored["market_value_score"]
+    sorting_lane = scored["sorting_lane"]
+    estimated_price_per_kg = scored["estimated_price_per_kg"]
+    model_price = scored["model_price_per_kg"]
+    baseline_price = scored["baseline_price_per_kg"]
+
+    harvest = _harvest_assessment(ripeness_score, defect_level, wing_tip_signal)
+
+    # Shelf-life logic
+    if defect_level == "high" or insect_risk_level == "high" or ripeness_score >= 95:
+        shelf_life_days = 1
+        shelf_life_label = "Consume immediately"
+    elif defect_level == "medium" or insect_risk_level == "medium" or ripeness_score >= 85:
+        shelf_life_days = 3
+        shelf_life_label = "2-3 days"
+    else:
+        shelf_life_days = 5
+        shelf_life_label = "4-5 days"
+
+    features = {
+        "quality_score": float(round(quality_score, 3)),
+        "ripeness_score": float(round(ripeness_score, 3)),
+        "defect_probability": float(round(defect_probability, 3)),
+        "fruit_area_ratio": float(round(fruit_area_ratio, 6)),
+        "color_score": float(round(color_score, 4)),
+        "grade_num": scored["grade_num"],
+        "size_num": scored["size_num"],
+    }
+    confidence_score = _compute_confidence_score(
+        is_valid_fruit=is_valid_fruit,
+        best_yolo_conf=best_yolo_conf,
+        yolo_bad_best_conf=yolo_bad_best_conf,
+        quality_score=quality_score,
+        defect_level=defect_level,
+        fruit_area_ratio=fruit_area_ratio,
+    )
 
-        weight_grams = int(round(np.clip(200.0 + 1650.0 * fruit_area_ratio, 180.0, 900.0)))
-            
-        brightness_rgb = (r + g + b) / 3.0
-        sat_rgb = (max(r, g, b) - min(r, g, b))
-
-        if is_valid_fruit:
-            if (r > 110 and g > 110 and b < 120) and abs(r - g) < 70:
-                fruit_type = "Yellow (Selenicereus megalanthus)"
-            elif brightness_rgb > 175 and sat_rgb < 55:
-                fruit_type = "White (Hylocereus undatus)"
-            else:
-                fruit_type = "Pink (Hylocereus undatus)"
-        
-        # Shape Analysis
-        seg_w = max(1, int(bbox[2] - bbox[0] + 1))
-        seg_h = max(1, int(bbox[3] - bbox[1] + 1))
-        aspect_ratio = max(seg_w, seg_h) / max(1, min(seg_w, seg_h))
-        bbox_area = max(1, seg_w * seg_h)
-        fill_ratio = float(fruit_area_pixels / bbox_area)
-        if aspect_ratio <= 1.35 and fill_ratio >= 0.62:
-            shape_quality = "Perfectly Oval"
-            shape_score = 10
-        elif aspect_ratio <= 1.75 and fill_ratio >= 0.45:
-            shape_quality = "Slightly Irregular"
-            shape_score = 8
-        else:
-            shape_quality = "Irregular/Deformed"
-            shape_score = 5
-
-        # Wings inspection from segmented wing-tip region.
-        wings_condition, wing_tip_signal = _inspect_wings_signal(img_array, seg_mask)
-
-        insect_risk_level, insect_risk_score = _estimate_insect_risk(gray, seg_mask)
-        yolo_bad_count = int(len(yolo_bad_detections))
-        defect_level, disease_status = _assess_disease_status(
-            defect_probability=defect_probability,
-            yolo_bad_best_conf=yolo_bad_best_conf,
-            yolo_bad_count=yolo_bad_count,
-            quality_score=quality_score,
-            ripeness_score=ripeness_score,
-            insect_risk_level=insect_risk_level,
-            insect_risk_score=insect_risk_score,
-        )
+    recommendations = _recommendations(ripeness_score, defect_level, size_category, market_value_label)
 
-        cal = SCORING_CALIBRATION if isinstance(SCORING_CALIBRATION, dict) else {}
-        fresh_quality_floor = float(cal.get("fresh_quality_floor", 82.0))
-        fresh_defect_cap = float(cal.get("fresh_defect_cap", 35.0))
-        grade_floor_c_quality = float(cal.get("grade_floor_c_quality", 80.0))
-        grade_floor_b_quality = float(cal.get("grade_floor_b_quality", 88.0))
-
-        fresh_candidate = bool(
-            quality_score >= fresh_quality_floor
-            and ripeness_score >= 75
-            and yolo_bad_best_conf < 0.52
-            and yolo_bad_count == 0
-            and defect_probability < fresh_defect_cap
-        )
-        if fresh_candidate:
-            defect_level = "low"
-            disease_status = "Healthy"
-            if insect_risk_level == "high":
-                # Avoid false alarm labels from texture-only insect heuristics on fresh fruit.
-                insect_risk_level = "medium"
-                insect_risk_score = min(int(insect_risk_score), 55)
-            elif insect_risk_level == "medium":
-                insect_risk_score = min(int(insect_risk_score), 45)
-
-        # Keep insect risk as a separate signal; do not force disease status without disease-model evidence.
-        if insect_risk_level == "high" and yolo_bad_best_conf < 0.68 and defect_level == "low":
-            insect_risk_level = "medium"
-            insect_risk_score = min(int(insect_risk_score), 55)
-        elif (
-            insect_risk_level == "high"
-            and defect_level == "medium"
-            and yolo_bad_best_conf < 0.68
-            and disease_status != "Healthy"
-        ):
-            disease_status = "Minor spotting with possible insect stress"
-
-        # Keep confidence-facing quality high when healthy detections are strong.
-        if is_valid_fruit and defect_level == "low" and yolo_bad_best_conf < 0.45:
-            if best_yolo_conf >= 0.72 and ripeness_score >= 70:
-                quality_score = max(quality_score, 90.0)
-            elif best_yolo_conf >= 0.58 and ripeness_score >= 65:
-                quality_score = max(quality_score, 85.0)
-
-        harvest = _harvest_assessment(ripeness_score, defect_level, wing_tip_signal)
-
-        # Shelf-life logic
-        if defect_level == "high" or insect_risk_level == "high" or ripeness_score >= 95:
-            shelf_life_days = 1
-            shelf_life_label = "Consume immediately"
-        elif defect_level == "medium" or insect_risk_level == "medium" or ripeness_score >= 85:
-            shelf_life_days = 3
-            shelf_life_label = "2-3 days"
-        else:
-            shelf_life_days = 5
-            shelf_life_label = "4-5 days"
-
-        color_score = float(np.clip((redness_ratio - greenness_ratio) * 10.0 + 3.5, 0.0, 10.0))
-
-        # Grading (A best -> E worst), combining visual quality, ripeness fit, defect/insect evidence, and shape.
-        quality_index = _compute_quality_index(
-            quality_score=quality_score,
-            ripeness_score=ripeness_score,
-            defect_probability=defect_probability,
-            fruit_area_ratio=fruit_area_ratio,
-            insect_risk_score=insect_risk_score,
-            yolo_bad_best_conf=yolo_bad_best_conf,
-            best_yolo_conf=best_yolo_conf,
-            shape_score=shape_score,
-            size_category=size_category,
-            color_score=color_score,
-            defect_level=defect_level,
+    result = {
+        "id": str(uuid.uuid4()),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "batch_id": batch_id,
+        "lat": lat,
+        "lon": lon,
+        "width": width,
+        "height": height,
+        "fruit_type": fruit_type,
+        "fruit_status": fruit_status,
+        "grade": grade,
+        "is_valid_fruit": is_valid_fruit,
+        "area_grade_anchor": area_grade_anchor,
+        "warning_message": warning_message,
+        "size_category": size_category,
+        "weight_grams_est": weight_grams,
+        "ripeness_score": round(ripeness_score, 1),
+        "quality_score": round(quality_score, 1),
+        "confidence_score": round(confidence_score, 1) if is_valid_fruit else 0.0,
+        "grade_score": round(quality_index, 1) if is_valid_fruit else None,
+        "defect_probability": round(defect_probability, 1),
+        "shape_quality": shape_quality,
+        "wings_condition": wings_condition,
+        "wings_tip_signal": wing_tip_signal,
+        "harvest_stage": harvest.get("harvest_stage"),
+        "harvest_readiness_score": harvest.get("harvest_readiness_score"),
+        "harvest_recommendation": harvest.get("harvest_recommendation"),
+        "disease_status": disease_status,
+        "defect_level": defect_level,
+        "insect_risk_level": insect_risk_level,
+        "insect_risk_score": insect_risk_score,
+        "defect_regions": [], # Skipping detailed region mapping for heuristic
+        "shelf_life_days": shelf_life_days,
+        "shelf_life_label": shelf_life_label,
+        "fruit_area_ratio": round(fruit_area_ratio, 6),
+        "segmentation_bbox": {"x0": bbox[0], "y0": bbox[1], "x1": bbox[2], "y1": bbox[3]},
+        "segmentation_preview_base64": None,
+        "market_value_label": market_value_label,
+        "market_value_score": market_value_score,
+        "sorting_lane": sorting_lane,
+        "estimated_price_per_kg": round(estimated_price_per_kg, 2),
+        "model_estimated_price_per_kg": round(float(model_price), 2) if model_price else 0.0,
+        "baseline_estimated_price_per_kg": round(float(baseline_price), 2) if baseline_price else 0.0,
+        "currency": DEFAULT_CURRENCY,
+        # Unrounded pricing inputs; POST them to /price/predict to re-quote this fruit.
+        "price_inputs": price_inputs,
+        "market_assessment": {
+            "market_value_label": market_value_label,
+            "market_value_score": market_value_score,
+            "sorting_lane": sorting_lane,
+        },
+        "sorting_metrics": {
+            "shape_quality": shape_quality,
+            "size_category": size_category,
+            "color_score": round(color_score, 2),
+            "disease_status": disease_status,
+            "insect_risk_level": insect_risk_level,
+        },
+        "detections": yolo_detections,
+        "detection_backend": (
+            "yolo_dual"
+            if yolo_detections and has_disease_model
+            else ("yolo" if yolo_detections else "heuristic")
+        ),
+        "detection_summary": {
+            "count": int(len(yolo_detections)),
+            "best_conf": (max([float(d.get("conf", 0.0)) for d in yolo_detections]) if yolo_detections else 0.0),
+            "disease_count": int(len(yolo_bad_detections)),
+            "disease_best_conf": float(round(yolo_bad_best_conf, 4)),
+            "primary_bbox": (
+                {"x0": int(primary_bbox[0]), "y0": int(primary_bbox[1]), "x1": int(primary_bbox[2]), "y1": int(primary_bbox[3])}
+                if primary_bbox is not None
+                else None
+            ),
+        },
+        "disease_detections": yolo_bad_detections,
+        "image_quality": None,
+        "price_model": {
+            "type": PRICE_MODEL.get("type"),
+            "method": "linear progression (ridge regression)",
+            "n_samples": PRICE_MODEL.get("n_samples"),
+            "trained_at": PRICE_MODEL.get("trained_at"),
+            "mae": (PRICE_MODEL.get("metrics") or {}).get("mae"),
+        },
+        "recommendations": recommendations,
+        "notes": f"Grade {grade} {fruit_type}. Area {int(round(fruit_area_ratio * 100.0))}%. {wings_condition}.",
+        "color_analysis": {"r": int(round(r)), "g": int(round(g)), "b": int(round(b)), "score": round(color_score, 2)},
+        "defect_description": disease_status,
+    }
+
+    if not is_valid_fruit:
+        result.update(
+            {
+                "fruit_type": "No dragon fruit detected",
+                "fruit_status": "No result",
+                "grade": "N/A",
+                "area_grade_anchor": "N/A",
+                "size_category": "N/A",
+                "weight_grams_est": 0,
+                "ripeness_score": 0.0,
+                "quality_score": 0.0,
+                "confidence_score": 0.0,
+                "grade_score": None,
+                "defect_probability": 0.0,
+                "shape_quality": "No result",
+                "wings_condition": "No result",
+                "wings_tip_signal": 0.0,
+                "harvest_stage": "No result",
+                "harvest_readiness_score": 0,
+                "harvest_recommendation": "No recommendation",
+                "disease_status": "No dragon fruit detected",
+                "defect_level": "none",
+                "insect_risk_level": "none",
+                "insect_risk_score": 0,
+                "shelf_life_days": 0,
+                "shelf_life_label": "No result",
+                "fruit_area_ratio": 0.0,
+                "market_value_label": "No result",
+                "market_value_score": 0,
+                "sorting_lane": "No result",
+                "estimated_price_per_kg": 0.0,
+                "model_estimated_price_per_kg": 0.0,
+                "baseline_estimated_price_per_kg": 0.0,
+                "market_assessment": {
+                    "market_value_label": "No result",
+                    "market_value_score": 0,
+                    "sorting_lane": "No result",
+                },
+                "sorting_metrics": {
+                    "shape_quality": "No result",
+                    "size_category": "N/A",
+                    "color_score": 0.0,
+                    "disease_status": "No dragon fruit detected",
+                    "insect_risk_level": "none",
+                },
+                "recommendations": [],
+                "notes": "No results.",
+                "defect_description": "No dragon fruit detected",
+            }
         )
 
-        if not is_valid_fruit:
-            grade = "N/A"
-        else:
-            grade = _grade_from_index_abc(quality_index)
-            if defect_level == "high" and grade in ("A", "B"):
-                grade = _downgrade_grade(grade, 1)
-            if insect_risk_level == "high" and grade in ("A", "B"):
-                grade = _downgrade_grade(grade, 1)
-            if yolo_bad_best_conf >= 0.86 and grade in ("A", "B"):
-                grade = _downgrade_grade(grade, 1)
-            if (
-                disease_status == "Healthy"
-                and defect_level == "low"
-                and quality_score >= grade_floor_c_quality
-                and ripeness_score >= 65
-            ):
-                grade = _upgrade_grade_floor(grade, "C")
-            if fresh_candidate and defect_level == "low":
-                # Fresh fruit with low disease evidence should not land in reject-grade bands.
-                grade = _upgrade_grade_floor(grade, "B")
-            elif (
-                disease_status == "Healthy"
-                and defect_level == "low"
-                and quality_score >= grade_floor_b_quality
-                and ripeness_score >= 75
-            ):
-                grade = _upgrade_grade_floor(grade, "B")
-
-            # Area-based floor: bigger segmented fruit area should trend to better grade,
-            # while still respecting disease/defect constraints.
-            if area_grade_anchor == "A" and defect_level == "low" and insect_risk_level != "high":
-                grade = _upgrade_grade_floor(grade, "B")
-                if quality_score >= 80 and yolo_bad_best_conf < 0.62:
-                    grade = _upgrade_grade_floor(grade, "A")
-            elif area_grade_anchor == "B" and defect_level == "low" and insect_risk_level != "high":
-                grade = _upgrade_grade_floor(grade, "B")
-
-            # Keep valid fruit in A/B/C bands for operational grading.
-            grade = _upgrade_grade_floor(grade, "C")
-            # Apply strict area cap only when fruit coverage is tiny or detection is weak.
-            if area_grade_anchor == "C" and (fruit_area_ratio < 0.03 or best_yolo_conf < 0.42):
-                grade = _grade_cap_by_area(grade, "C")
-            elif area_grade_anchor == "B" and defect_level != "low":
-                grade = _grade_cap_by_area(grade, "B")
+    scan_features = features
+    if not is_valid_fruit:
+        scan_features = {
+            "quality_score": 0.0,
+            "ripeness_score": 0.0,
+            "defect_probability": 0.0,
+            "fruit_area_ratio": 0.0,
+            "color_score": 0.0,
+            "grade_num": 0.0,
+            "size_num": 0.0,
+        }
 
-        features = {
-            "quality_score": float(round(quality_score, 3)),
+    return {
+        "result": result,
+        "scan_features": scan_features,
+        "scoring_inputs": scoring_inputs,
+        "yolo_detections": yolo_detections,
+        "prediction": {
+            "is_valid_fruit": bool(is_valid_fruit),
+            "grade": grade,
             "ripeness_score": float(round(ripeness_score, 3)),
+            "quality_score": float(round(quality_score, 3)),
             "defect_probability": float(round(defect_probability, 3)),
-            "fruit_area_ratio": float(round(fruit_area_ratio, 6)),
-            "color_score": float(round(color_score, 4)),
-            "grade_num": _grade_num(grade),
-            "size_num": _size_num(size_category),
-        }
-        confidence_score = _compute_confidence_score(
-            is_valid_fruit=is_valid_fruit,
-            best_yolo_conf=best_yolo_conf,
-            yolo_bad_best_conf=yolo_bad_best_conf,
-            quality_score=quality_score,
-            defect_level=defect_level,
-            fruit_area_ratio=fruit_area_ratio,
-        )
+        },
+    }
 
-        model_price = 0.0
-        baseline_price = 0.0
-        if is_valid_fruit:
-            lo_price, hi_price = _price_bounds_per_kg(grade, defect_level, True, insect_risk_level)
-            model_price = _predict_price_per_kg(features)
-            baseline_price = _baseline_price_per_kg(
-                grade,
-                quality_score,
-                ripeness_score,
-                defect_probability,
-                defect_level,
-                insect_risk_level,
-            )
-            model_samples = int(PRICE_MODEL.get("n_samples") or 0)
-            if model_samples >= 120:
-                model_weight = 0.20
-            elif model_samples >= 40:
-                model_weight = 0.12
-            else:
-                model_weight = 0.0
 
-            if model_price > 0 and model_weight > 0:
-                model_price = float(_clamp(float(model_price), lo_price, hi_price))
-                estimated_price_per_kg = float((model_weight * model_price) + ((1.0 - model_weight) * baseline_price))
-            else:
-                estimated_price_per_kg = float(baseline_price)
+def _image_quality(features: ImageFeatures) -> dict | None:
+    if not callable(compute_image_quality):
+        return None
+    try:
+        # Blur/contrast on a fixed-size view, independent of the analysis decode scale.
+        view = quality_view(features.rgb)
+        return compute_image_quality(view, gray=features.luma if view is features.rgb else None)
+    except Exception:
+        return None
 
-            # Area premium/discount: larger segmented fruit area should produce better price.
-            area_price_factor = float(np.clip(0.82 + (float(fruit_area_ratio) * 1.10), 0.82, 1.16))
-            estimated_price_per_kg = float(estimated_price_per_kg * area_price_factor)
-            model_price = float(model_price * area_price_factor) if model_price else 0.0
-            baseline_price = float(baseline_price * area_price_factor) if baseline_price else 0.0
 
-            model_price = float(_clamp(float(model_price), lo_price, hi_price)) if model_price else 0.0
-            baseline_price = float(_clamp(float(baseline_price), lo_price, hi_price)) if baseline_price else 0.0
-            estimated_price_per_kg = float(_clamp(float(estimated_price_per_kg), lo_price, hi_price))
-        else:
-            estimated_price_per_kg = 0.0
-
-        if not is_valid_fruit:
-            market_value_label = "Rejected"
-            market_value_score = 0
-            sorting_lane = "Rejected"
-        elif grade == "A":
-            market_value_label = "Premium"
-            market_value_score = 92 if defect_level == "low" else 85
-            sorting_lane = "Export / Premium"
-        elif grade == "B":
-            market_value_label = "Standard"
-            market_value_score = 75 if defect_level != "high" else 62
-            sorting_lane = "Local Market"
-        elif grade == "C":
-            market_value_label = "Processing"
-            market_value_score = 55 if defect_level != "high" else 35
-            sorting_lane = "Processing / Reject check"
-        elif grade == "D":
-            market_value_label = "Low Value"
-            market_value_score = 32
-            sorting_lane = "Low-grade / Processing"
-        else:
-            market_value_label = "Rejected"
-            market_value_score = 0
-            sorting_lane = "Reject / Compost"
-
-        recommendations = _recommendations(ripeness_score, defect_level, size_category, market_value_label)
-
-        result = {
-            "id": str(uuid.uuid4()),
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "batch_id": batch_id,
-            "lat": lat,
-            "lon": lon,
-            "width": width,
-            "height": height,
-            "fruit_type": fruit_type,
-            "fruit_status": fruit_status,
-            "grade": grade,
-            "is_valid_fruit": is_valid_fruit,
-            "area_grade_anchor": area_grade_anchor,
-            "warning_message": warning_message,
-            "size_category": size_category,
-            "weight_grams_est": weight_grams,
-            "ripeness_score": round(ripeness_score, 1),
-            "quality_score": round(quality_score, 1),
-            "confidence_score": round(confidence_score, 1) if is_valid_fruit else 0.0,
-            "grade_score": round(quality_index, 1) if is_valid_fruit else None,
-            "defect_probability": round(defect_probability, 1),
-            "shape_quality": shape_quality,
-            "wings_condition": wings_condition,
-            "wings_tip_signal": wing_tip_signal,
-            "harvest_stage": harvest.get("harvest_stage"),
-            "harvest_readiness_score": harvest.get("harvest_readiness_score"),
-            "harvest_recommendation": harvest.get("harvest_recommendation"),
-            "disease_status": disease_status,
-            "defect_level": defect_level,
-            "insect_risk_level": insect_risk_level,
-            "insect_risk_score": insect_risk_score,
-            "defect_regions": [], # Skipping detailed region mapping for heuristic
-            "shelf_life_days": shelf_life_days,
-            "shelf_life_label": shelf_life_label,
-            "fruit_area_ratio": round(fruit_area_ratio, 6),
-            "segmentation_bbox": {"x0": bbox[0], "y0": bbox[1], "x1": bbox[2], "y1": bbox[3]},
-            "segmentation_preview_base64": preview_b64,
-            "market_value_label": market_value_label,
-            "market_value_score": market_value_score,
-            "sorting_lane": sorting_lane,
-            "estimated_price_per_kg": round(estimated_price_per_kg, 2),
-            "model_estimated_price_per_kg": round(float(model_price), 2) if model_price else 0.0,
-            "baseline_estimated_price_per_kg": round(float(baseline_price), 2) if baseline_price else 0.0,
-            "currency": DEFAULT_CURRENCY,
-            "market_assessment": {
-                "market_value_label": market_value_label,
-                "market_value_score": market_value_score,
-                "sorting_lane": sorting_lane,
-            },
-            "sorting_metrics": {
-                "shape_quality": shape_quality,
-                "size_category": size_category,
-                "color_score": round(color_score, 2),
-                "disease_status": disease_status,
-                "insect_risk_level": insect_risk_level,
-            },
-            "detections": yolo_detections,
-            "detection_backend": (
-                "yolo_dual"
-                if yolo_detections and bool(yolo_bad_runtime)
-                else ("yolo" if yolo_detections else "heuristic")
-            ),
-            "detection_summary": {
-                "count": int(len(yolo_detections)),
-                "best_conf": (max([float(d.get("conf", 0.0)) for d in yolo_detections]) if yolo_detections else 0.0),
-                "disease_count": int(len(yolo_bad_detections)),
-                "disease_best_conf": float(round(yolo_bad_best_conf, 4)),
-                "primary_bbox": (
-                    {"x0": int(primary_bbox[0]), "y0": int(primary_bbox[1]), "x1": int(primary_bbox[2]), "y1": int(primary_bbox[3])}
-                    if primary_bbox is not None
-                    else None
-                ),
-            },
-            "disease_detections": yolo_bad_detections,
-            "image_quality": quality_metrics,
-            "price_model": {
-                "type": PRICE_MODEL.get("type"),
-                "method": "linear progression (ridge regression)",
-                "n_samples": PRICE_MODEL.get("n_samples"),
-                "trained_at": PRICE_MODEL.get("trained_at"),
-                "mae": (PRICE_MODEL.get("metrics") or {}).get("mae"),
-            },
-            "recommendations": recommendations,
-            "notes": f"Grade {grade} {fruit_type}. Area {int(round(fruit_area_ratio * 100.0))}%. {wings_condition}.",
-            "color_analysis": {"r": int(round(r)), "g": int(round(g)), "b": int(round(b)), "score": round(color_score, 2)},
-            "defect_description": disease_status,
-        }
+def _analysis_max_side() -> int:
+    return int(os.environ.get("DRAGON_ANALYSIS_MAX_SIDE", "1024") or 0)
 
-        if not is_valid_fruit:
-            result.update(
-                {
-                    "fruit_type": "No dragon fruit detected",
-                    "fruit_status": "No result",
-                    "grade": "N/A",
-                    "area_grade_anchor": "N/A",
-                    "size_category": "N/A",
-                    "weight_grams_est": 0,
-                    "ripeness_score": 0.0,
-                    "quality_score": 0.0,
-                    "confidence_score": 0.0,
-                    "grade_score": None,
-                    "defect_probability": 0.0,
-                    "shape_quality": "No result",
-                    "wings_condition": "No result",
-                    "wings_tip_signal": 0.0,
-                    "harvest_stage": "No result",
-                    "harvest_readiness_score": 0,
-                    "harvest_recommendation": "No recommendation",
-                    "disease_status": "No dragon fruit detected",
-                    "defect_level": "none",
-                    "insect_risk_level": "none",
-                    "insect_risk_score": 0,
-                    "shelf_life_days": 0,
-                    "shelf_life_label": "No result",
-                    "fruit_area_ratio": 0.0,
-                    "market_value_label": "No result",
-                    "market_value_score": 0,
-                    "sorting_lane": "No result",
-                    "estimated_price_per_kg": 0.0,
-                    "model_estimated_price_per_kg": 0.0,
-                    "baseline_estimated_price_per_kg": 0.0,
-                    "market_assessment": {
-                        "market_value_label": "No result",
-                        "market_value_score": 0,
-                        "sorting_lane": "No result",
-                    },
-                    "sorting_metrics": {
-                        "shape_quality": "No result",
-                        "size_category": "N/A",
-                        "color_score": 0.0,
-                        "disease_status": "No dragon fruit detected",
-                        "insect_risk_level": "none",
-                    },
-                    "recommendations": [],
-                    "notes": "No results.",
-                    "defect_description": "No dragon fruit detected",
-                }
-            )
 
-        ANALYSIS_HISTORY.insert(0, result)
-        if len(ANALYSIS_HISTORY) > MAX_HISTORY:
-            ANALYSIS_HISTORY.pop()
+def _bounded_analysis_image(image: Image.Image, max_side: int) -> Image.Image:
+    # Heuristics only need a fruit-sized view; phone photos are 12-48 MP.
+    # Nearest-neighbour subsampling keeps per-pixel colours, so the colour-class ratios
+    # behind the validity gates stay unbiased (area filters blend edges into mixed hues).
+    w, h = image.size
+    if max_side <= 0 or max(w, h) <= max_side:
+        return image
+    ratio = float(max_side) / float(max(w, h))
+    size = (max(1, int(round(w * ratio))), max(1, int(round(h * ratio))))
+    return image.resize(size, Image.NEAREST)
 
-        scan_features = features
-        if not is_valid_fruit:
-            scan_features = {
-                "quality_score": 0.0,
-                "ripeness_score": 0.0,
-                "defect_probability": 0.0,
-                "fruit_area_ratio": 0.0,
-                "color_score": 0.0,
-                "grade_num": 0.0,
-                "size_num": 0.0,
-            }
 
-        _append_jsonl(
-            SCANS_JSONL_PATH,
-            {
-                "id": result["id"],
-                "timestamp": result["timestamp"],
-                "features": scan_features,
-                "prediction": {
-                    "grade": result["grade"],
-                    "price_per_kg": result["estimated_price_per_kg"],
-                    "currency": result["currency"],
-                    "weight_grams": result["weight_grams_est"],
-                    "size_category": result["size_category"],
-                    "market_value_label": result["market_value_label"],
-                },
-            },
+def _decode_upload(contents: bytes, max_side: int | None = None) -> tuple[Image.Image, np.ndarray, tuple[int, int]]:
+    # Returns the (possibly downscaled) analysis image, its array, and the original size.
+    # JPEGs decode at reduced DCT scale; phone orientation is applied after the reduction.
+    side = _analysis_max_side() if max_side is None else int(max_side)
+    image, full_size = open_image(contents, max_side=side)
+    image = _bounded_analysis_image(image, side)
+    return image, np.array(image), full_size
+
+
+def _remap_result_coords(result: dict, full_size: tuple[int, int]) -> None:
+    # Analysis ran on a downscaled view; report boxes in original-image pixels.
+    full_w, full_h = int(full_size[0]), int(full_size[1])
+    w, h = int(result["width"]), int(result["height"])
+    if (w, h) == (full_w, full_h):
+        return
+    sx = full_w / float(max(1, w))
+    sy = full_h / float(max(1, h))
+
+    def _edge(v: float, s: float, hi: int) -> int:
+        return int(max(0, min(hi, int(round(float(v) * s)))))
+
+    def _inclusive(b: dict) -> dict:
+        return {
+            "x0": _edge(b["x0"], sx, full_w - 1),
+            "y0": _edge(b["y0"], sy, full_h - 1),
+            "x1": _edge(int(b["x1"]) + 1, sx, full_w) - 1,
+            "y1": _edge(int(b["y1"]) + 1, sy, full_h) - 1,
+        }
+
+    for d in (result.get("detections") or []) + (result.get("disease_detections") or []):
+        d["x0"] = _edge(d["x0"], sx, full_w)
+        d["y0"] = _edge(d["y0"], sy, full_h)
+        d["x1"] = _edge(d["x1"], sx, full_w)
+        d["y1"] = _edge(d["y1"], sy, full_h)
+    if isinstance(result.get("segmentation_bbox"), dict):
+        result["segmentation_bbox"] = _inclusive(result["segmentation_bbox"])
+    summary = result.get("detection_summary") or {}
+    if isinstance(summary.get("primary_bbox"), dict):
+        summary["primary_bbox"] = _inclusive(summary["primary_bbox"])
+    result["width"] = full_w
+    result["height"] = full_h
+
+
+def _analyze_upload(
+    contents: bytes,
+    batch_id: str | None = None,
+    lat: float | None = None,
+    lon: float | None = None,
+    source: str | None = None,
+    max_side: int | None = None,
+    preview: str = "inline",
+    near_dups: NearDuplicateIndex | None = None,
+) -> dict:
+    # Pure CPU-bound analysis: runs on the analysis pool and has no side effects
+    # (beyond remembering the frame in the client's near-duplicate index).
+    image, img_array, full_size = _decode_upload(contents, max_side=max_side)
+    return _analyze_decoded(
+        image,
+        img_array,
+        full_size=full_size,
+        batch_id=batch_id,
+        lat=lat,
+        lon=lon,
+        source=source,
+        preview=preview,
+        near_dups=near_dups,
+    )
+
+
+def _analyze_decoded(
+    image: Image.Image,
+    img_array: np.ndarray,
+    full_size: tuple[int, int] | None = None,
+    batch_id: str | None = None,
+    lat: float | None = None,
+    lon: float | None = None,
+    source: str | None = None,
+    yolo: tuple[list[dict], np.ndarray | None] | None = None,
+    yolo_bad: list[dict] | None = None,
+    preview: str = "inline",
+    near_dups: NearDuplicateIndex | None = None,
+) -> dict:
+    # `yolo` / `yolo_bad` may be supplied by a batched inference pass; those stages are then skipped.
+    # `near_dups` lets the fruit model reuse the boxes of a near-identical recent frame.
+    # `preview` is a preview_mode(): rendered JPEGs and lazy render inputs are handed to _record_scan.
+    width, height = image.size
+    yolo_runtime = get_yolo_runtime("best") if callable(get_yolo_runtime) else None
+    yolo_bad_runtime = get_yolo_runtime("bad") if callable(get_yolo_runtime) else None
+    is_mobile_source = (str(source or "").strip().lower() == "mobile_app")
+
+    # Independent stages (both models, colour masks, image quality) run side by side; the
+    # preview encode overlaps with grading and pricing. Derived arrays (grayscale, colour
+    # labels, fruit-region gathers) live on one ImageFeatures and are built once per scan.
+    features = ImageFeatures(img_array)
+    graph = (
+        StageGraph()
+        .add("quality", lambda features: _image_quality(features), deps=("features",))
+        .add("yolo", lambda image: _run_fruit_model(yolo_runtime, image, near_dups), deps=("image",))
+        .add("yolo_bad", lambda image: _run_disease_model(yolo_bad_runtime, image), deps=("image",))
+        .add("colors", lambda features: _color_masks(features), deps=("features",))
+        .add(
+            "segment",
+            lambda features, yolo, colors: _segment_fruit(features, yolo, colors, width, height, is_mobile_source),
+            deps=("features", "yolo", "colors"),
+        )
+        .add(
+            "grade",
+            lambda features, yolo, yolo_bad, segment: _grade_fruit(
+                features,
+                yolo,
+                yolo_bad,
+                segment,
+                has_disease_model=bool(yolo_bad_runtime),
+                batch_id=batch_id,
+                lat=lat,
+                lon=lon,
+            ),
+            deps=("features", "yolo", "yolo_bad", "segment"),
+        )
+    )
+    if preview in ("inline", "url", "multipart"):
+        graph.add(
+            "preview",
+            lambda image, segment: _segmentation_preview_jpeg(
+                image, segment["seg_mask"], segment["bbox"], segment["seg_offset"]
+            ),
+            deps=("image", "segment"),
         )
+    inputs = {"image": image, "features": features}
+    if yolo is not None:
+        inputs["yolo"] = yolo
+    if yolo_bad is not None:
+        inputs["yolo_bad"] = yolo_bad
+    stages = graph.run(get_stage_executor(), inputs)
+    record_passes(features)
+
+    graded = stages["grade"]
+    result = graded["result"]
+    jpeg = stages.get("preview")
+    result["segmentation_preview_base64"] = base64.b64encode(jpeg).decode("ascii") if jpeg and preview == "inline" else None
+    result["image_quality"] = stages["quality"]
+    if full_size is not None:
+        _remap_result_coords(result, full_size)
+    analysis = {
+        **graded,
+        "relevance_ratio": float(stages["colors"]["relevance_ratio"]),
+        "quality_metrics": stages["quality"],
+    }
+    if preview in ("url", "multipart") and jpeg:
+        analysis["preview_jpeg"] = jpeg
+    elif preview == "lazy":
+        segment = stages["segment"]
+        analysis["preview_source"] = (image, segment["seg_mask"], segment["bbox"], segment["seg_offset"])
+    return analysis
+
+
+def _analyze_batch(
+    uploads: list[tuple[str | None, bytes]],
+    emit,
+    batch_id: str | None = None,
+    lat: float | None = None,
+    lon: float | None = None,
+    source: str | None = None,
+    preview: str = "inline",
+) -> None:
+    # Runs on the analysis pool: decode a chunk, push it through both models as one batch,
+    # then grade each image with the same stages as /detect and emit(index, item) as it lands.
+    chunk_size = max(1, int(os.environ.get("DRAGON_BATCH_YOLO_SIZE", "8") or 8))
+    yolo_runtime = get_yolo_runtime("best") if callable(get_yolo_runtime) else None
+    yolo_bad_runtime = get_yolo_runtime("bad") if callable(get_yolo_runtime) else None
+    # Burst frames are only matched within this batch (and only for the fruit model).
+    near_dups = NearDuplicateIndex.from_env() if yolo_runtime else None
+    if near_dups is not None and not near_dups.enabled:
+        near_dups = None
+
+    for start in range(0, len(uploads), chunk_size):
+        decoded = []
+        for index in range(start, min(start + chunk_size, len(uploads))):
+            try:
+                decoded.append((index, *_decode_upload(uploads[index][1])))
+            except Exception as e:
+                emit(index, {"error": str(e)})
+        if not decoded:
+            continue
 
-        # --- Self-training collection (opt-in) ---
-        # Collect hard/uncertain samples for later labeling/pseudo-labeling.
-        if os.environ.get("DRAGON_SELFTRAIN_ENABLED", "0") == "1" and callable(should_collect_sample) and callable(save_training_sample):
+        images = [image for _, image, _, _ in decoded]
+        phashes = [_frame_hash(im) for im in images] if near_dups is not None else None
+        fruit = _run_fruit_model_batch(yolo_runtime, images, phashes, near_dups)
+        disease = _run_disease_model_batch(yolo_bad_runtime, images)
+        for (index, image, img_array, full_size), yolo, yolo_bad in zip(decoded, fruit, disease):
             try:
-                collect, reasons = should_collect_sample(
-                    yolo_detections=yolo_detections,
-                    relevance_ratio=float(relevance_ratio),
-                    quality=quality_metrics,
-                    min_relevance=float(os.environ.get("DRAGON_SELFTRAIN_MIN_RELEVANCE", "0.08")),
-                    conf_low=float(os.environ.get("DRAGON_SELFTRAIN_CONF_LOW", "0.35")),
-                    conf_high=float(os.environ.get("DRAGON_SELFTRAIN_CONF_HIGH", "0.60")),
-                    min_blur=float(os.environ.get("DRAGON_SELFTRAIN_MIN_BLUR", "25.0")),
+                analysis = _analyze_decoded(
+                    image,
+                    img_array,
+                    full_size=full_size,
+                    batch_id=batch_id,
+                    lat=lat,
+                    lon=lon,
+                    source=source,
+                    yolo=yolo,
+                    yolo_bad=yolo_bad,
+                    preview=preview,
                 )
-                if collect:
-                    fn = file.filename or "upload.jpg"
-                    ext = fn.rsplit(".", 1)[-1].lower() if "." in fn else "jpg"
-                    save_training_sample(
-                        image_bytes=contents,
-                        ext=ext,
-                        out_root=Path(TRAINING_UPLOAD_DIR),
-                        queue_jsonl=Path(SELFTRAIN_QUEUE_JSONL),
-                        metadata={
-                            "source": "api_detect",
-                            "reasons": reasons,
-                            "batch_id": batch_id,
-                            "lat": lat,
-                            "lon": lon,
-                            "relevance_ratio": float(round(float(relevance_ratio), 6)),
-                            "image_quality": quality_metrics,
-                            "prediction": {
-                                "is_valid_fruit": bool(is_valid_fruit),
-                                "grade": grade,
-                                "ripeness_score": float(round(ripeness_score, 3)),
-                                "quality_score": float(round(quality_score, 3)),
-                                "defect_probability": float(round(defect_probability, 3)),
-                            },
-                            "yolo": {
-                                "detections": yolo_detections,
-                                "weights": os.environ.get("DRAGON_YOLO_WEIGHTS"),
-                            },
+                emit(index, {"analysis": analysis})
+            except Exception as e:
+                emit(index, {"error": str(e)})
+
+
+def _record_scan(
+    analysis: dict,
+    contents: bytes,
+    filename: str | None,
+    batch_id: str | None = None,
+    lat: float | None = None,
+    lon: float | None = None,
+) -> None:
+    result = analysis["result"]
+    scan_features = analysis["scan_features"]
+    relevance_ratio = analysis["relevance_ratio"]
+    quality_metrics = analysis["quality_metrics"]
+    yolo_detections = analysis["yolo_detections"]
+
+    stored = False
+    if analysis.get("preview_jpeg"):
+        stored = PREVIEW_STORE.put_jpeg(result["id"], analysis["preview_jpeg"])
+    elif analysis.get("preview_source") is not None:
+        stored = PREVIEW_STORE.put_source(result["id"], *analysis["preview_source"])
+    if stored:
+        result["segmentation_preview_url"] = f"/scans/{result['id']}/preview"
+
+    SCAN_STORE.put(result)
+
+    _append_jsonl(
+        SCANS_JSONL_PATH,
+        {
+            "id": result["id"],
+            "timestamp": result["timestamp"],
+            "features": scan_features,
+            # Everything the scoring engine needs to re-grade this scan (e.g. under new calibration).
+            "scoring_inputs": analysis.get("scoring_inputs"),
+            "price_inputs": result.get("price_inputs"),
+            "prediction": {
+                "grade": result["grade"],
+                "price_per_kg": result["estimated_price_per_kg"],
+                "currency": result["currency"],
+                "weight_grams": result["weight_grams_est"],
+                "size_category": result["size_category"],
+                "market_value_label": result["market_value_label"],
+            },
+        },
+    )
+    if str(result["grade"]).upper() != "N/A" and isinstance(scan_features, dict):
+        CALIBRATION_SKETCHES.observe(scan_features)
+
+    # --- Self-training collection (opt-in) ---
+    # Collect hard/uncertain samples for later labeling/pseudo-labeling.
+    if os.environ.get("DRAGON_SELFTRAIN_ENABLED", "0") == "1" and callable(should_collect_sample) and callable(save_training_sample):
+        try:
+            collect, reasons = should_collect_sample(
+                yolo_detections=yolo_detections,
+                relevance_ratio=float(relevance_ratio),
+                quality=quality_metrics,
+                min_relevance=float(os.environ.get("DRAGON_SELFTRAIN_MIN_RELEVANCE", "0.08")),
+                conf_low=float(os.environ.get("DRAGON_SELFTRAIN_CONF_LOW", "0.35")),
+                conf_high=float(os.environ.get("DRAGON_SELFTRAIN_CONF_HIGH", "0.60")),
+                min_blur=float(os.environ.get("DRAGON_SELFTRAIN_MIN_BLUR", "300.0")),
+            )
+            if collect:
+                fn = filename or "upload.jpg"
+                ext = fn.rsplit(".", 1)[-1].lower() if "." in fn else "jpg"
+                save_training_sample(
+                    image_bytes=contents,
+                    ext=ext,
+                    out_root=Path(TRAINING_UPLOAD_DIR),
+                    queue_jsonl=Path(SELFTRAIN_QUEUE_JSONL),
+                    append_jsonl=lambda path, record: _append_jsonl(str(path), record),
+                    metadata={
+                        "source": "api_detect",
+                        "reasons": reasons,
+                        "batch_id": batch_id,
+                        "lat": lat,
+                        "lon": lon,
+                        "relevance_ratio": float(round(float(relevance_ratio), 6)),
+                        "image_quality": quality_metrics,
+                        "prediction": analysis["prediction"],
+                        "yolo": {
+                            "detections": yolo_detections,
+                            "weights": os.environ.get("DRAGON_YOLO_WEIGHTS"),
                         },
-                    )
-            except Exception:
-                pass
+                    },
+                )
+        except Exception:
+            pass
 
-        return result
+
+def _result_cache_key(contents: bytes, yolo_runtime, yolo_bad_runtime, source: str | None, preview: str) -> str:
+    # Everything the analysis output depends on besides the bytes: models, calibration,
+    # price model, the source-specific validity gate, preview mode and analysis resolution.
+    parts = [
+        hashlib.sha256(contents).hexdigest(),
+        str(getattr(yolo_runtime, "weights_path", "") or ""),
+        str(getattr(yolo_bad_runtime, "weights_path", "") or ""),
+        content_version(SCORING_CALIBRATION),
+        content_version(PRICE_MODEL),
+        str(source or "").strip().lower(),
+        preview,
+        str(_analysis_max_side()),
+    ]
+    return "|".join(parts)
+
+
+def _analysis_nbytes(analysis: dict) -> int:
+    # Approximate footprint of a cached analysis: its JSON plus any preview payload.
+    n = len(json.dumps(jsonable_encoder({k: v for k, v in analysis.items() if k not in ("preview_jpeg", "preview_source")})))
+    n += len(analysis.get("preview_jpeg") or b"")
+    source = analysis.get("preview_source")
+    if source is not None:
+        w, h = source[0].size
+        n += w * h * 3 + int(source[1].size) // 8
+    return n
+
+
+def _reissue_analysis(
+    analysis: dict,
+    fresh: bool,
+    batch_id: str | None,
+    lat: float | None,
+    lon: float | None,
+) -> dict:
+    # Cached analyses stay pristine; every response gets its own result dict, and reused ones
+    # get a new scan identity and this request's batch/location.
+    result = copy.deepcopy(analysis["result"])
+    if fresh:
+        result["id"] = str(uuid.uuid4())
+        result["timestamp"] = datetime.now(timezone.utc).isoformat()
+        result["batch_id"] = batch_id
+        result["lat"] = lat
+        result["lon"] = lon
+    return {**analysis, "result": result}
+
+
+def _detect_response(analysis: dict, preview: str) -> Response:
+    # Serialised here (same encoding as FastAPI's JSONResponse) so size and time can be tracked.
+    t0 = time.perf_counter()
+    body = json.dumps(
+        jsonable_encoder(analysis["result"]),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    jpeg = analysis.get("preview_jpeg") if preview == "multipart" else None
+    if jpeg:
+        boundary = uuid.uuid4().hex
+        scan_id = analysis["result"]["id"]
+        body = b"".join(
+            [
+                f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode("ascii"),
+                body,
+                (
+                    f"\r\n--{boundary}\r\nContent-Type: image/jpeg\r\n"
+                    f'Content-Disposition: inline; filename="{scan_id}.jpg"\r\n\r\n'
+                ).encode("ascii"),
+                jpeg,
+                f"\r\n--{boundary}--\r\n".encode("ascii"),
+            ]
+        )
+        media_type = f"multipart/mixed; boundary={boundary}"
+    else:
+        media_type = "application/json"
+    RESPONSE_STATS.record(f"detect:{preview}", len(body), time.perf_counter() - t0)
+    return Response(content=body, media_type=media_type)
+
+
+@app.post("/detect")
+async def detect_quality(
+    file: UploadFile = File(...),
+    batch_id: str | None = Form(None),
+    lat: float | None = Form(None),
+    lon: float | None = Form(None),
+    require_yolo: int | None = Form(None),
+    require_dual_yolo: int | None = Form(None),
+    require_weights: str | None = Form(None),
+    require_bad_weights: str | None = Form(None),
+    source: str | None = Form(None),
+    preview: str | None = Form(None),
+    x_device_id: str | None = Header(None, alias="X-Device-Id"),
+):
+    try:
+        yolo_runtime = get_yolo_runtime("best") if callable(get_yolo_runtime) else None
+        yolo_bad_runtime = get_yolo_runtime("bad") if callable(get_yolo_runtime) else None
+        _check_yolo_requirements(
+            yolo_runtime,
+            yolo_bad_runtime,
+            source=source,
+            require_yolo=require_yolo,
+            require_dual_yolo=require_dual_yolo,
+            require_weights=require_weights,
+            require_bad_weights=require_bad_weights,
+        )
+        try:
+            preview = preview_mode(preview)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        contents = await file.read()
+        key = _result_cache_key(contents, yolo_runtime, yolo_bad_runtime, source=source, preview=preview)
+        try:
+            cached, cache_status = await RESULT_CACHE.get_or_compute(
+                key,
+                lambda: ANALYSIS_POOL.run(
+                    _analyze_upload,
+                    contents,
+                    batch_id=batch_id,
+                    lat=lat,
+                    lon=lon,
+                    source=source,
+                    preview=preview,
+                    near_dups=_near_dup_session(yolo_runtime, source, batch_id, x_device_id),
+                ),
+                _analysis_nbytes,
+            )
+        except PoolSaturated as e:
+            raise HTTPException(
+                status_code=503,
+                detail="AI service is busy. Please retry shortly.",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except ImageTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+
+        analysis = _reissue_analysis(cached, fresh=cache_status != "miss", batch_id=batch_id, lat=lat, lon=lon)
+        # SQLite, preview store, rollups and log backpressure all block; keep them off the loop.
+        await asyncio.to_thread(_record_scan, analysis, contents, file.filename, batch_id=batch_id, lat=lat, lon=lon)
+        response = _detect_response(analysis, preview)
+        response.headers["X-Result-Cache"] = cache_status
+        return response
 
     except HTTPException:
         raise
@@ -1756,83 +1892,145 @@ async def detect_quality(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/history")
-def get_history():
-    total = len(ANALYSIS_HISTORY)
-    if total == 0:
-        return {
-            "items": [],
-            "total": 0,
-            "average_quality": None,
-            "pass_rate": None,
-            "ripeness_distribution": {"under": 0, "ideal": 0, "over": 0},
-            "grade_distribution": {"A": 0, "B": 0, "C": 0, "D": 0, "E": 0},
-            "defect_level_distribution": {"low": 0, "medium": 0, "high": 0},
-        }
+@app.post("/detect/batch")
+async def detect_batch(
+    files: list[UploadFile] = File(...),
+    batch_id: str | None = Form(None),
+    lat: float | None = Form(None),
+    lon: float | None = Form(None),
+    require_yolo: int | None = Form(None),
+    require_dual_yolo: int | None = Form(None),
+    require_weights: str | None = Form(None),
+    require_bad_weights: str | None = Form(None),
+    source: str | None = Form(None),
+    preview: str | None = Form(None),
+):
+    max_files = int(os.environ.get("DRAGON_BATCH_MAX_FILES", "64") or 64)
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded.")
+    if len(files) > max_files:
+        raise HTTPException(status_code=413, detail=f"Too many files in one batch (max {max_files}).")
+
+    yolo_runtime = get_yolo_runtime("best") if callable(get_yolo_runtime) else None
+    yolo_bad_runtime = get_yolo_runtime("bad") if callable(get_yolo_runtime) else None
+    _check_yolo_requirements(
+        yolo_runtime,
+        yolo_bad_runtime,
+        source=source,
+        require_yolo=require_yolo,
+        require_dual_yolo=require_dual_yolo,
+        require_weights=require_weights,
+        require_bad_weights=require_bad_weights,
+    )
+    try:
+        preview = preview_mode(preview)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if preview == "multipart":
+        raise HTTPException(status_code=400, detail="preview=multipart is only available on /detect; use url.")
 
-    qualities = [item["quality_score"] for item in ANALYSIS_HISTORY]
-    grades = [item["grade"] for item in ANALYSIS_HISTORY]
+    batch_id = batch_id or str(uuid.uuid4())
+    uploads = [(f.filename, await f.read()) for f in files]
+    loop = asyncio.get_running_loop()
+    results: asyncio.Queue = asyncio.Queue()
 
-    ripeness_distribution = {"under": 0, "ideal": 0, "over": 0}
-    grade_distribution = {"A": 0, "B": 0, "C": 0, "D": 0, "E": 0}
-    defect_level_distribution = {"low": 0, "medium": 0, "high": 0}
+    def emit(index: int, item: dict) -> None:
+        loop.call_soon_threadsafe(results.put_nowait, (index, item))
 
-    for item in ANALYSIS_HISTORY:
-        r = item["ripeness_score"]
-        if r < 80:
-            ripeness_distribution["under"] += 1
-        elif r <= 95:
-            ripeness_distribution["ideal"] += 1
-        else:
-            ripeness_distribution["over"] += 1
+    try:
+        job = ANALYSIS_POOL.submit(
+            _analyze_batch,
+            uploads,
+            emit,
+            batch_id=batch_id,
+            lat=lat,
+            lon=lon,
+            source=source,
+            preview=preview,
+        )
+    except PoolSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is busy. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    # Completion is queued after every emit() from the worker, so it doubles as the end marker.
+    job.add_done_callback(lambda _f: results.put_nowait(None))
+
+    async def _stream():
+        failed = 0
+        while True:
+            item = await results.get()
+            if item is None:
+                break
+            index, payload = item
+            filename, contents = uploads[index]
+            line = {"batch_id": batch_id, "index": index, "filename": filename}
+            analysis = payload.get("analysis")
+            if analysis is not None:
+                await asyncio.to_thread(_record_scan, analysis, contents, filename, batch_id=batch_id, lat=lat, lon=lon)
+                line.update({"status": "ok", "result": analysis["result"]})
+            else:
+                failed += 1
+                line.update({"status": "error", "error": payload.get("error")})
+            t0 = time.perf_counter()
+            body = (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+            RESPONSE_STATS.record(f"batch_line:{preview}", len(body), time.perf_counter() - t0)
+            yield body
+
+        summary = {"batch_id": batch_id, "done": True, "total": len(uploads), "failed": failed}
+        if not job.cancelled() and job.exception() is not None:
+            summary["error"] = str(job.exception())
+        yield (json.dumps(summary, ensure_ascii=False) + "\n").encode("utf-8")
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
 
-        g = item["grade"]
-        if g in grade_distribution:
-            grade_distribution[g] += 1
 
-        level = item.get("defect_level")
-        if level in defect_level_distribution:
-            defect_level_distribution[level] += 1
+def _page_bounds(limit: int, offset: int) -> tuple[int, int]:
+    max_page = int(os.environ.get("DRAGON_HISTORY_MAX_PAGE", "200") or 200)
+    return max(1, min(int(limit), max_page)), max(0, int(offset))
 
-    average_quality = sum(qualities) / len(qualities)
-    passes = sum(1 for g in grades if g in ("A", "B"))
-    pass_rate = passes / len(grades) * 100
 
+@app.get("/history")
+def get_history(limit: int = 20, offset: int = 0):
+    limit, offset = _page_bounds(limit, offset)
+    summary = SCAN_STORE.summary()
+    items = SCAN_STORE.page(limit, offset) if summary["total"] else []
     return {
-        "items": ANALYSIS_HISTORY,
-        "total": total,
-        "average_quality": average_quality,
-        "pass_rate": pass_rate,
-        "ripeness_distribution": ripeness_distribution,
-        "grade_distribution": grade_distribution,
-        "defect_level_distribution": defect_level_distribution,
+        "items": items,
+        **summary,
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + len(items) if offset + len(items) < summary["total"] else None,
     }
 
 
-@app.get("/batches/{batch_id}")
-def get_batch(batch_id: str):
-    items = [item for item in ANALYSIS_HISTORY if item.get("batch_id") == batch_id]
-    total = len(items)
-    if total == 0:
-        return {
-            "items": [],
-            "total": 0,
-            "average_quality": None,
-            "pass_rate": None,
-        }
-
-    qualities = [item["quality_score"] for item in items]
-    grades = [item["grade"] for item in items]
+@app.get("/scans/{scan_id}/preview")
+def scan_preview(scan_id: str, if_none_match: str | None = Header(None, alias="If-None-Match")):
+    # Lazy previews render on first request; a scan's preview never changes, so clients may cache it.
+    found = PREVIEW_STORE.get(scan_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Preview not available for this scan.")
+    jpeg, etag = found
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400, immutable"}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=jpeg, media_type="image/jpeg", headers=headers)
 
-    average_quality = sum(qualities) / len(qualities)
-    passes = sum(1 for g in grades if g in ("A", "B"))
-    pass_rate = passes / len(grades) * 100
 
+@app.get("/batches/{batch_id}")
+def get_batch(batch_id: str, limit: int = 20, offset: int = 0):
+    limit, offset = _page_bounds(limit, offset)
+    summary = SCAN_STORE.summary(batch_id=batch_id)
+    items = SCAN_STORE.page(limit, offset, batch_id=batch_id) if summary["total"] else []
     return {
         "items": items,
-        "total": total,
-        "average_quality": average_quality,
-        "pass_rate": pass_rate,
+        "total": summary["total"],
+        "average_quality": summary["average_quality"],
+        "pass_rate": summary["pass_rate"],
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + len(items) if offset + len(items) < summary["total"] else None,
     }
 
 
@@ -1858,20 +2056,18 @@ def label_scan(payload: LabelPayload):
         {k: v for k, v in correction.items() if v is not None}
     )
 
-    matched = None
-    for item in ANALYSIS_HISTORY:
-        if item["id"] == payload.analysis_id:
-            matched = item
-            if payload.correct_grade:
-                item["grade"] = payload.correct_grade
-            if payload.correct_weight_grams is not None:
-                item["weight_grams_est"] = int(round(float(payload.correct_weight_grams)))
-            if payload.correct_price_per_kg is not None:
-                item["estimated_price_per_kg"] = float(payload.correct_price_per_kg)
-                item["currency"] = (payload.currency or DEFAULT_CURRENCY).upper()
-            item["label_corrected"] = True
-
+    matched = SCAN_STORE.get(payload.analysis_id)
     if matched:
+        if payload.correct_grade:
+            matched["grade"] = payload.correct_grade
+        if payload.correct_weight_grams is not None:
+            matched["weight_grams_est"] = int(round(float(payload.correct_weight_grams)))
+        if payload.correct_price_per_kg is not None:
+            matched["estimated_price_per_kg"] = float(payload.correct_price_per_kg)
+            matched["currency"] = (payload.currency or DEFAULT_CURRENCY).upper()
+        matched["label_corrected"] = True
+        SCAN_STORE.put(matched)
+
         features = {
             "quality_score": float(matched.get("quality_score") or 0.0),
             "ripeness_score": float(matched.get("ripeness_score") or 0.0),
@@ -1883,14 +2079,13 @@ def label_scan(payload: LabelPayload):
         }
         correction["features"] = features
 
-    _append_jsonl(LABELS_JSONL_PATH, {k: v for k, v in correction.items() if v is not None})
-
-    updated_model = None
-    if payload.correct_price_per_kg is not None:
-        updated_model = _retrain_price_model()
-        if updated_model:
-            global PRICE_MODEL
-            PRICE_MODEL = updated_model
+    label = {k: v for k, v in correction.items() if v is not None}
+    sample = _price_sample(label)
+    if sample is None:
+        _append_jsonl(LABELS_JSONL_PATH, label)
+    else:
+        # Logged under the trainer lock, so a concurrent refit counts the label exactly once.
+        PRICE_TRAINER.observe(*sample, record=lambda: _append_jsonl(LABELS_JSONL_PATH, label))
 
     return {
         "status": "ok",
@@ -1899,65 +2094,164 @@ def label_scan(payload: LabelPayload):
     }
 
 
-@app.get("/reports/summary")
-def reports_summary(from_date: str | None = None, to_date: str | None = None):
-    filtered = ANALYSIS_HISTORY
-    if from_date or to_date:
-        try:
-            from_dt = datetime.fromisoformat(from_date).date() if from_date else None
-            to_dt = datetime.fromisoformat(to_date).date() if to_date else None
-            subset = []
-            for item in ANALYSIS_HISTORY:
-                ts = datetime.fromisoformat(item["timestamp"]).date()
-                if from_dt and ts < from_dt:
-                    continue
-                if to_dt and ts > to_dt:
-                    continue
-                subset.append(item)
-            filtered = subset
-        except Exception:
-            filtered = ANALYSIS_HISTORY
+@app.post("/admin/price-model/refit")
+def refit_price_model(x_admin_token: str | None = Header(None, alias="X-Admin-Token")):
+    """Full refit from the labels log, choosing lambda by cross-validation (DRAGON_PRICE_LAMBDA_CV)."""
+    token = os.environ.get("DRAGON_ADMIN_TOKEN")
+    if token and (not x_admin_token or x_admin_token != token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    updated = _retrain_price_model()
+    return {"status": "ok" if updated else "insufficient_samples", "price_model": PRICE_MODEL}
 
-    total = len(filtered)
-    if total == 0:
-        return {
-            "total": 0,
-            "average_quality": None,
-            "pass_rate": None,
-            "grade_distribution": {"A": 0, "B": 0, "C": 0, "D": 0, "E": 0},
-            "ripeness_distribution": {"under": 0, "ideal": 0, "over": 0},
-            "from": from_date,
-            "to": to_date,
-        }
 
-    qualities = [item["quality_score"] for item in filtered]
-    grades = [item["grade"] for item in filtered]
-
-    grade_distribution = {"A": 0, "B": 0, "C": 0, "D": 0, "E": 0}
-    ripeness_distribution = {"under": 0, "ideal": 0, "over": 0}
-
-    for item in filtered:
-        g = item["grade"]
-        if g in grade_distribution:
-            grade_distribution[g] += 1
-        r = item["ripeness_score"]
-        if r < 80:
-            ripeness_distribution["under"] += 1
-        elif r <= 95:
-            ripeness_distribution["ideal"] += 1
+class ScoreBatchPayload(BaseModel):
+    rows: list[dict] | None = None
+    columns: dict[str, list] | None = None
+
+
+@app.post("/score/batch")
+def score_batch(payload: ScoreBatchPayload):
+    """Grade and price N feature rows (the stored `scoring_inputs`) in one vectorized pass."""
+    if (payload.rows is None) == (payload.columns is None):
+        raise HTTPException(status_code=400, detail="Send exactly one of rows or columns.")
+    max_rows = int(os.environ.get("DRAGON_SCORE_BATCH_MAX_ROWS", "200000") or 200000)
+    n = len(payload.rows) if payload.rows is not None else max((len(v) for v in payload.columns.values()), default=0)
+    if n > max_rows:
+        raise HTTPException(status_code=413, detail=f"Too many rows in one batch (max {max_rows}).")
+    t0 = time.perf_counter()
+    try:
+        rows = rows_from_records(payload.rows) if payload.rows is not None else rows_from_columns(payload.columns)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    scored = score_rows(rows, SCORING_CALIBRATION, PRICE_MODEL)
+    out = {k: v.tolist() for k, v in scored.items()}
+    out.update({k: v.tolist() for k, v in score_labels(scored).items()})
+    for k in ("price_lo", "price_hi", "model_price_per_kg", "baseline_price_per_kg", "estimated_price_per_kg"):
+        out[k] = np.round(scored[k], 2).tolist()
+    return {
+        "n": int(rows.shape[0]),
+        "currency": DEFAULT_CURRENCY,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+        "columns": out,
+    }
+
+
+_MANIFEST_FORMATS = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/ndjson": "ndjson", "application/jsonl": "ndjson"}
+
+
+def _quote_prices(content_type: str, body: bytes) -> dict:
+    max_rows = int(os.environ.get("DRAGON_SCORE_BATCH_MAX_ROWS", "200000") or 200000)
+    model = PRICE_MODEL
+    t0 = time.perf_counter()
+    try:
+        fmt = _MANIFEST_FORMATS.get(content_type)
+        if fmt is not None:
+            rows = price_inputs_from_records(manifest_records(body.decode("utf-8-sig"), fmt))
         else:
-            ripeness_distribution["over"] += 1
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict) or (payload.get("rows") is None) == (payload.get("columns") is None):
+                raise HTTPException(status_code=400, detail="Send exactly one of rows or columns.")
+            if payload.get("rows") is not None:
+                rows = price_inputs_from_records(payload["rows"])
+            else:
+                rows = price_inputs_from_columns(payload["columns"])
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if rows.shape[0] > max_rows:
+        raise HTTPException(status_code=413, detail=f"Too many rows in one batch (max {max_rows}).")
+    prices = price_rows(rows, model)
+    return {
+        "n": int(rows.shape[0]),
+        "currency": DEFAULT_CURRENCY,
+        "price_model_version": int(model.get("version") or 0),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+        # Rounded like /detect rounds a single scan's prices.
+        "columns": {k: [round(v, 2) for v in prices[k].tolist()] for k in PRICE_OUTPUTS},
+    }
+
+
+@app.post("/price/predict")
+async def price_predict(request: Request):
+    """Bulk price quotes for graded fruit, one vectorized pass over the manifest.
+
+    Body: JSON {"rows": [...]} or {"columns": {...}} with grade, defect_level,
+    insect_risk_level, quality_score, ripeness_score, defect_probability,
+    fruit_area_ratio and color_score per fruit, or the same fields as a CSV
+    (text/csv) or NDJSON (application/x-ndjson) manifest.
+
+    A row is the `price_inputs` record of a /detect result (also stored in
+    scans.jsonl): quoting it with the same price model returns that scan's prices.
+    The rounded display fields of the result (quality_score, color_score, ...) are
+    not a substitute, since prices are computed from the unrounded values.
+    """
+    content_type = (request.headers.get("content-type") or "application/json").split(";")[0].strip().lower()
+    body = await request.body()
+    return await asyncio.to_thread(_quote_prices, content_type, body)
+
+
+class CalibrationSweepPayload(BaseModel):
+    grid: dict[str, list[float]] | None = None
+    points: list[dict[str, float]] | None = None
+    # Optional [since, until) window on scan timestamps (ISO date or datetime).
+    since: str | None = None
+    until: str | None = None
+
+
+_SWEEP_HISTORY: dict = {"key": None, "rows": None}
+_SWEEP_HISTORY_LOCK = threading.Lock()
 
-    average_quality = sum(qualities) / len(qualities)
-    passes = sum(1 for g in grades if g in ("A", "B"))
-    pass_rate = passes / len(grades) * 100
 
+def _sweep_history(since: str | None = None, until: str | None = None):
+    # Columnar scoring_inputs of the scans log, reloaded only when it or the window changes.
+    key = (log_version(SCANS_JSONL_PATH), since, until)
+    with _SWEEP_HISTORY_LOCK:
+        if _SWEEP_HISTORY["rows"] is None or _SWEEP_HISTORY["key"] != key:
+            _SWEEP_HISTORY["rows"] = load_history(SCANS_JSONL_PATH, since, until)
+            _SWEEP_HISTORY["key"] = key
+        return _SWEEP_HISTORY["rows"]
+
+
+@app.post("/admin/calibration/sweep")
+def calibration_sweep(
+    payload: CalibrationSweepPayload,
+    x_admin_token: str | None = Header(None, alias="X-Admin-Token"),
+):
+    """What-if grade/lane/price mix of the stored scans under a grid of scoring calibrations."""
+    token = os.environ.get("DRAGON_ADMIN_TOKEN")
+    if token and (not x_admin_token or x_admin_token != token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    max_points = int(os.environ.get("DRAGON_CALIBRATION_SWEEP_MAX_POINTS", "5000") or 5000)
+    try:
+        grid = calibration_grid(payload.grid, payload.points, base=SCORING_CALIBRATION, max_points=max_points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    JSONL_WRITERS.flush(SCANS_JSONL_PATH)
+    rows = _sweep_history(payload.since, payload.until)
+    result = sweep(rows, grid, PRICE_MODEL, baseline=SCORING_CALIBRATION)
+    result["currency"] = DEFAULT_CURRENCY
+    return result
+
+
+@app.get("/reports/summary")
+def reports_summary(from_date: str | None = None, to_date: str | None = None):
+    # Whole UTC days, inclusive: [from_date 00:00, day after to_date 00:00). Unparseable dates
+    # leave the range open, as before.
+    since = until = None
+    try:
+        if from_date:
+            since = datetime.fromisoformat(from_date).date().isoformat()
+        if to_date:
+            until = (datetime.fromisoformat(to_date).date() + timedelta(days=1)).isoformat()
+    except Exception:
+        since = until = None
+
+    summary = SCAN_STORE.summary(since=since, until=until)
     return {
-        "total": total,
-        "average_quality": average_quality,
-        "pass_rate": pass_rate,
-        "grade_distribution": grade_distribution,
-        "ripeness_distribution": ripeness_distribution,
+        "total": summary["total"],
+        "average_quality": summary["average_quality"],
+        "pass_rate": summary["pass_rate"],
+        "grade_distribution": summary["grade_distribution"],
+        "ripeness_distribution": summary["ripeness_distribution"],
         "from": from_date,
         "to": to_date,
     }
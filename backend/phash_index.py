@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any
+
+from PIL import Image
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """Difference hash: sign of horizontal gradients on a (hash_size+1) x hash_size thumbnail."""
+    # Shrink first so the grayscale conversion runs on 72 pixels instead of the whole frame.
+    thumb = image.resize((hash_size + 1, hash_size), Image.BOX).convert("L")
+    px = list(thumb.getdata())
+    bits = 0
+    for y in range(hash_size):
+        row = px[y * (hash_size + 1):(y + 1) * (hash_size + 1)]
+        for x in range(hash_size):
+            bits = (bits << 1) | (1 if row[x] < row[x + 1] else 0)
+    return bits
+
+
+class NearDuplicateIndex:
+    """Recent (perceptual hash -> payload) entries, matched by Hamming distance.
+
+    Burst scans of the same fruit differ by a few bytes but hash within a couple of bits,
+    so a lookup returns the payload of the closest recent entry within `max_distance`
+    that was stored for the same image size and tag. Entries expire after `ttl_s`.
+
+    A small lesion can move the hash by as little as two bits, so an index must only
+    span frames that are known to show the same fruit: one batch, or one client session
+    (see NearDuplicateSessions), never the whole process. Only fruit-model detections
+    are reused; the disease model always runs, so a lesion the reused boxes miss still
+    grades the fruit. DRAGON_NEAR_DUP_SIZE=0 turns reuse off.
+    """
+
+    _totals = {"hits": 0, "misses": 0}
+    _totals_lock = threading.Lock()
+
+    def __init__(self, max_items: int, max_distance: int, ttl_s: float):
+        self.max_items = max(0, int(max_items))
+        self.max_distance = int(max_distance)
+        self.ttl_s = max(0.0, float(ttl_s))
+        self._entries: deque = deque(maxlen=max(1, self.max_items))
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._distance_hist: dict[int, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "NearDuplicateIndex":
+        return cls(
+            int(os.environ.get("DRAGON_NEAR_DUP_SIZE", "32") or 0),
+            int(os.environ.get("DRAGON_NEAR_DUP_MAX_DISTANCE", "2") or 0),
+            float(os.environ.get("DRAGON_NEAR_DUP_TTL_S", "10") or 0),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0 and self.max_distance >= 0 and self.ttl_s > 0
+
+    def lookup(self, phash: int, size: tuple[int, int], tag: Any = None) -> Any | None:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        best = None
+        best_d = self.max_distance + 1
+        with self._lock:
+            while self._entries and now - self._entries[0][0] > self.ttl_s:
+                self._entries.popleft()
+            for _, h, s, t, payload in self._entries:
+                if s != size or t != tag:
+                    continue
+                d = (h ^ phash).bit_count()
+                if d < best_d:
+                    best, best_d = payload, d
+            if best is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._distance_hist[best_d] = self._distance_hist.get(best_d, 0) + 1
+        with self._totals_lock:
+            self._totals["hits" if best is not None else "misses"] += 1
+        return best
+
+    def add(self, phash: int, size: tuple[int, int], payload: Any, tag: Any = None) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries.append((time.monotonic(), int(phash), tuple(size), tag, payload))
+
+    @classmethod
+    def totals(cls) -> dict:
+        """Hits and misses summed over every index this process has created."""
+        with cls._totals_lock:
+            return dict(cls._totals)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "max_items": self.max_items,
+                "max_distance": self.max_distance,
+                "ttl_s": self.ttl_s,
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "hit_distances": {str(k): v for k, v in sorted(self._distance_hist.items())},
+            }
+
+
+class NearDuplicateSessions:
+    """One NearDuplicateIndex per client session, for bursts sent to /detect one by one.
+
+    Sessions are keyed by the caller (e.g. source plus batch id or device id); a session
+    idle for longer than the index TTL is dropped, and at most `max_sessions` are kept
+    (least recently used first out).
+    """
+
+    def __init__(self, max_sessions: int, max_items: int, max_distance: int, ttl_s: float):
+        self.max_sessions = max(0, int(max_sessions))
+        self._template = NearDuplicateIndex(max_items, max_distance, ttl_s)
+        self._sessions: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "NearDuplicateSessions":
+        index = NearDuplicateIndex.from_env()
+        return cls(
+            int(os.environ.get("DRAGON_NEAR_DUP_SESSIONS", "256") or 0),
+            index.max_items,
+            index.max_distance,
+            index.ttl_s,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_sessions > 0 and self._template.enabled
+
+    def get(self, key: Any) -> NearDuplicateIndex | None:
+        """The session's index, or None when reuse is off or the request has no session."""
+        if key is None or not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest[0] <= self._template.ttl_s:
+                    break
+                self._sessions.popitem(last=False)
+            entry = self._sessions.pop(key, None)
+            index = entry[1] if entry else NearDuplicateIndex(
+                self._template.max_items, self._template.max_distance, self._template.ttl_s
+            )
+            self._sessions[key] = (now, index)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return index
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_sessions": self.max_sessions,
+                "sessions": len(self._sessions),
+                "max_items": self._template.max_items,
+                "max_distance": self._template.max_distance,
+                "ttl_s": self._template.ttl_s,
+            }
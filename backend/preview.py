@@ -0,0 +1,344 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# inline: base64 in the JSON; url: rendered now, served from the blob cache; lazy: rendered on
+# first GET; multipart: JSON and JPEG in one multipart/mixed response; none: no preview.
+PREVIEW_MODES = ("inline", "url", "lazy", "multipart", "none")
+
+# Overlay colour and opacity of the segmented region, and the bbox border colour.
+_TINT = np.array([230, 0, 92], dtype=np.uint16)
+_TINT_ALPHA = 90
+_BORDER = (255, 255, 255)
+
+
+def preview_mode(value: str | None = None) -> str:
+    """Resolve a requested preview mode (see PREVIEW_MODES); env DRAGON_PREVIEW_MODE is the default."""
+    mode = str(value or os.environ.get("DRAGON_PREVIEW_MODE", "inline") or "inline").strip().lower()
+    if mode not in PREVIEW_MODES:
+        raise ValueError(f"Unknown preview mode {mode!r}; expected one of {', '.join(PREVIEW_MODES)}.")
+    return mode
+
+
+def _max_width() -> int:
+    return int(os.environ.get("DRAGON_PREVIEW_MAX_WIDTH", "720") or 720)
+
+
+def _jpeg_quality() -> int:
+    return int(os.environ.get("DRAGON_PREVIEW_QUALITY", "75") or 75)
+
+
+def render_preview(
+    image: Image.Image,
+    mask: np.ndarray,
+    bbox: tuple[int, int, int, int],
+    max_width: int | None = None,
+    quality: int | None = None,
+    offset: tuple[int, int] = (0, 0),
+) -> bytes:
+    """JPEG of the image with the segmented region tinted and its bbox outlined.
+
+    `mask` may be cropped to a window whose top-left corner in the image is `offset`.
+    Downscales first, so the tint, border and encode all run at preview size.
+    """
+    max_width = _max_width() if max_width is None else int(max_width)
+    w, h = image.size
+    if max_width > 0 and w > max_width:
+        size = (max_width, max(1, int(h * max_width / w)))
+        small = image.convert("RGB").resize(size, Image.BILINEAR, reducing_gap=2.0)
+    else:
+        small = image.convert("RGB")
+    pw, ph = small.size
+    sx = pw / float(max(1, w))
+    sy = ph / float(max(1, h))
+
+    arr = np.array(small)
+    ox, oy = int(offset[0]), int(offset[1])
+    if mask is not None and mask.ndim == 2 and oy + mask.shape[0] <= h and ox + mask.shape[1] <= w:
+        # Source pixel of each preview pixel, restricted to the preview rows/cols inside the window.
+        rows = np.minimum((np.arange(ph) * h) // ph, h - 1) - oy
+        cols = np.minimum((np.arange(pw) * w) // pw, w - 1) - ox
+        r_in = np.flatnonzero((rows >= 0) & (rows < mask.shape[0]))
+        c_in = np.flatnonzero((cols >= 0) & (cols < mask.shape[1]))
+        if r_in.size and c_in.size:
+            ry, cx = slice(r_in[0], r_in[-1] + 1), slice(c_in[0], c_in[-1] + 1)
+            m = mask[rows[ry][:, None], cols[cx][None, :]]
+            sub = arr[ry, cx]
+            px = sub[m].astype(np.uint16)
+            sub[m] = ((px * (255 - _TINT_ALPHA) + _TINT * _TINT_ALPHA + 127) // 255).astype(np.uint8)
+
+    x0, y0, x1, y1 = bbox
+    x0 = max(0, min(int(x0 * sx), pw - 1))
+    x1 = max(0, min(int(x1 * sx), pw - 1))
+    y0 = max(0, min(int(y0 * sy), ph - 1))
+    y1 = max(0, min(int(y1 * sy), ph - 1))
+    if x1 >= x0 and y1 >= y0:
+        arr[y0, x0:x1 + 1] = _BORDER
+        arr[y1, x0:x1 + 1] = _BORDER
+        arr[y0:y1 + 1, x0] = _BORDER
+        arr[y0:y1 + 1, x1] = _BORDER
+
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, format="JPEG", quality=_jpeg_quality() if quality is None else int(quality))
+    return buf.getvalue()
+
+
+def preview_etag(jpeg: bytes) -> str:
+    return '"' + hashlib.sha256(jpeg).hexdigest()[:20] + '"'
+
+
+_SCAN_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class PreviewStore:
+    """Scan previews keyed by scan id, in a bounded in-memory cache backed by a directory.
+
+    Holds rendered JPEGs (with their ETag) and, for lazy scans, the render inputs: the
+    analysis image, a bit-packed mask and the bbox, replaced by the JPEG on first
+    request. The in-memory cache is bounded by entry count and by bytes; the least
+    recently used entries go first, so scans nobody looks at cost no rendering and age out.
+
+    With a `directory`, every entry is also written to disk so any worker process can
+    serve it: JPEGs are stored once under blobs/ by their ETag, scans/<id> names the
+    blob of a scan, and pending/<id>.npz holds lazy render inputs until first render.
+    The directory is pruned oldest-first to `max_disk_bytes`.
+    """
+
+    def __init__(self, max_items: int, max_bytes: int, directory: str | None = None, max_disk_bytes: int = 0):
+        self.max_items = max(0, int(max_items))
+        self.max_bytes = max(0, int(max_bytes))
+        self.directory = directory or None
+        self.max_disk_bytes = max(0, int(max_disk_bytes))
+        self._items: OrderedDict[str, tuple] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._rendered = 0
+        self._evicted = 0
+        self._disk_hits = 0
+        self._disk_writes = 0
+        self._disk_errors = 0
+        self._disk_pruned = 0
+        self._writes_since_prune = 0
+
+    @classmethod
+    def from_env(cls, default_directory: str | None = None) -> "PreviewStore":
+        return cls(
+            int(os.environ.get("DRAGON_PREVIEW_STORE_SIZE", "256") or 0),
+            int(os.environ.get("DRAGON_PREVIEW_STORE_MAX_BYTES", str(64 * 1024 * 1024)) or 0),
+            os.environ.get("DRAGON_PREVIEW_DIR") or default_directory,
+            int(os.environ.get("DRAGON_PREVIEW_DISK_MAX_BYTES", str(1024 * 1024 * 1024)) or 0),
+        )
+
+    def _put(self, scan_id: str, entry: tuple, size: int) -> bool:
+        if self.max_items <= 0 or size > self.max_bytes:
+            return False
+        with self._lock:
+            self._bytes -= self._sizes.pop(scan_id, 0)
+            self._items[scan_id] = entry
+            self._items.move_to_end(scan_id)
+            self._sizes[scan_id] = size
+            self._bytes += size
+            while len(self._items) > self.max_items or self._bytes > self.max_bytes:
+                old, _ = self._items.popitem(last=False)
+                self._bytes -= self._sizes.pop(old, 0)
+                self._evicted += 1
+        return True
+
+    # -- disk ------------------------------------------------------------------------
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.directory, *parts)
+
+    def _write_file(self, path: str, write) -> None:
+        # Readers in other processes see either no file or the whole file.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _disk_write(self, fn) -> bool:
+        try:
+            fn()
+        except Exception:
+            with self._lock:
+                self._disk_errors += 1
+            return False
+        with self._lock:
+            self._disk_writes += 1
+            self._writes_since_prune += 1
+            prune = self._writes_since_prune >= 64
+            if prune:
+                self._writes_since_prune = 0
+        if prune:
+            self._prune_disk()
+        return True
+
+    def _save_jpeg(self, scan_id: str, jpeg: bytes, etag: str) -> None:
+        blob = self._path("blobs", etag.strip('"') + ".jpg")
+        if not os.path.exists(blob):
+            self._write_file(blob, lambda f: f.write(jpeg))
+        self._write_file(self._path("scans", scan_id), lambda f: f.write(etag.encode("ascii")))
+
+    def _save_source(self, scan_id: str, entry: tuple) -> None:
+        _, image, packed, shape, bbox, offset = entry
+        self._write_file(
+            self._path("pending", scan_id + ".npz"),
+            lambda f: np.savez(
+                f,
+                image=np.asarray(image.convert("RGB")),
+                mask=packed,
+                shape=np.asarray(shape),
+                bbox=np.asarray(bbox),
+                offset=np.asarray(offset),
+            ),
+        )
+
+    def _load(self, scan_id: str) -> tuple | None:
+        try:
+            with open(self._path("scans", scan_id), "rb") as f:
+                etag = f.read().decode("ascii")
+            with open(self._path("blobs", etag.strip('"') + ".jpg"), "rb") as f:
+                return ("jpeg", f.read(), etag)
+        except (OSError, UnicodeDecodeError):
+            pass
+        try:
+            with np.load(self._path("pending", scan_id + ".npz")) as data:
+                return (
+                    "pending",
+                    Image.fromarray(data["image"]),
+                    data["mask"],
+                    tuple(int(v) for v in data["shape"]),
+                    tuple(int(v) for v in data["bbox"]),
+                    tuple(int(v) for v in data["offset"]),
+                )
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _prune_disk(self) -> None:
+        if not self.directory or self.max_disk_bytes <= 0:
+            return
+        files = []
+        for sub in ("blobs", "pending", "scans"):
+            try:
+                with os.scandir(self._path(sub)) as it:
+                    for e in it:
+                        try:
+                            st = e.stat()
+                        except OSError:
+                            continue
+                        files.append((st.st_mtime, st.st_size, e.path))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_disk_bytes:
+            return
+        pruned = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            pruned += 1
+        with self._lock:
+            self._disk_pruned += pruned
+
+    # -- public ----------------------------------------------------------------------
+
+    def put_jpeg(self, scan_id: str, jpeg: bytes) -> bool:
+        etag = preview_etag(jpeg)
+        stored = self._put(scan_id, ("jpeg", jpeg, etag), len(jpeg))
+        if self.directory and _SCAN_ID_RE.match(scan_id):
+            stored = self._disk_write(lambda: self._save_jpeg(scan_id, jpeg, etag)) or stored
+        return stored
+
+    def put_source(
+        self,
+        scan_id: str,
+        image: Image.Image,
+        mask: np.ndarray,
+        bbox: tuple[int, int, int, int],
+        offset: tuple[int, int] = (0, 0),
+    ) -> bool:
+        packed = np.packbits(mask, axis=None)
+        entry = ("pending", image, packed, mask.shape, tuple(int(v) for v in bbox), tuple(int(v) for v in offset))
+        w, h = image.size
+        stored = self._put(scan_id, entry, w * h * 3 + int(packed.nbytes))
+        if self.directory and _SCAN_ID_RE.match(scan_id):
+            stored = self._disk_write(lambda: self._save_source(scan_id, entry)) or stored
+        return stored
+
+    def get(self, scan_id: str) -> tuple[bytes, str] | None:
+        """(JPEG, ETag) for a scan, rendering deferred previews on first access."""
+        with self._lock:
+            entry = self._items.get(scan_id)
+            if entry is not None:
+                self._hits += 1
+                self._items.move_to_end(scan_id)
+        if entry is None and self.directory and _SCAN_ID_RE.match(scan_id):
+            # Written by another worker (or before a restart).
+            entry = self._load(scan_id)
+            if entry is not None:
+                with self._lock:
+                    self._disk_hits += 1
+                if entry[0] == "jpeg":
+                    self._put(scan_id, entry, len(entry[1]))
+        if entry is None:
+            with self._lock:
+                self._misses += 1
+            return None
+        if entry[0] == "jpeg":
+            return entry[1], entry[2]
+
+        _, image, packed, shape, bbox, offset = entry
+        mask = np.unpackbits(packed, count=int(np.prod(shape))).reshape(shape).astype(bool)
+        jpeg = render_preview(image, mask, bbox, offset=offset)
+        with self._lock:
+            self._rendered += 1
+        self.put_jpeg(scan_id, jpeg)
+        if self.directory:
+            try:
+                os.remove(self._path("pending", scan_id + ".npz"))
+            except OSError:
+                pass
+        return jpeg, preview_etag(jpeg)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(1 for e in self._items.values() if e[0] == "pending")
+            return {
+                "max_items": self.max_items,
+                "max_bytes": self.max_bytes,
+                "items": len(self._items),
+                "bytes": self._bytes,
+                "pending": pending,
+                "hits": self._hits,
+                "misses": self._misses,
+                "rendered": self._rendered,
+                "evicted": self._evicted,
+                "directory": self.directory,
+                "max_disk_bytes": self.max_disk_bytes,
+                "disk_hits": self._disk_hits,
+                "disk_writes": self._disk_writes,
+                "disk_errors": self._disk_errors,
+                "disk_pruned": self._disk_pruned,
+            }
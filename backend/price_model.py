@@ -0,0 +1,406 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts: only the in-process lock applies
+    fcntl = None
+
+
+def ridge_solve(xtx: np.ndarray, xty: np.ndarray, lam: float) -> np.ndarray:
+    """Ridge coefficients from XᵀX and Xᵀy; the intercept (column 0) is not penalized."""
+    reg = np.eye(xtx.shape[0], dtype=float) * float(lam)
+    reg[0, 0] = 0.0
+    return np.linalg.solve(xtx + reg, xty)
+
+
+CV_MODES = ("loo", "kfold", "off")
+
+
+def lambda_grid(lo: float = 1e-4, hi: float = 1e4, count: int = 41) -> np.ndarray:
+    return np.logspace(np.log10(float(lo)), np.log10(float(hi)), max(1, int(count)))
+
+
+def ridge_cv_path(X: np.ndarray, y: np.ndarray, lambdas: Iterable[float], folds: int = 0) -> dict[str, Any]:
+    """Cross-validated error of ridge fits over a whole regularization path.
+
+    Column 0 of X is the unpenalized intercept, as in `ridge_solve`; that is the same as
+    ridge on the centered remaining columns. `folds` 0 is leave-one-out: one thin SVD of
+    the centered design gives every fit and every leverage h_ii in closed form, and the
+    LOO residual is e_i / (1 - h_ii). Otherwise samples are split into `folds`
+    interleaved folds, and each fold's training Gram matrix is eigendecomposed once, so
+    every lambda is a diagonal rescale. Returns per-lambda cv_rmse/cv_mae and the lambda
+    with the lowest cv_rmse.
+    """
+    lambdas = np.asarray(list(lambdas), dtype=float)
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = X.shape[0]
+    if folds:
+        folds = int(folds)
+        if not 2 <= folds <= n:
+            raise ValueError(f"{folds}-fold CV needs at least {folds} samples; got {n}")
+        residuals = np.empty((len(lambdas), n), dtype=float)
+        fold_of = np.arange(n) % folds
+        for f in range(folds):
+            held, train = fold_of == f, fold_of != f
+            Xt, yt = X[train, 1:], y[train]
+            x_mean, y_mean = Xt.mean(axis=0), yt.mean()
+            Xc = Xt - x_mean
+            eig, V = np.linalg.eigh(Xc.T @ Xc)
+            proj = V.T @ (Xc.T @ (yt - y_mean))
+            # (p-1, L) coefficients for every lambda at once.
+            beta = V @ (proj[:, None] / (np.maximum(eig, 0.0)[:, None] + lambdas[None, :]))
+            pred = y_mean + (X[held, 1:] - x_mean) @ beta
+            residuals[:, held] = (y[held][:, None] - pred).T
+    else:
+        if n < 3:
+            raise ValueError(f"leave-one-out CV needs at least 3 samples; got {n}")
+        Xc = X[:, 1:] - X[:, 1:].mean(axis=0)
+        yc = y - y.mean()
+        U, sv, _ = np.linalg.svd(Xc, full_matrices=False)
+        s2 = sv * sv
+        shrink = s2[None, :] / (s2[None, :] + lambdas[:, None])  # (L, r)
+        fitted = y.mean() + (shrink * (U.T @ yc)[None, :]) @ U.T  # (L, n)
+        leverage = 1.0 / n + shrink @ (U * U).T  # (L, n)
+        # A leverage of 1 means the point cannot be predicted without itself.
+        residuals = (y[None, :] - fitted) / np.maximum(1.0 - leverage, 1e-12)
+    cv_rmse = np.sqrt(np.mean(residuals * residuals, axis=1))
+    cv_mae = np.mean(np.abs(residuals), axis=1)
+    best = int(np.argmin(cv_rmse))
+    return {
+        "method": f"{folds}-fold" if folds else "loo",
+        "n": int(n),
+        "lambdas": lambdas.tolist(),
+        "cv_rmse": cv_rmse.tolist(),
+        "cv_mae": cv_mae.tolist(),
+        "best_index": best,
+        "lambda": float(lambdas[best]),
+    }
+
+
+class RidgeStats:
+    """Sufficient statistics of a least-squares problem: n, XᵀX, Xᵀy and yᵀy.
+
+    `add` is a rank-1 update (O(p²)), so the model can be re-solved after every label
+    without revisiting earlier ones; the residual sum of squares of any coefficient
+    vector follows from the same statistics.
+    """
+
+    def __init__(self, p: int):
+        self.p = int(p)
+        self.n = 0
+        self.xtx = np.zeros((self.p, self.p), dtype=float)
+        self.xty = np.zeros(self.p, dtype=float)
+        self.yty = 0.0
+
+    @classmethod
+    def from_arrays(cls, X: np.ndarray, y: np.ndarray) -> "RidgeStats":
+        stats = cls(X.shape[1])
+        stats.n = int(X.shape[0])
+        stats.xtx = X.T @ X
+        stats.xty = X.T @ y
+        stats.yty = float(y @ y)
+        return stats
+
+    def add(self, x: Iterable[float], y: float) -> None:
+        x = np.asarray(x, dtype=float)
+        self.xtx += np.outer(x, x)
+        self.xty += x * float(y)
+        self.yty += float(y) * float(y)
+        self.n += 1
+
+    def solve(self, lam: float) -> np.ndarray:
+        return ridge_solve(self.xtx, self.xty, lam)
+
+    def rss(self, coef: np.ndarray) -> float:
+        # ||y - Xc||² = yᵀy - 2cᵀXᵀy + cᵀXᵀXc; rounding can push a perfect fit just below 0.
+        return max(0.0, float(self.yty - 2.0 * coef @ self.xty + coef @ self.xtx @ coef))
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"n": self.n, "xtx": self.xtx.tolist(), "xty": self.xty.tolist(), "yty": self.yty}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "RidgeStats":
+        xty = np.asarray(data["xty"], dtype=float)
+        stats = cls(len(xty))
+        stats.n = int(data["n"])
+        stats.xtx = np.asarray(data["xtx"], dtype=float).reshape(stats.p, stats.p)
+        stats.xty = xty
+        stats.yty = float(data["yty"])
+        return stats
+
+
+class PriceModelTrainer:
+    """Owns the ridge price model and the statistics it is solved from.
+
+    `observe` folds one labelled sample in and re-solves the p×p system; `refit`
+    rebuilds the statistics from every sample (and is the only place MAE is measured,
+    since it needs the residuals themselves). Each new model gets `version` + 1 and is
+    handed to `publish` under the trainer lock, so concurrent updates publish in order
+    and readers only ever see a complete model. Model and statistics are saved together;
+    statistics whose version does not match the model are not trusted (`load` returns
+    False and the caller refits).
+
+    The saved files are the shared copy when several worker processes serve the app:
+    updates take an exclusive flock on `<stats_path>.lock`, first adopt any newer saved
+    model and statistics, then save, so versions never collide and no worker overwrites
+    a newer model with an older one. `refresh` lets readers pick up another worker's
+    model between updates. A refit reads the labels log, which other workers write
+    through their own queues; labels still queued there are counted by the next refit.
+
+    With `cv` "loo" or "kfold" a refit also picks `lambda` from `lambdas` by
+    cross-validation (ridge_cv_path) and records the path under "lambda_selection";
+    incremental updates keep the lambda of the last refit. "off" keeps the model's lambda.
+    """
+
+    def __init__(
+        self,
+        model: dict,
+        model_path: str,
+        stats_path: str,
+        publish: Callable[[dict], None] | None = None,
+        min_samples: int = 5,
+        cv: str = "loo",
+        cv_folds: int = 5,
+        lambdas: Iterable[float] | None = None,
+    ):
+        if cv not in CV_MODES:
+            raise ValueError(f"cv must be one of {', '.join(CV_MODES)}; got {cv!r}")
+        self.model = model
+        self.cv = cv
+        self.cv_folds = max(2, int(cv_folds))
+        self.lambdas = np.asarray(list(lambdas) if lambdas is not None else lambda_grid(), dtype=float)
+        self.model_path = model_path
+        self.stats_path = stats_path
+        self.publish = publish
+        self.min_samples = max(1, int(min_samples))
+        self.ridge = RidgeStats(len(model.get("feature_names") or model.get("coef") or []))
+        self._lock = threading.Lock()
+        self._observed = 0
+        self._refits = 0
+        self._solve_us = 0.0
+        self._refit_ms = 0.0
+        self._loaded_from: str | None = None
+        self._adopted = 0
+        self._saved_stamp: tuple | None = None
+
+    @classmethod
+    def from_env(
+        cls, model: dict, model_path: str, stats_path: str, publish: Callable[[dict], None] | None = None
+    ) -> "PriceModelTrainer":
+        lo, hi, count = (os.environ.get("DRAGON_PRICE_LAMBDA_GRID", "1e-4,1e4,41") or "1e-4,1e4,41").split(",")
+        return cls(
+            model,
+            model_path,
+            stats_path,
+            publish=publish,
+            min_samples=int(os.environ.get("DRAGON_PRICE_MIN_SAMPLES", "5") or 5),
+            cv=(os.environ.get("DRAGON_PRICE_LAMBDA_CV", "loo") or "loo").strip().lower(),
+            cv_folds=int(os.environ.get("DRAGON_PRICE_CV_FOLDS", "5") or 5),
+            lambdas=lambda_grid(float(lo), float(hi), int(count)),
+        )
+
+    @property
+    def version(self) -> int:
+        return int(self.model.get("version") or 0)
+
+    def load(self) -> bool:
+        with self._lock, self._file_lock():
+            saved = self._read_saved()
+            if saved is None:
+                return False
+            self._adopt(*saved)
+            self._loaded_from = "stats"
+            return True
+
+    def refresh(self) -> bool:
+        """Adopt a newer model saved by another worker; cheap when nothing changed.
+
+        Never waits: if an update is in progress here, it syncs on its own.
+        """
+        if self._stamp() == self._saved_stamp or not self._lock.acquire(blocking=False):
+            return False
+        try:
+            return self._sync()
+        finally:
+            self._lock.release()
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+        with open(f"{self.stats_path}.lock", "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _stamp(self) -> tuple | None:
+        try:
+            st = os.stat(self.stats_path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read_saved(self) -> tuple[dict, int, RidgeStats] | None:
+        # The model is written before its statistics, so a matching pair is complete. A
+        # newer model than statistics means an update is mid-save; its statistics replace
+        # the file next, which changes the stamp and triggers a re-read.
+        self._saved_stamp = self._stamp()
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            with open(self.model_path, "r", encoding="utf-8") as f:
+                model = json.load(f)
+            version = int(data.get("version", -1))
+            ridge = RidgeStats.from_dict(data["ridge"])
+        except Exception:
+            return None
+        if int(model.get("version") or 0) != version or ridge.p != self.ridge.p:
+            return None
+        return model, version, ridge
+
+    def _adopt(self, model: dict, version: int, ridge: RidgeStats) -> None:
+        # Caller holds self._lock.
+        self.ridge = ridge
+        if version != self.version or model.get("coef") != self.model.get("coef"):
+            self.model = model
+            if self.publish is not None:
+                self.publish(model)
+
+    def _sync(self) -> bool:
+        # Caller holds self._lock (and the file lock when about to save).
+        if self._stamp() == self._saved_stamp:
+            return False
+        saved = self._read_saved()
+        if saved is None or saved[1] <= self.version:
+            return False
+        self._adopt(*saved)
+        self._adopted += 1
+        return True
+
+    def _solved(self, ridge: RidgeStats, metrics: dict, lam: float | None = None) -> dict:
+        started = time.perf_counter()
+        lam = float(self.model.get("lambda") or 1.0) if lam is None else float(lam)
+        coef = ridge.solve(lam)
+        self._solve_us = (time.perf_counter() - started) * 1e6
+        return {
+            **self.model,
+            "lambda": lam,
+            "coef": [float(v) for v in coef.tolist()],
+            "n_samples": int(ridge.n),
+            "metrics": {**metrics, "rmse": math.sqrt(ridge.rss(coef) / ridge.n)},
+            "trained_at": datetime.now(timezone.utc).isoformat(),
+            "version": self.version + 1,
+        }
+
+    def _commit(self, model: dict | None) -> dict | None:
+        # Caller holds self._lock.
+        if model is not None:
+            self.model = model
+            if self.publish is not None:
+                self.publish(model)
+        self._save(write_model=model is not None)
+        return model
+
+    def observe(self, x: Iterable[float], y: float, record: Callable[[], None] | None = None) -> dict | None:
+        """Add one sample; returns the re-solved model, or None below `min_samples`.
+
+        `record` (e.g. appending the label to the labels log) runs under the same lock, so
+        a concurrent `refit` sees each sample either in its log read or here, never both.
+        """
+        with self._lock, self._file_lock():
+            self._sync()
+            if record is not None:
+                record()
+            self.ridge.add(x, y)
+            self._observed += 1
+            if self.ridge.n < self.min_samples:
+                return self._commit(None)
+            # MAE stays as measured by the last refit; RMSE is exact for the new model.
+            metrics = {k: v for k, v in (self.model.get("metrics") or {}).items() if k != "rmse"}
+            return self._commit(self._solved(self.ridge, metrics))
+
+    def refit(self, read_samples: Callable[[], Iterable[tuple[list[float], float]]]) -> dict | None:
+        """Rebuild the statistics from every sample (e.g. the labels log) and re-solve.
+
+        Holds the lock while reading, so labels arriving meanwhile wait for it.
+        """
+        with self._lock, self._file_lock():
+            # Only the version is taken over; the statistics are rebuilt below.
+            self._sync()
+            started = time.perf_counter()
+            samples = list(read_samples())
+            X = np.array([x for x, _ in samples], dtype=float).reshape(len(samples), self.ridge.p)
+            y = np.array([v for _, v in samples], dtype=float)
+            ridge = RidgeStats.from_arrays(X, y)
+            model = None
+            if ridge.n >= self.min_samples:
+                lam = float(self.model.get("lambda") or 1.0)
+                metrics: dict[str, Any] = {}
+                selection = self._select_lambda(X, y)
+                if selection is not None:
+                    lam = selection["lambda"]
+                    best = selection["best_index"]
+                    metrics = {"cv_rmse": selection["cv_rmse"][best], "cv_mae": selection["cv_mae"][best]}
+                coef = ridge.solve(lam)
+                metrics["mae"] = float(np.mean(np.abs(X @ coef - y)))
+                model = self._solved(ridge, metrics, lam)
+                if selection is not None:
+                    model["lambda_selection"] = {**selection, "selected_at": model["trained_at"]}
+            self.ridge = ridge
+            self._refits += 1
+            self._refit_ms = (time.perf_counter() - started) * 1000.0
+            self._loaded_from = self._loaded_from or "refit"
+            return self._commit(model)
+
+    def _select_lambda(self, X: np.ndarray, y: np.ndarray) -> dict | None:
+        if self.cv == "off" or not len(self.lambdas):
+            return None
+        try:
+            return ridge_cv_path(X, y, self.lambdas, self.cv_folds if self.cv == "kfold" else 0)
+        except (ValueError, np.linalg.LinAlgError):
+            # Too few samples for this CV scheme: keep the current lambda.
+            return None
+
+    def _save(self, write_model: bool = True) -> None:
+        model = self.model
+        stats = {"version": self.version, "ridge": self.ridge.to_dict()}
+        targets = [(self.model_path, model)] if write_model else []
+        for path, payload in targets + [(self.stats_path, stats)]:
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(payload, f, ensure_ascii=False, indent=2 if payload is model else None)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+        self._saved_stamp = self._stamp()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "version": self.version,
+                "n_samples": self.ridge.n,
+                "observed": self._observed,
+                "refits": self._refits,
+                "last_solve_us": round(self._solve_us, 1),
+                "last_refit_ms": round(self._refit_ms, 3),
+                "lambda": self.model.get("lambda"),
+                "cv": self.cv if self.cv != "kfold" else f"{self.cv_folds}-fold",
+                "loaded_from": self._loaded_from,
+                "adopted": self._adopted,
+            }
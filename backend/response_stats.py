@@ -0,0 +1,28 @@
+import threading
+
+
+class ResponseStats:
+    """Per-key response size and serialization time (count, totals, EWMA, max)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, float]] = {}
+
+    def record(self, key: str, nbytes: int, serialize_s: float) -> None:
+        ms = serialize_s * 1000.0
+        with self._lock:
+            st = self._stats.setdefault(
+                key,
+                {"count": 0, "bytes_total": 0, "bytes_ewma": 0.0, "bytes_max": 0, "serialize_ms_ewma": 0.0, "serialize_ms_max": 0.0},
+            )
+            st["count"] += 1
+            st["bytes_total"] += int(nbytes)
+            first = st["count"] == 1
+            st["bytes_ewma"] = float(nbytes) if first else round(0.2 * nbytes + 0.8 * st["bytes_ewma"], 1)
+            st["bytes_max"] = max(st["bytes_max"], int(nbytes))
+            st["serialize_ms_ewma"] = round(ms if first else 0.2 * ms + 0.8 * st["serialize_ms_ewma"], 3)
+            st["serialize_ms_max"] = round(max(st["serialize_ms_max"], ms), 3)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {k: dict(v) for k, v in self._stats.items()}
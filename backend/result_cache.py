@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+
+def content_version(obj: Any) -> str:
+    """Short stable hash of a JSON-like object, used as a version for models/calibration."""
+    blob = json.dumps(obj, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:12]
+
+
+class ResultCache:
+    """LRU + TTL cache of analysis results with in-flight coalescing.
+
+    Keys are content addressed by the caller. Identical requests that arrive while the
+    first one is still computing await the same task instead of recomputing. The task
+    belongs to no request: every caller, the first included, awaits it shielded, so a
+    client that disconnects only stops its own wait and the others still get the result.
+    Runs on the event loop; the lock only guards against /health reading stats from a
+    worker thread.
+    """
+
+    def __init__(self, max_items: int, max_bytes: int, ttl_s: float):
+        self.max_items = max(0, int(max_items))
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl_s = max(0.0, float(ttl_s))
+        self._items: OrderedDict[str, tuple[float, int, Any]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._expired = 0
+        self._evicted = 0
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        return cls(
+            int(os.environ.get("DRAGON_RESULT_CACHE_SIZE", "256") or 0),
+            int(os.environ.get("DRAGON_RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)) or 0),
+            float(os.environ.get("DRAGON_RESULT_CACHE_TTL_S", "600") or 0),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0 and self.max_bytes > 0 and self.ttl_s > 0
+
+    def _lookup(self, key: str) -> Any | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            stored_at, size, value = entry
+            if now - stored_at > self.ttl_s:
+                del self._items[key]
+                self._bytes -= size
+                self._expired += 1
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def _store(self, key: str, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (time.monotonic(), int(size), value)
+            self._bytes += int(size)
+            while len(self._items) > self.max_items or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evicted += 1
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        size_of: Callable[[Any], int],
+    ) -> tuple[Any, str]:
+        """(value, "hit" | "coalesced" | "miss"); errors are shared with waiters, never cached."""
+        if not self.enabled:
+            return await compute(), "miss"
+
+        value = self._lookup(key)
+        if value is not None:
+            with self._lock:
+                self._hits += 1
+            return value, "hit"
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            with self._lock:
+                self._coalesced += 1
+            return await asyncio.shield(pending), "coalesced"
+
+        with self._lock:
+            self._misses += 1
+        task = asyncio.get_running_loop().create_task(self._compute(key, compute, size_of))
+        # Every caller may have gone; don't let an unretrieved exception get logged.
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = task
+        return await asyncio.shield(task), "miss"
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]], size_of: Callable[[Any], int]) -> Any:
+        try:
+            value = await compute()
+            self._store(key, value, size_of(value))
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._coalesced + self._misses
+            return {
+                "enabled": self.enabled,
+                "max_items": self.max_items,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "items": len(self._items),
+                "bytes": self._bytes,
+                "in_flight": len(self._inflight),
+                "hits": self._hits,
+                "coalesced": self._coalesced,
+                "misses": self._misses,
+                "expired": self._expired,
+                "evicted": self._evicted,
+                "hit_rate": round((self._hits + self._coalesced) / lookups, 4) if lookups else 0.0,
+            }
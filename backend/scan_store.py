@@ -0,0 +1,301 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+from typing import Any
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS scans (
+        id TEXT PRIMARY KEY,
+        timestamp TEXT NOT NULL,
+        batch_id TEXT,
+        grade TEXT,
+        quality_score REAL,
+        ripeness_score REAL,
+        defect_level TEXT,
+        result TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS scans_timestamp ON scans (timestamp)",
+    "CREATE INDEX IF NOT EXISTS scans_batch ON scans (batch_id, timestamp)",
+    """
+    CREATE TABLE IF NOT EXISTS rollups (
+        kind TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        quality_n INTEGER NOT NULL DEFAULT 0,
+        quality_sum REAL NOT NULL DEFAULT 0,
+        pass INTEGER NOT NULL DEFAULT 0,
+        grade_a INTEGER NOT NULL DEFAULT 0,
+        grade_b INTEGER NOT NULL DEFAULT 0,
+        grade_c INTEGER NOT NULL DEFAULT 0,
+        grade_d INTEGER NOT NULL DEFAULT 0,
+        grade_e INTEGER NOT NULL DEFAULT 0,
+        ripe_under INTEGER NOT NULL DEFAULT 0,
+        ripe_ideal INTEGER NOT NULL DEFAULT 0,
+        ripe_over INTEGER NOT NULL DEFAULT 0,
+        defect_low INTEGER NOT NULL DEFAULT 0,
+        defect_medium INTEGER NOT NULL DEFAULT 0,
+        defect_high INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (kind, bucket)
+    ) WITHOUT ROWID
+    """,
+)
+# Schema version 1 added rollups; stores created before it are backfilled once on open.
+_USER_VERSION = 1
+
+# Rollup counters, in the order of the summary() fields they feed.
+_ROLLUP_COLUMNS = (
+    "n", "quality_n", "quality_sum", "pass",
+    "grade_a", "grade_b", "grade_c", "grade_d", "grade_e",
+    "ripe_under", "ripe_ideal", "ripe_over",
+    "defect_low", "defect_medium", "defect_high",
+)
+# Buckets: hour "YYYY-MM-DDTHH", day "YYYY-MM-DD" (UTC timestamp prefixes), batch id, and all-time "".
+_HOUR, _DAY, _BATCH, _ALL = "hour", "day", "batch", "all"
+
+# Constant SQL text, so each connection's statement cache keeps them prepared.
+_UPSERT = (
+    "INSERT OR REPLACE INTO scans (id, timestamp, batch_id, grade, quality_score, ripeness_score, defect_level, result) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_GET = "SELECT result FROM scans WHERE id = ?"
+_GET_COUNTED = "SELECT timestamp, batch_id, grade, quality_score, ripeness_score, defect_level FROM scans WHERE id = ?"
+_ROLLUP_ADD = (
+    f"INSERT INTO rollups (kind, bucket, {', '.join(_ROLLUP_COLUMNS)}) "
+    f"VALUES (?, ?, {', '.join('?' for _ in _ROLLUP_COLUMNS)}) "
+    f"ON CONFLICT (kind, bucket) DO UPDATE SET {', '.join(f'{c} = {c} + excluded.{c}' for c in _ROLLUP_COLUMNS)}"
+)
+_ROLLUP_SUM = f"SELECT {', '.join(f'SUM({c})' for c in _ROLLUP_COLUMNS)} FROM rollups WHERE kind = ? AND bucket >= ? AND bucket < ?"
+_ROLLUP_GET = f"SELECT {', '.join(_ROLLUP_COLUMNS)} FROM rollups WHERE kind = ? AND bucket = ?"
+_PAGE = "SELECT result FROM scans {where} ORDER BY timestamp DESC, rowid DESC LIMIT ? OFFSET ?"
+_SUMMARY = """
+    SELECT
+        COUNT(*),
+        COUNT(quality_score),
+        TOTAL(quality_score),
+        SUM(grade IN ('A', 'B')),
+        SUM(grade = 'A'), SUM(grade = 'B'), SUM(grade = 'C'), SUM(grade = 'D'), SUM(grade = 'E'),
+        SUM(ripeness_score < 80), SUM(ripeness_score >= 80 AND ripeness_score <= 95), SUM(ripeness_score > 95),
+        SUM(defect_level = 'low'), SUM(defect_level = 'medium'), SUM(defect_level = 'high')
+    FROM scans {where}
+"""
+
+
+def _counters(grade, quality_score, ripeness_score, defect_level, sign: int = 1) -> tuple:
+    # One scan's contribution to every rollup column (negated to retract it).
+    q = quality_score is not None
+    r = ripeness_score
+    values = (
+        1, int(q), float(quality_score) if q else 0.0, int(grade in ("A", "B")),
+        int(grade == "A"), int(grade == "B"), int(grade == "C"), int(grade == "D"), int(grade == "E"),
+        int(r is not None and r < 80), int(r is not None and 80 <= r <= 95), int(r is not None and r > 95),
+        int(defect_level == "low"), int(defect_level == "medium"), int(defect_level == "high"),
+    )
+    return tuple(sign * v for v in values)
+
+
+def _buckets(timestamp: str, batch_id: str | None) -> list[tuple[str, str]]:
+    buckets = [(_ALL, ""), (_DAY, timestamp[:10]), (_HOUR, timestamp[:13])]
+    if batch_id is not None:
+        buckets.append((_BATCH, batch_id))
+    return buckets
+
+
+def _summarize(row) -> dict[str, Any]:
+    n = [v or 0 for v in row] if row else [0] * len(_ROLLUP_COLUMNS)
+    total, quality_n, quality_sum = int(n[0]), int(n[1]), float(n[2])
+    counts = [int(v) for v in n[3:]]
+    return {
+        "total": total,
+        "average_quality": quality_sum / quality_n if quality_n else None,
+        "pass_rate": counts[0] / total * 100 if total else None,
+        "grade_distribution": dict(zip(("A", "B", "C", "D", "E"), counts[1:6])),
+        "ripeness_distribution": dict(zip(("under", "ideal", "over"), counts[6:9])),
+        "defect_level_distribution": dict(zip(("low", "medium", "high"), counts[9:12])),
+    }
+
+
+def _hour_aligned(ts: str | None) -> bool:
+    # "YYYY-MM-DD" or "YYYY-MM-DDTHH[:00[:00]]" bounds can be answered from buckets alone.
+    return ts is None or len(ts) == 10 or (len(ts) >= 13 and ts[10] == "T" and ts[13:].strip(":0") == "")
+
+
+def _where(batch_id: str | None, since: str | None, until: str | None) -> tuple[str, tuple]:
+    # Every filter is served by an index: batch_id by (batch_id, timestamp), ranges by timestamp.
+    clauses, params = [], []
+    if batch_id is not None:
+        clauses.append("batch_id = ?")
+        params.append(batch_id)
+    if since is not None:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("timestamp < ?")
+        params.append(until)
+    return ("WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
+
+
+def _hour_key(ts: str) -> str:
+    return f"{ts[:10]}T{ts[11:13] if len(ts) > 10 else '00'}"
+
+
+def _range_buckets(since: str | None, until: str | None) -> list[tuple[str, str, str]]:
+    # [since, until) as (kind, lo, hi) bucket ranges: whole days from the day rollups,
+    # the partial days at either end from the hour rollups.
+    lo_hour = _hour_key(since) if since else None
+    hi_hour = _hour_key(until) if until else None
+    if lo_hour is None:
+        first_day = ""
+    elif lo_hour.endswith("T00"):
+        first_day = lo_hour[:10]
+    else:
+        first_day = (date.fromisoformat(lo_hour[:10]) + timedelta(days=1)).isoformat()
+    end_day = hi_hour[:10] if hi_hour else "\uffff"
+    if first_day >= end_day:
+        return [(_HOUR, lo_hour or "", hi_hour or "\uffff")]
+    out = [(_DAY, first_day, end_day)]
+    if lo_hour and lo_hour < f"{first_day}T00":
+        out.append((_HOUR, lo_hour, f"{first_day}T00"))
+    if hi_hour and f"{end_day}T00" < hi_hour:
+        out.append((_HOUR, f"{end_day}T00", hi_hour))
+    return out
+
+
+class ScanStore:
+    """Scan results in a WAL-mode SQLite file, shared by every worker process.
+
+    Each thread gets its own connection (WAL lets readers run alongside the single
+    writer). Rows keep the result JSON plus the columns the endpoints filter on, and
+    reads are paginated. Every write also updates per-hour, per-day, per-batch and
+    all-time rollup counters in the same transaction (a replaced scan is retracted
+    first), so summaries merge a handful of buckets instead of touching scans.
+    Timestamps are UTC ISO strings, which order lexicographically.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._rollup_reads = 0
+        self._scan_reads = 0
+        self._migrate()
+
+    @classmethod
+    def from_env(cls, default_path: str) -> "ScanStore":
+        return cls(
+            os.environ.get("DRAGON_SCAN_STORE_PATH") or default_path,
+            int(os.environ.get("DRAGON_SCAN_STORE_BUSY_TIMEOUT_MS", "5000") or 5000),
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self) -> None:
+        conn = self._conn()
+        conn.executescript(";".join(_SCHEMA))
+        with conn:
+            # BEGIN IMMEDIATE: only one worker process backfills.
+            conn.execute("BEGIN IMMEDIATE")
+            if int(conn.execute("PRAGMA user_version").fetchone()[0]) >= _USER_VERSION:
+                return
+            conn.execute("DELETE FROM rollups")
+            rows = conn.execute("SELECT timestamp, batch_id, grade, quality_score, ripeness_score, defect_level FROM scans")
+            for ts, batch_id, *counted in rows.fetchall():
+                self._add_rollups(conn, ts, batch_id, _counters(*counted))
+            conn.execute(f"PRAGMA user_version = {_USER_VERSION}")
+
+    @staticmethod
+    def _add_rollups(conn: sqlite3.Connection, timestamp: str, batch_id: str | None, counters: tuple) -> None:
+        conn.executemany(_ROLLUP_ADD, [(kind, bucket, *counters) for kind, bucket in _buckets(timestamp, batch_id)])
+
+    def put(self, result: dict[str, Any]) -> None:
+        """Insert or replace one scan result (keyed by its id) and update the rollups."""
+        # Inline previews are per-response payload, not history; previews live in PreviewStore.
+        stored = {**result, "segmentation_preview_base64": None} if result.get("segmentation_preview_base64") else result
+        row = (
+            str(result["id"]),
+            str(result["timestamp"]),
+            result.get("batch_id"),
+            result.get("grade"),
+            result.get("quality_score"),
+            result.get("ripeness_score"),
+            result.get("defect_level"),
+        )
+        conn = self._conn()
+        with conn:
+            # BEGIN IMMEDIATE: take the write lock before reading the old row, so two
+            # workers replacing the same id cannot both subtract its counters.
+            conn.execute("BEGIN IMMEDIATE")
+            old = conn.execute(_GET_COUNTED, (row[0],)).fetchone()
+            if old is not None:
+                self._add_rollups(conn, old[0], old[1], _counters(*old[2:], sign=-1))
+            conn.execute(_UPSERT, (*row, json.dumps(stored, ensure_ascii=False, default=str)))
+            self._add_rollups(conn, row[1], row[2], _counters(*row[3:]))
+        with self._lock:
+            self._writes += 1
+
+    def get(self, scan_id: str) -> dict[str, Any] | None:
+        row = self._conn().execute(_GET, (scan_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def page(
+        self,
+        limit: int,
+        offset: int = 0,
+        batch_id: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """Newest-first results matching the filters, `limit` at a time."""
+        where, params = _where(batch_id, since, until)
+        rows = self._conn().execute(_PAGE.format(where=where), (*params, int(limit), int(offset))).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def summary(self, batch_id: str | None = None, since: str | None = None, until: str | None = None) -> dict[str, Any]:
+        """Count, average quality, A/B pass rate and distributions over all matching scans.
+
+        Answered from the rollups for all-time, per-batch and hour-aligned [since, until)
+        ranges; other filters fall back to an indexed aggregate over the scans.
+        """
+        conn = self._conn()
+        if since is None and until is None:
+            kind, bucket = (_ALL, "") if batch_id is None else (_BATCH, batch_id)
+            row = conn.execute(_ROLLUP_GET, (kind, bucket)).fetchone()
+            self._count_read("_rollup_reads")
+            return _summarize(row)
+        if batch_id is None and _hour_aligned(since) and _hour_aligned(until):
+            totals = [0] * len(_ROLLUP_COLUMNS)
+            for kind, lo, hi in _range_buckets(since, until):
+                row = conn.execute(_ROLLUP_SUM, (kind, lo, hi)).fetchone()
+                totals = [t + (v or 0) for t, v in zip(totals, row)]
+            self._count_read("_rollup_reads")
+            return _summarize(totals)
+        where, params = _where(batch_id, since, until)
+        row = conn.execute(_SUMMARY.format(where=where), params).fetchone()
+        self._count_read("_scan_reads")
+        return _summarize(row)
+
+    def _count_read(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "writes": self._writes,
+                "summaries_from_rollups": self._rollup_reads,
+                "summaries_from_scans": self._scan_reads,
+            }
@@ -0,0 +1,574 @@
+import csv
+import io
+import json
+from typing import Any, Iterable, Mapping
+
+import numpy as np
+
+# Calibrated retail reference range for PH dragon fruit (PHP/kg), refreshed for current market behavior.
+PH_RETAIL_GOOD_MIN = 135.09
+PH_RETAIL_GOOD_MAX = 243.16
+PH_RETAIL_BAD_MIN = 35.0
+PH_GRADE_PRICE_BANDS = {
+    "A": (195.0, 243.16),
+    "B": (155.0, 205.0),
+    "C": (115.0, 165.0),
+    "D": (75.0, 120.0),
+    "E": (40.0, 85.0),
+}
+
+# Categorical outputs are int8 codes into these tuples. Grade codes are ranks (A best),
+# so "upgrade to floor" is a minimum and "cap" is a maximum; N/A marks invalid scans.
+GRADES = ("A", "B", "C", "D", "E", "N/A")
+GRADE_NA = 5
+LEVELS = ("low", "medium", "high")
+SIZE_CATEGORIES = ("Small", "Medium", "Large")
+AREA_ANCHORS = ("A", "B", "C", "N/A")
+DISEASE_STATUSES = (
+    "Healthy",
+    "Surface blemish detected",
+    "Possible early disease signs",
+    "High disease risk (rot/fungal)",
+    "Minor spotting with possible insect stress",
+)
+# Indexed by grade code.
+MARKET_VALUE_LABELS = ("Premium", "Standard", "Processing", "Low Value", "Rejected", "Rejected")
+SORTING_LANES = (
+    "Export / Premium",
+    "Local Market",
+    "Processing / Reject check",
+    "Low-grade / Processing",
+    "Reject / Compost",
+    "Rejected",
+)
+
+DEFAULT_CALIBRATION = {
+    "defect_medium_gate": 42.0,
+    "defect_high_gate": 60.0,
+    "fresh_quality_floor": 82.0,
+    "fresh_defect_cap": 35.0,
+    "grade_floor_c_quality": 70.0,
+    "grade_floor_b_quality": 80.0,
+}
+
+# One row per scan: the signals measured from the image, before any grading decision.
+SCORE_DTYPE = np.dtype(
+    [
+        ("is_valid_fruit", "?"),
+        ("quality_score", "f8"),
+        ("ripeness_score", "f8"),
+        ("defect_probability", "f8"),
+        ("fruit_area_ratio", "f8"),
+        ("color_score", "f8"),
+        ("shape_score", "i4"),
+        ("best_yolo_conf", "f8"),
+        ("yolo_bad_best_conf", "f8"),
+        ("yolo_bad_count", "i4"),
+        ("insect_risk_level", "i1"),
+        ("insect_risk_score", "i4"),
+    ]
+)
+SCORE_FIELDS = SCORE_DTYPE.names
+
+# One row per graded fruit: the grading decisions and measured signals its price depends on
+# (the graded quality_score, insect level after the fresh-fruit caps, as /detect reports them).
+PRICE_DTYPE = np.dtype(
+    [
+        ("grade", "i1"),
+        ("defect_level", "i1"),
+        ("insect_risk_level", "i1"),
+        ("quality_score", "f8"),
+        ("ripeness_score", "f8"),
+        ("defect_probability", "f8"),
+        ("fruit_area_ratio", "f8"),
+        ("color_score", "f8"),
+    ]
+)
+PRICE_FIELDS = PRICE_DTYPE.names
+PRICE_OUTPUTS = ("price_lo", "price_hi", "model_price_per_kg", "baseline_price_per_kg", "estimated_price_per_kg")
+_OPTIONAL = {
+    "is_valid_fruit": True,
+    "best_yolo_conf": 0.0,
+    "yolo_bad_best_conf": 0.0,
+    "yolo_bad_count": 0,
+    "insect_risk_level": "low",
+    "insect_risk_score": 0,
+}
+
+_LOW, _MEDIUM, _HIGH = 0, 1, 2
+_HEALTHY, _BLEMISH, _EARLY, _HIGH_RISK, _INSECT_SPOTTING = range(5)
+_GRADE_NUM = np.array([5.0, 4.0, 3.0, 2.0, 1.0, 0.0])
+_BAND_LO = np.array([PH_GRADE_PRICE_BANDS[g][0] for g in "ABCDE"] + [PH_GRADE_PRICE_BANDS["C"][0]])
+_BAND_HI = np.array([PH_GRADE_PRICE_BANDS[g][1] for g in "ABCDE"] + [PH_GRADE_PRICE_BANDS["C"][1]])
+
+
+def _level_code(value: Any, field: str = "insect_risk_level") -> int:
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        if 0 <= int(value) < len(LEVELS):
+            return int(value)
+    else:
+        s = str(value or "low").strip().lower()
+        if s in LEVELS:
+            return LEVELS.index(s)
+    raise ValueError(f"{field} must be one of {', '.join(LEVELS)}; got {value!r}")
+
+
+def _grade_code(value: Any) -> int:
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        if 0 <= int(value) < len(GRADES):
+            return int(value)
+    else:
+        s = str(value or "").strip().upper()
+        if s in GRADES:
+            return GRADES.index(s)
+    raise ValueError(f"grade must be one of {', '.join(GRADES)}; got {value!r}")
+
+
+def _size_code(area: np.ndarray) -> np.ndarray:
+    return np.where(area < 0.08, 0, np.where(area < 0.18, 1, 2)).astype(np.int8)
+
+
+def rows_from_columns(columns: Mapping[str, Iterable[Any]]) -> np.ndarray:
+    """SCORE_DTYPE rows from equal-length columns (insect_risk_level as names or codes)."""
+    missing = [f for f in SCORE_FIELDS if f not in columns and f not in _OPTIONAL]
+    if missing:
+        raise ValueError(f"Missing scoring fields: {', '.join(missing)}")
+    cols = {k: list(v) for k, v in columns.items() if k in SCORE_FIELDS}
+    lengths = {len(v) for v in cols.values()}
+    if len(lengths) > 1:
+        raise ValueError("Scoring columns differ in length")
+    n = lengths.pop() if lengths else 0
+    rows = np.zeros(n, dtype=SCORE_DTYPE)
+    for name in SCORE_FIELDS:
+        values = cols.get(name)
+        if values is None:
+            values = [_OPTIONAL[name]] * n
+        if name == "insect_risk_level":
+            values = [_level_code(v) for v in values]
+        rows[name] = np.asarray(values, dtype=SCORE_DTYPE[name])
+    return rows
+
+
+def rows_from_records(records: Iterable[Mapping[str, Any]]) -> np.ndarray:
+    """SCORE_DTYPE rows from one mapping per scan."""
+    records = list(records)
+    columns: dict[str, list] = {}
+    for name in SCORE_FIELDS:
+        if name in _OPTIONAL:
+            columns[name] = [r.get(name, _OPTIONAL[name]) for r in records]
+        elif all(name in r for r in records):
+            columns[name] = [r[name] for r in records]
+    return rows_from_columns(columns)
+
+
+def row_record(rows: np.ndarray, i: int = 0) -> dict[str, Any]:
+    """Row i as a JSON-friendly mapping (the inverse of rows_from_records)."""
+    row = rows[i]
+    out = {name: row[name].item() for name in SCORE_FIELDS}
+    out["insect_risk_level"] = LEVELS[int(row["insect_risk_level"])]
+    return out
+
+
+def _calibration(calibration: Mapping[str, Any] | None) -> dict[str, np.ndarray]:
+    cal = dict(DEFAULT_CALIBRATION)
+    if isinstance(calibration, Mapping):
+        cal.update({k: v for k, v in calibration.items() if k in DEFAULT_CALIBRATION})
+    return {k: np.asarray(v, dtype=float) for k, v in cal.items()}
+
+
+def _model_weight(n_samples: int) -> float:
+    if n_samples >= 120:
+        return 0.20
+    if n_samples >= 40:
+        return 0.12
+    return 0.0
+
+
+def _quality_if_low(rows: np.ndarray) -> np.ndarray:
+    # Confidence-facing quality of a row whose defect level ends up low: strong healthy
+    # detections lift it to 85/90. Rows with any other defect level keep the raw score.
+    quality = rows["quality_score"]
+    ripeness = rows["ripeness_score"]
+    best_conf = rows["best_yolo_conf"]
+    boost = rows["is_valid_fruit"] & (rows["yolo_bad_best_conf"] < 0.45)
+    m = boost & (best_conf >= 0.72) & (ripeness >= 70)
+    out = np.where(m, np.maximum(quality, 90.0), quality)
+    m = boost & ~m & (best_conf >= 0.58) & (ripeness >= 65)
+    return np.where(m, np.maximum(out, 85.0), out)
+
+
+# The only places calibration enters scoring: each is one threshold comparison per row.
+GATE_DECISIONS = (
+    "over_moderate_gate",
+    "over_medium_gate",
+    "over_weak_gate",
+    "over_high_gate",
+    "fresh",
+    "floor_c",
+    "floor_b",
+)
+
+
+def gate_decisions(rows: np.ndarray, calibration: Mapping[str, Any] | None = None) -> dict[str, np.ndarray]:
+    """Boolean outcome of every calibrated threshold for every row (see GATE_DECISIONS).
+
+    Calibration values broadcast against the rows as in score_rows(). Everything else
+    score_decided() computes is a function of the row alone.
+    """
+    cal = _calibration(calibration)
+    defect = np.clip(rows["defect_probability"], 0.0, 100.0)
+    gate_m = cal["defect_medium_gate"]
+    quality = _quality_if_low(rows)
+    return {
+        "over_moderate_gate": defect >= np.maximum(30.0, gate_m - 10.0),
+        "over_medium_gate": defect >= gate_m,
+        "over_weak_gate": defect >= np.maximum(36.0, gate_m),
+        "over_high_gate": defect >= cal["defect_high_gate"],
+        "fresh": (
+            (rows["quality_score"] >= cal["fresh_quality_floor"])
+            & (rows["ripeness_score"] >= 75)
+            & (rows["yolo_bad_best_conf"] < 0.52)
+            & (rows["yolo_bad_count"] == 0)
+            & (rows["defect_probability"] < cal["fresh_defect_cap"])
+        ),
+        # Floors only apply to low-defect rows, whose quality is the boosted one.
+        "floor_c": quality >= cal["grade_floor_c_quality"],
+        "floor_b": quality >= cal["grade_floor_b_quality"],
+    }
+
+
+def score_rows(
+    rows: np.ndarray,
+    calibration: Mapping[str, Any] | None = None,
+    price_model: Mapping[str, Any] | None = None,
+) -> dict[str, np.ndarray]:
+    """Grade, disease status, market lane and prices for every row, vectorized.
+
+    Calibration values may be scalars or arrays that broadcast against the N rows, e.g.
+    shape (G, 1) to score G parameter sets at once; outputs then have the broadcast shape.
+    `price_model` supplies `coef` and `n_samples` for the ridge price blend. Categorical
+    outputs are codes into GRADES, LEVELS, DISEASE_STATUSES and friends (see labels()).
+    """
+    return score_decided(rows, gate_decisions(rows, calibration), price_model)
+
+
+def _prices(
+    grade: np.ndarray,
+    defect_level: np.ndarray,
+    insect_level: np.ndarray,
+    quality: np.ndarray,
+    ripeness: np.ndarray,
+    defect_probability: np.ndarray,
+    area: np.ndarray,
+    color_score: np.ndarray,
+    size: np.ndarray,
+    shape: tuple[int, ...],
+    price_model: Mapping[str, Any] | None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(lo, hi, model, baseline, estimated) price per kg: grade band, ridge model blend,
+    baseline and area premium, given the grading decisions."""
+    lo = _BAND_LO[grade] * np.select([defect_level == _HIGH, defect_level == _MEDIUM], [0.88, 0.95], 1.0)
+    hi = _BAND_HI[grade] * np.select([defect_level == _HIGH, defect_level == _MEDIUM], [0.82, 0.92], 1.0)
+    lo = lo * np.select([insect_level == _HIGH, insect_level == _MEDIUM], [0.90, 0.96], 1.0)
+    hi = hi * np.select([insect_level == _HIGH, insect_level == _MEDIUM], [0.88, 0.95], 1.0)
+    lo = np.maximum(float(PH_RETAIL_BAD_MIN), lo)
+    hi = np.maximum(lo + 1.0, np.minimum(float(PH_RETAIL_GOOD_MAX), hi))
+
+    q01 = np.clip(quality / 100.0, 0.0, 1.0)
+    d01 = np.clip(defect_probability / 100.0, 0.0, 1.0)
+    r100 = np.clip(ripeness, 0.0, 100.0)
+    anchor_price = (lo + hi) / 2.0
+    ripeness_penalty = np.minimum(0.35, np.abs(r100 - 88.0) / 100.0)
+    insect_factor = np.select([insect_level == _HIGH, insect_level == _MEDIUM], [0.84, 0.93], 1.0)
+    baseline = anchor_price * (0.74 + (0.34 * q01)) * (1.0 - (0.28 * d01)) * (1.0 - ripeness_penalty) * insect_factor
+    baseline = np.clip(baseline, lo, hi)
+
+    grade_num = _GRADE_NUM[grade]
+    size_num = (size + 1).astype(np.float64)
+    model_price = np.zeros(shape)
+    coef = (price_model or {}).get("coef") or []
+    if isinstance(coef, list) and len(coef) == 8:
+        # Features as stored with each scan (rounded), one term at a time so a row
+        # prices identically whether it is scored alone or in a batch.
+        x = (
+            np.ones(shape),
+            np.round(quality, 3),
+            np.round(ripeness, 3),
+            np.round(defect_probability, 3),
+            np.round(area, 6),
+            np.round(color_score, 4),
+            grade_num,
+            size_num,
+        )
+        for xi, ci in zip(x, coef):
+            model_price = model_price + xi * float(ci)
+    weight = _model_weight(int((price_model or {}).get("n_samples") or 0))
+
+    blend = (model_price > 0) & (weight > 0)
+    model_price = np.where(blend, np.clip(model_price, lo, hi), model_price)
+    estimated = np.where(blend, (weight * model_price) + ((1.0 - weight) * baseline), baseline)
+    area_factor = np.clip(0.82 + (area * 1.10), 0.82, 1.16)
+    estimated = estimated * area_factor
+    model_price = np.where(model_price != 0, np.clip(model_price * area_factor, lo, hi), 0.0)
+    baseline = np.where(baseline != 0, np.clip(baseline * area_factor, lo, hi), 0.0)
+    estimated = np.clip(estimated, lo, hi)
+
+    return lo, hi, model_price, baseline, estimated
+
+
+def score_decided(
+    rows: np.ndarray,
+    decided: Mapping[str, np.ndarray],
+    price_model: Mapping[str, Any] | None = None,
+) -> dict[str, np.ndarray]:
+    """score_rows() given the gate_decisions() outcomes, which broadcast against the rows."""
+    valid = rows["is_valid_fruit"]
+    quality_raw = rows["quality_score"]
+    ripeness = rows["ripeness_score"]
+    defect_probability = rows["defect_probability"]
+    area = rows["fruit_area_ratio"]
+    color_score = rows["color_score"]
+    best_conf = rows["best_yolo_conf"]
+    bad_conf_raw = rows["yolo_bad_best_conf"]
+    bad_count = rows["yolo_bad_count"].astype(np.int64)
+    insect_level_raw = rows["insect_risk_level"].astype(np.int8)
+    insect_score_raw = rows["insect_risk_score"].astype(np.int64)
+    shape_score = rows["shape_score"].astype(np.float64)
+    shape = np.broadcast_shapes(rows.shape, *(np.shape(decided[k]) for k in GATE_DECISIONS))
+
+    # --- Disease status from the defect heuristic, disease model and insect signal.
+    conf = np.clip(bad_conf_raw, 0.0, 1.0)
+    q = np.clip(quality_raw, 0.0, 100.0)
+    i_score = np.clip(insect_score_raw, 0, 100)
+    n_bad = np.maximum(0, bad_count)
+
+    strong = (conf >= 0.90) | ((conf >= 0.80) & (n_bad >= 2))
+    moderate = (conf >= 0.72) | ((conf >= 0.66) & (n_bad >= 2))
+    weak = (conf >= 0.58) | (n_bad >= 1)
+    low_light = q < 74.0
+    high_ctx = decided["over_high_gate"] & low_light & (i_score >= 72)
+    medium_ctx = decided["over_medium_gate"] & (low_light | (i_score >= 72))
+    conditions = [
+        strong,
+        moderate & decided["over_moderate_gate"],
+        high_ctx & ((insect_level_raw == _HIGH) | (i_score >= 80)),
+        medium_ctx | (weak & decided["over_weak_gate"]),
+    ]
+    defect_level = np.select(conditions, [_HIGH, _MEDIUM, _HIGH, _MEDIUM], _LOW).astype(np.int8)
+    disease = np.select(conditions, [_HIGH_RISK, _EARLY, _HIGH_RISK, _BLEMISH], _HEALTHY).astype(np.int8)
+    defect_level = np.broadcast_to(defect_level, shape).copy()
+    disease = np.broadcast_to(disease, shape).copy()
+    insect_level = np.broadcast_to(insect_level_raw, shape).copy()
+    insect_score = np.broadcast_to(insect_score_raw, shape).copy()
+
+    # --- Fresh fruit with no disease evidence is Healthy; texture-only insect alarms are capped.
+    fresh = np.broadcast_to(decided["fresh"], shape)
+    defect_level[fresh] = _LOW
+    disease[fresh] = _HEALTHY
+    m = fresh & (insect_level == _HIGH)
+    insect_level[m] = _MEDIUM
+    insect_score[m] = np.minimum(insect_score[m], 55)
+    m = fresh & ~m & (insect_level == _MEDIUM)
+    insect_score[m] = np.minimum(insect_score[m], 45)
+
+    # Keep insect risk as a separate signal; do not force disease status without disease-model evidence.
+    high_insect = (insect_level == _HIGH) & (bad_conf_raw < 0.68)
+    m = high_insect & (defect_level == _LOW)
+    insect_level[m] = _MEDIUM
+    insect_score[m] = np.minimum(insect_score[m], 55)
+    m = high_insect & ~m & (defect_level == _MEDIUM) & (disease != _HEALTHY)
+    disease[m] = _INSECT_SPOTTING
+
+    # Keep confidence-facing quality high when healthy detections are strong.
+    quality = np.where(defect_level == _LOW, _quality_if_low(rows), quality_raw)
+
+    # --- Quality index: visual quality, ripeness fit, defect/insect evidence and shape.
+    size = _size_code(area)
+    ripeness_fit = np.clip(100.0 - (np.abs(ripeness - 88.0) * 2.0), 0.0, 100.0)
+    quality_index = (
+        (0.30 * np.clip(quality, 0.0, 100.0))
+        + (0.19 * ripeness_fit)
+        + (0.21 * np.clip(100.0 - (defect_probability * 1.15), 0.0, 100.0))
+        + (0.09 * np.clip(100.0 - (insect_score * 0.75), 0.0, 100.0))
+        + (0.07 * np.clip((shape_score / 10.0) * 100.0, 0.0, 100.0))
+        + (0.06 * np.clip(best_conf * 100.0, 45.0, 100.0))
+        + (0.08 * np.clip(((area - 0.06) / 0.38) * 100.0, 0.0, 100.0))
+    )
+    quality_index = quality_index + np.select([size == 2, size == 1], [1.5, 0.8], -0.8)
+    quality_index = quality_index + np.select([color_score >= 7.0, color_score <= 2.5], [0.8, -0.8], 0.0)
+    quality_index = quality_index + np.select([defect_level == _HIGH, defect_level == _MEDIUM], [-7.0, -2.5], 0.0)
+    quality_index = quality_index + np.select([bad_conf_raw >= 0.86, bad_conf_raw >= 0.68], [-5.0, -2.0], 0.0)
+    quality_index = np.clip(quality_index, 0.0, 100.0)
+
+    # --- Grade (A best -> E worst) from the index, then evidence-based floors and caps.
+    s = np.clip(quality_index, 0.0, 100.0)
+    grade = np.where(s >= 75, 0, np.where(s >= 55, 1, 2)).astype(np.int8)
+    for demote in (defect_level == _HIGH, insect_level == _HIGH, bad_conf_raw >= 0.86):
+        grade = np.where(demote & (grade <= 1), np.minimum(4, grade + 1), grade)
+    healthy_low = (disease == _HEALTHY) & (defect_level == _LOW)
+    grade = np.where(healthy_low & decided["floor_c"] & (ripeness >= 65), np.minimum(grade, 2), grade)
+    fresh_floor = fresh & (defect_level == _LOW)
+    b_floor = fresh_floor | (healthy_low & decided["floor_b"] & (ripeness >= 75))
+    grade = np.where(b_floor, np.minimum(grade, 1), grade)
+
+    # Area-based floor: bigger segmented fruit area trends to a better grade, within disease limits.
+    anchor = np.where(area <= 0.0, 3, np.where(area < 0.03, 2, np.where(area < 0.10, 1, 0))).astype(np.int8)
+    area_ok = (defect_level == _LOW) & (insect_level != _HIGH)
+    grade = np.where(((anchor == 0) | (anchor == 1)) & area_ok, np.minimum(grade, 1), grade)
+    grade = np.where((anchor == 0) & area_ok & (quality >= 80) & (bad_conf_raw < 0.62), np.minimum(grade, 0), grade)
+    # Keep valid fruit in A/B/C bands; strict area cap only for tiny coverage or weak detection.
+    grade = np.minimum(grade, 2)
+    cap_c = (anchor == 2) & ((area < 0.03) | (best_conf < 0.42))
+    grade = np.where(cap_c, np.maximum(grade, 2), grade)
+    grade = np.where(~cap_c & (anchor == 1) & (defect_level != _LOW), np.maximum(grade, 1), grade)
+    grade = np.where(valid, grade, GRADE_NA).astype(np.int8)
+
+    # --- Prices: grade band, ridge model blend, baseline and area premium.
+    lo, hi, model_price, baseline, estimated = _prices(
+        grade, defect_level, insect_level, quality, ripeness, defect_probability, area, color_score, size, shape, price_model
+    )
+    grade_num = _GRADE_NUM[grade]
+    size_num = (size + 1).astype(np.float64)
+
+    zero = np.zeros(shape)
+    market_score = np.select(
+        [grade == 0, grade == 1, grade == 2, grade == 3],
+        [
+            np.where(defect_level == _LOW, 92, 85),
+            np.where(defect_level != _HIGH, 75, 62),
+            np.where(defect_level != _HIGH, 55, 35),
+            32,
+        ],
+        0,
+    ).astype(np.int32)
+    return {
+        "grade": grade,
+        "quality_index": quality_index,
+        "quality_score": quality,
+        "defect_level": defect_level,
+        "disease_status": disease,
+        "insect_risk_level": insect_level,
+        "insect_risk_score": insect_score.astype(np.int32),
+        "fresh_candidate": np.broadcast_to(fresh, shape),
+        "size_category": np.broadcast_to(size, shape),
+        "area_grade_anchor": np.broadcast_to(anchor, shape),
+        "grade_num": grade_num,
+        "size_num": np.broadcast_to(size_num, shape),
+        "market_value_score": market_score,
+        "price_lo": np.where(valid, lo, zero),
+        "price_hi": np.where(valid, hi, zero),
+        "model_price_per_kg": np.where(valid, model_price, zero),
+        "baseline_price_per_kg": np.where(valid, baseline, zero),
+        "estimated_price_per_kg": np.where(valid, estimated, zero),
+    }
+
+
+def price_inputs_from_columns(columns: Mapping[str, Iterable[Any]]) -> np.ndarray:
+    """PRICE_DTYPE rows from equal-length columns (grade and levels as names or codes)."""
+    missing = [f for f in PRICE_FIELDS if f not in columns]
+    if missing:
+        raise ValueError(f"Missing pricing fields: {', '.join(missing)}")
+    cols = {name: list(columns[name]) for name in PRICE_FIELDS}
+    lengths = {len(v) for v in cols.values()}
+    if len(lengths) > 1:
+        raise ValueError("Pricing columns differ in length")
+    rows = np.zeros(lengths.pop(), dtype=PRICE_DTYPE)
+    for name in PRICE_FIELDS:
+        values = cols[name]
+        if name == "grade":
+            values = [_grade_code(v) for v in values]
+        elif name in ("defect_level", "insect_risk_level"):
+            values = [_level_code(v, name) for v in values]
+        rows[name] = np.asarray(values, dtype=PRICE_DTYPE[name])
+    return rows
+
+
+def price_inputs_from_records(records: Iterable[Mapping[str, Any]]) -> np.ndarray:
+    """PRICE_DTYPE rows from one mapping per fruit (e.g. /detect results or a parsed manifest)."""
+    records = list(records)
+    columns = {name: [r[name] for r in records] for name in PRICE_FIELDS if all(name in r for r in records)}
+    return price_inputs_from_columns(columns)
+
+
+def price_inputs_record(rows: np.ndarray, scored: Mapping[str, np.ndarray], i: int = 0) -> dict[str, Any]:
+    """Row i's PRICE_FIELDS at full precision, grade and levels as names.
+
+    This is the `price_inputs` record /detect returns and logs with each scan, and the
+    row shape /price/predict accepts, so re-quoting a scan reproduces its prices exactly.
+    """
+    names = {"grade": GRADES, "defect_level": LEVELS, "insect_risk_level": LEVELS}
+    out: dict[str, Any] = {}
+    for name in PRICE_FIELDS:
+        source = scored if name in scored else rows
+        value = np.broadcast_to(source[name], np.shape(scored["grade"]))[i].item()
+        out[name] = names[name][value] if name in names else float(value)
+    return out
+
+
+def manifest_records(text: str, fmt: str) -> list[dict[str, Any]]:
+    """Records of a "csv" (header row, one fruit per line) or "ndjson" manifest."""
+    if fmt == "csv":
+        return [dict(r) for r in csv.DictReader(io.StringIO(text))]
+    if fmt == "ndjson":
+        records = []
+        for n, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {n} is not JSON: {e}") from None
+            if not isinstance(record, dict):
+                raise ValueError(f"Line {n} is not a JSON object")
+            records.append(record)
+        return records
+    raise ValueError(f"Unsupported manifest format {fmt!r}; use csv or ndjson")
+
+
+def price_rows(rows: np.ndarray, price_model: Mapping[str, Any] | None = None) -> dict[str, np.ndarray]:
+    """Price per kg (PRICE_OUTPUTS) for PRICE_DTYPE rows, vectorized.
+
+    Runs the pricing stage of score_rows() on decisions that were already made, so a fruit
+    quoted here gets exactly the prices its scan got from the same inputs and model.
+    """
+    grade = rows["grade"]
+    area = rows["fruit_area_ratio"]
+    lo, hi, model_price, baseline, estimated = _prices(
+        grade,
+        rows["defect_level"],
+        rows["insect_risk_level"],
+        rows["quality_score"],
+        rows["ripeness_score"],
+        rows["defect_probability"],
+        area,
+        rows["color_score"],
+        _size_code(area),
+        rows.shape,
+        price_model,
+    )
+    valid = grade != GRADE_NA
+    zero = np.zeros(rows.shape)
+    prices = (lo, hi, model_price, baseline, estimated)
+    return {name: np.where(valid, value, zero) for name, value in zip(PRICE_OUTPUTS, prices)}
+
+
+def labels(scored: Mapping[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """String arrays for the categorical outputs of score_rows()."""
+    grade = scored["grade"]
+    return {
+        "grade": np.asarray(GRADES, dtype=object)[grade],
+        "defect_level": np.asarray(LEVELS, dtype=object)[scored["defect_level"]],
+        "disease_status": np.asarray(DISEASE_STATUSES, dtype=object)[scored["disease_status"]],
+        "insect_risk_level": np.asarray(LEVELS, dtype=object)[scored["insect_risk_level"]],
+        "size_category": np.asarray(SIZE_CATEGORIES, dtype=object)[scored["size_category"]],
+        "area_grade_anchor": np.asarray(AREA_ANCHORS, dtype=object)[scored["area_grade_anchor"]],
+        "market_value_label": np.asarray(MARKET_VALUE_LABELS, dtype=object)[grade],
+        "sorting_lane": np.asarray(SORTING_LANES, dtype=object)[grade],
+    }
+
+
+def scored_row(scored: Mapping[str, np.ndarray], i: int = 0) -> dict[str, Any]:
+    """Row i of score_rows() output as Python scalars, categorical codes decoded."""
+    out = {k: v[i].item() for k, v in scored.items()}
+    out.update({k: v[i] for k, v in labels(scored).items()})
+    return out
@@ -0,0 +1,409 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts fall back to an in-process lock
+    fcntl = None
+
+SEGMENT_SUFFIX = ".jsonl.gz"
+SEALING_SUFFIX = ".sealing"
+INDEX_NAME = "index.jsonl"
+
+_THREAD_LOCKS: dict[str, threading.Lock] = {}
+_THREAD_LOCKS_GUARD = threading.Lock()
+
+
+def _timestamp(record: Any) -> str | None:
+    ts = record.get("timestamp") if isinstance(record, dict) else None
+    return ts if isinstance(ts, str) and ts else None
+
+
+def _in_window(first: str | None, last: str | None, since: str | None, until: str | None) -> bool:
+    # Untimed records/blocks are always read; windows are [since, until) on ISO strings.
+    if since is not None and last is not None and last < since:
+        return False
+    if until is not None and first is not None and first >= until:
+        return False
+    return True
+
+
+def _parse_lines(data: bytes, since: str | None, until: str | None) -> Iterator[dict]:
+    for raw in data.split(b"\n"):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except Exception:
+            continue
+        ts = _timestamp(record)
+        if ts is None or _in_window(ts, ts, since, until):
+            yield record
+
+
+class SegmentedLog:
+    """Time-bounded, compressed segments behind one append-only JSONL log.
+
+    `path` (e.g. data/scans.jsonl) stays the active segment that writers append to. Once
+    a record of a new `period_s` window arrives, or the active file reaches `max_bytes`,
+    it is sealed into `<log>.segments/<log>-<first timestamp>-<seq>.jsonl.gz`. Sealed
+    segments are written as one gzip member per `block_records` records, so each block
+    can be read and decompressed on its own; `index.jsonl` next to them lists every
+    segment with its time range and per-block [first_ts, last_ts, offset, length,
+    records]. `read(since, until)` uses it to skip whole segments and blocks outside a
+    window and streams the rest, then the active file.
+
+    Sealing takes an exclusive flock on `<log>.segments/.lock`; appends and read
+    snapshots take it shared, so several workers can share a log.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        period_s: float = 86400.0,
+        max_bytes: int = 64 << 20,
+        block_records: int = 1000,
+        compresslevel: int = 6,
+    ):
+        self.path = path
+        self.period_s = max(1.0, float(period_s))
+        self.max_bytes = max(0, int(max_bytes))
+        self.block_records = max(1, int(block_records))
+        self.compresslevel = min(9, max(1, int(compresslevel)))
+        root, _ = os.path.splitext(path)
+        self.stem = os.path.basename(root)
+        self.dir = f"{root}.segments"
+        self.index_path = os.path.join(self.dir, INDEX_NAME)
+        self._active: tuple[int, int | None] | None = None
+        self._seals = 0
+        self._seal_ms = 0.0
+
+    @classmethod
+    def from_env(cls, path: str) -> "SegmentedLog":
+        return cls(
+            path,
+            period_s=float(os.environ.get("DRAGON_LOG_SEGMENT_HOURS", "24") or 24) * 3600.0,
+            max_bytes=int(float(os.environ.get("DRAGON_LOG_SEGMENT_MAX_MB", "64") or 0) * (1 << 20)),
+            block_records=int(os.environ.get("DRAGON_LOG_BLOCK_RECORDS", "1000") or 1000),
+            compresslevel=int(os.environ.get("DRAGON_LOG_COMPRESSLEVEL", "6") or 6),
+        )
+
+    @contextmanager
+    def lock(self, shared: bool = False):
+        if fcntl is None:
+            with _THREAD_LOCKS_GUARD:
+                thread_lock = _THREAD_LOCKS.setdefault(os.path.abspath(self.dir), threading.Lock())
+            with thread_lock:
+                yield
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        # A fresh open file description per holder, so flock also orders threads of one process.
+        with open(os.path.join(self.dir, ".lock"), "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def window(self, ts: str | None) -> int | None:
+        if ts is None:
+            return None
+        try:
+            dt = datetime.fromisoformat(ts)
+        except ValueError:
+            return None
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp() // self.period_s)
+
+    def _first_timestamp(self, path: str) -> str | None:
+        try:
+            with open(path, "rb") as f:
+                for raw in f:
+                    if raw.strip():
+                        try:
+                            return _timestamp(json.loads(raw))
+                        except Exception:
+                            return None
+        except OSError:
+            pass
+        return None
+
+    def due(self, next_ts: str | None) -> bool:
+        """Whether the active segment should be sealed before appending a record stamped `next_ts`."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        if st.st_size == 0:
+            return False
+        if self.max_bytes and st.st_size >= self.max_bytes:
+            return True
+        if self._active is None or self._active[0] != st.st_ino:
+            self._active = (st.st_ino, self.window(self._first_timestamp(self.path)))
+        active = self._active[1]
+        incoming = self.window(next_ts or datetime.now(timezone.utc).isoformat())
+        return active is not None and incoming is not None and incoming != active
+
+    def _index(self) -> list[dict]:
+        entries = []
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except Exception:
+                        continue
+                    if isinstance(entry, dict) and entry.get("file"):
+                        entries.append(entry)
+        except OSError:
+            pass
+        return entries
+
+    def _compress(self, source: str, name: str, seq: int) -> dict:
+        target = os.path.join(self.dir, name)
+        tmp = f"{target}.tmp"
+        blocks: list[list] = []
+        first_ts = last_ts = None
+        records = raw_bytes = offset = 0
+
+        def flush_block(lines: list[bytes], lo: str | None, hi: str | None) -> None:
+            nonlocal first_ts, last_ts, records, offset
+            member = gzip.compress(b"".join(lines), compresslevel=self.compresslevel, mtime=0)
+            out.write(member)
+            blocks.append([lo, hi, offset, len(member), len(lines)])
+            offset += len(member)
+            records += len(lines)
+            if lo is not None and (first_ts is None or lo < first_ts):
+                first_ts = lo
+            if hi is not None and (last_ts is None or hi > last_ts):
+                last_ts = hi
+
+        with open(source, "rb") as src, open(tmp, "wb") as out:
+            lines: list[bytes] = []
+            lo = hi = None
+            for raw in src:
+                if not raw.strip():
+                    continue
+                if not raw.endswith(b"\n"):
+                    raw += b"\n"
+                try:
+                    ts = _timestamp(json.loads(raw))
+                except Exception:
+                    ts = None
+                if ts is not None:
+                    lo = ts if lo is None or ts < lo else lo
+                    hi = ts if hi is None or ts > hi else hi
+                lines.append(raw)
+                raw_bytes += len(raw)
+                if len(lines) >= self.block_records:
+                    flush_block(lines, lo, hi)
+                    lines, lo, hi = [], None, None
+            if lines:
+                flush_block(lines, lo, hi)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, target)
+        return {
+            "file": name,
+            "seq": seq,
+            "first_ts": first_ts,
+            "last_ts": last_ts,
+            "records": records,
+            "raw_bytes": raw_bytes,
+            "bytes": offset,
+            "sealed_at": datetime.now(timezone.utc).isoformat(),
+            "blocks": blocks,
+        }
+
+    def _append_index(self, entry: dict) -> None:
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with open(self.index_path, "ab") as f:
+            # A torn line from an interrupted seal must not swallow this one.
+            if f.tell() > 0:
+                with open(self.index_path, "rb") as r:
+                    r.seek(-1, os.SEEK_END)
+                    if r.read(1) != b"\n":
+                        line = "\n" + line
+            f.write(line.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _finish(self, sealing: str, indexed: set[str], seq: int) -> dict | None:
+        name = os.path.basename(sealing)[: -len(SEALING_SUFFIX)]
+        entry = None
+        if name not in indexed:
+            entry = self._compress(sealing, name, seq)
+            self._append_index(entry)
+        os.unlink(sealing)
+        return entry
+
+    def _pending(self) -> list[str]:
+        try:
+            names = sorted(n for n in os.listdir(self.dir) if n.endswith(SEALING_SUFFIX))
+        except OSError:
+            return []
+        return [os.path.join(self.dir, n) for n in names]
+
+    def recover(self) -> int:
+        """Complete seals interrupted by a crash; returns how many were finished."""
+        pending = self._pending()
+        if not pending:
+            return 0
+        with self.lock():
+            index = self._index()
+            indexed = {e["file"] for e in index}
+            done = 0
+            for sealing in self._pending():
+                if self._finish(sealing, indexed, len(index) + done) is not None:
+                    done += 1
+            return done
+
+    def seal(self, next_ts: str | None = None, force: bool = False) -> dict | None:
+        """Seal the active segment if it is still `due` once the exclusive lock is held."""
+        started = time.perf_counter()
+        with self.lock():
+            self._active = None
+            if not force and not self.due(next_ts):
+                return None
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                return None
+            index = self._index()
+            first = self._first_timestamp(self.path) or datetime.now(timezone.utc).isoformat()
+            label = first[:19].replace(":", "").replace("-", "")
+            name = f"{self.stem}-{label}-{len(index):05d}{SEGMENT_SUFFIX}"
+            sealing = os.path.join(self.dir, name + SEALING_SUFFIX)
+            # Rename first: writers reopen a fresh active file, and a crash after this
+            # point is finished by recover() rather than leaving a half-sealed log.
+            os.replace(self.path, sealing)
+            entry = self._finish(sealing, {e["file"] for e in index}, len(index))
+            self._active = None
+        self._seals += 1
+        self._seal_ms += (time.perf_counter() - started) * 1000.0
+        return entry
+
+    def _snapshot(self) -> tuple[list[dict], list[str], Any]:
+        # Index, unfinished seals and an open handle on the active file, taken together so a
+        # concurrent seal can neither hide records nor show them twice.
+        with self.lock(shared=True):
+            index = self._index()
+            indexed = {e["file"] for e in index}
+            pending = [p for p in self._pending() if os.path.basename(p)[: -len(SEALING_SUFFIX)] not in indexed]
+            try:
+                active = open(self.path, "rb")
+            except OSError:
+                active = None
+        return index, pending, active
+
+    def read(self, since: str | None = None, until: str | None = None) -> Iterator[dict]:
+        """Records with `since <= timestamp < until` (either bound optional), oldest segment first."""
+        if not os.path.isdir(self.dir):
+            # Never sealed: plain JSONL, no need to create the segment directory for a lock.
+            try:
+                index, pending, active = [], [], open(self.path, "rb")
+            except OSError:
+                return
+        else:
+            index, pending, active = self._snapshot()
+        try:
+            for entry in index:
+                if not _in_window(entry.get("first_ts"), entry.get("last_ts"), since, until):
+                    continue
+                try:
+                    f = open(os.path.join(self.dir, entry["file"]), "rb")
+                except OSError:
+                    continue
+                with f:
+                    for lo, hi, offset, length, _ in entry.get("blocks") or []:
+                        if not _in_window(lo, hi, since, until):
+                            continue
+                        f.seek(offset)
+                        yield from _parse_lines(gzip.decompress(f.read(length)), since, until)
+            for sealing in pending:
+                try:
+                    with open(sealing, "rb") as f:
+                        yield from _parse_lines(f.read(), since, until)
+                except OSError:
+                    continue
+            if active is not None:
+                for raw in active:
+                    # A line still being appended has no newline yet; it belongs to the next read.
+                    if raw.endswith(b"\n"):
+                        yield from _parse_lines(raw, since, until)
+        finally:
+            if active is not None:
+                active.close()
+
+    def version(self) -> tuple:
+        """Changes whenever a record is appended or a segment is sealed."""
+        key = []
+        for p in (self.path, self.index_path):
+            try:
+                st = os.stat(p)
+                key.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except OSError:
+                key.append(None)
+        return tuple(key)
+
+    def stats(self) -> dict:
+        index = self._index()
+        raw = sum(int(e.get("raw_bytes") or 0) for e in index)
+        packed = sum(int(e.get("bytes") or 0) for e in index)
+        try:
+            active_bytes = os.path.getsize(self.path)
+        except OSError:
+            active_bytes = 0
+        return {
+            "segments": len(index),
+            "sealed_records": sum(int(e.get("records") or 0) for e in index),
+            "sealed_bytes": packed,
+            "compression_ratio": round(raw / packed, 2) if packed else None,
+            "first_ts": index[0].get("first_ts") if index else None,
+            "active_bytes": active_bytes,
+            "seals": self._seals,
+            "avg_seal_ms": round(self._seal_ms / self._seals, 1) if self._seals else 0.0,
+        }
+
+
+def read_log(path: str, since: str | None = None, until: str | None = None) -> Iterator[dict]:
+    """Stream the records of a (possibly segmented) JSONL log, optionally limited to a time window."""
+    return SegmentedLog(path).read(since, until)
+
+
+def log_version(path: str) -> tuple:
+    return SegmentedLog(path).version()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Export or seal a segmented JSONL log (scans.jsonl, labels.jsonl).")
+    parser.add_argument("log", help="Path of the active log, e.g. backend/data/scans.jsonl")
+    parser.add_argument("--since", help="Inclusive lower bound on record timestamps (ISO date or datetime)")
+    parser.add_argument("--until", help="Exclusive upper bound on record timestamps")
+    parser.add_argument("--seal", action="store_true", help="Seal the active segment now instead of exporting")
+    parser.add_argument("--stats", action="store_true", help="Print segment statistics instead of exporting")
+    args = parser.parse_args(argv)
+
+    log = SegmentedLog.from_env(args.log)
+    log.recover()
+    if args.seal:
+        print(json.dumps({k: v for k, v in (log.seal(force=True) or {}).items() if k != "blocks"}))
+        return 0
+    if args.stats:
+        print(json.dumps(log.stats(), indent=2))
+        return 0
+    out = sys.stdout
+    for record in log.read(args.since, args.until):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,13 @@ import uuid
 from dataclasses import asdict
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
 import numpy as np
+from PIL import Image
+
+# Longest edge of the view blur and contrast are measured on (see quality_view).
+QUALITY_SIDE = 256
 
 
 def _utc_now_iso() -> str:
@@ -17,16 +21,34 @@ def _ensure_dir(p: Path) -> None:
     p.mkdir(parents=True, exist_ok=True)
 
 
-def compute_image_quality(rgb: np.ndarray) -> dict[str, float]:
+def quality_view(rgb: np.ndarray, side: int = QUALITY_SIDE) -> np.ndarray:
+    """`rgb` box-resampled to `side` pixels on its longest edge; smaller images as-is.
+
+    Laplacian variance and contrast depend on pixel scale, so they are measured on this
+    fixed-size view: a blur threshold then means the same whether the image was decoded
+    at full size or at a reduced DCT scale. Averaging down by 2x or more also absorbs the
+    pixel-level differences between those decodes (analysis and ingest decode at >= 1024).
+    """
+    h, w = rgb.shape[:2]
+    if max(w, h) <= int(side):
+        return rgb
+    ratio = float(side) / float(max(w, h))
+    size = (max(1, int(round(w * ratio))), max(1, int(round(h * ratio))))
+    return np.asarray(Image.fromarray(rgb).resize(size, Image.BOX))
+
+
+def compute_image_quality(rgb: np.ndarray, gray: np.ndarray | None = None) -> dict[str, float]:
     """Cheap, robust image quality features.
 
     rgb: uint8 HxWx3
+    gray: optional precomputed float32 luma of `rgb` (0.299R + 0.587G + 0.114B)
     """
     if rgb.ndim != 3 or rgb.shape[-1] != 3:
         return {"brightness": 0.0, "contrast": 0.0, "blur": 0.0, "saturation": 0.0}
 
     arr = rgb.astype(np.float32)
-    gray = (0.299 * arr[..., 0] + 0.587 * arr[..., 1] + 0.114 * arr[..., 2]).astype(np.float32)
+    if gray is None:
+        gray = (0.299 * arr[..., 0] + 0.587 * arr[..., 1] + 0.114 * arr[..., 2]).astype(np.float32)
     brightness = float(np.mean(gray) / 255.0)
     contrast = float(np.std(gray) / 255.0)
 
@@ -64,14 +86,14 @@ def should_collect_sample(
     min_relevance: float = 0.08,
     conf_low: float = 0.35,
     conf_high: float = 0.60,
-    min_blur: float = 25.0,
+    min_blur: float = 300.0,
 ) -> tuple[bool, list[str]]:
     """Active-learning policy.
 
     Collect samples that are likely informative:
     - YOLO has a detection but is unsure (conf in [conf_low, conf_high])
     - YOLO has no detections but the image *looks* fruit-like (relevance_ratio >= min_relevance)
-    - Image is not too blurry (min_blur)
+    - Image is not too blurry (min_blur, on the quality_view() of the image)
     """
     reasons: list[str] = []
     det_confs = [float(d.get("conf", 0.0)) for d in (yolo_detections or []) if isinstance(d, dict)]
@@ -98,8 +120,12 @@ def save_training_sample(
     out_root: Path,
     metadata: dict[str, Any],
     queue_jsonl: Path,
+    append_jsonl: Callable[[Path, dict[str, Any]], None] | None = None,
 ) -> dict[str, Any]:
-    """Persist image + metadata into a lightweight queue for later labeling/pseudo-labeling."""
+    """Persist image + metadata into a lightweight queue for later labeling/pseudo-labeling.
+
+    `append_jsonl`, when given, takes over the queue write (e.g. a background log writer).
+    """
     _ensure_dir(out_root)
     _ensure_dir(queue_jsonl.parent)
 
@@ -123,8 +149,11 @@ def save_training_sample(
     with open(img_path, "wb") as f:
         f.write(image_bytes)
 
-    with open(queue_jsonl, "a", encoding="utf-8") as f:
-        f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+    if append_jsonl is not None:
+        append_jsonl(queue_jsonl, meta)
+    else:
+        with open(queue_jsonl, "a", encoding="utf-8") as f:
+            f.write(json.dumps(meta, ensure_ascii=False) + "\n")
 
     return meta
 
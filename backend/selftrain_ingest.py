@@ -9,11 +9,14 @@ from pathlib import Path
 from PIL import Image
 import numpy as np
 
+from image_decode import ImageTooLarge, open_image
+from selftrain.collector import quality_view
 from yolo_runtime import Detection, get_yolo_runtime
 
 
 def _quality_ok(im: Image.Image, *, min_blur: float, min_brightness: float, max_brightness: float) -> tuple[bool, dict]:
-  arr = np.array(im.convert("RGB"), dtype=np.uint8)
+  # Measured on the fixed-size view, so --min-blur does not depend on --max-side.
+  arr = quality_view(np.array(im.convert("RGB"), dtype=np.uint8))
   gray = (0.299 * arr[..., 0] + 0.587 * arr[..., 1] + 0.114 * arr[..., 2]).astype(np.float32)
   brightness = float(np.mean(gray) / 255.0)
 
@@ -70,6 +73,7 @@ def ingest(
   min_brightness: float,
   max_brightness: float,
   max_dets: int,
+  max_side: int = 1280,
 ):
   rt = get_yolo_runtime()
   if rt is None:
@@ -97,7 +101,11 @@ def ingest(
 
   written = 0
   for src in images:
-    im = Image.open(src).convert("RGB")
+    # YOLO trains at 640px, so decode straight to a reduced scale; labels follow the saved size.
+    try:
+      im, _ = open_image(src, max_side=int(max_side))
+    except ImageTooLarge:
+      continue
     ok, q = _quality_ok(im, min_blur=float(min_blur), min_brightness=float(min_brightness), max_brightness=float(max_brightness))
     if not ok:
       continue
@@ -155,10 +163,11 @@ def main():
   parser.add_argument("--valid-split", type=float, default=0.1)
   parser.add_argument("--seed", type=int, default=7)
   parser.add_argument("--limit", type=int, default=None)
-  parser.add_argument("--min-blur", type=float, default=25.0)
+  parser.add_argument("--min-blur", type=float, default=300.0)
   parser.add_argument("--min-brightness", type=float, default=0.08)
   parser.add_argument("--max-brightness", type=float, default=0.98)
   parser.add_argument("--max-dets", type=int, default=3)
+  parser.add_argument("--max-side", type=int, default=1280, help="Decode at reduced scale down to this longest side (0 = full size)")
   args = parser.parse_args()
 
   info = ingest(
@@ -172,6 +181,7 @@ def main():
     min_brightness=args.min_brightness,
     max_brightness=args.max_brightness,
     max_dets=args.max_dets,
+    max_side=args.max_side,
   )
   print(info["dataset_dir"])
   print(info["written"])
@@ -32,7 +32,7 @@ def main():
     parser.add_argument("--min-conf", type=float, default=0.55)
     parser.add_argument("--valid-split", type=float, default=0.1)
     parser.add_argument("--pseudo-limit", type=int, default=100)
-    parser.add_argument("--min-blur", type=float, default=25.0)
+    parser.add_argument("--min-blur", type=float, default=300.0)
     parser.add_argument("--min-brightness", type=float, default=0.08)
     parser.add_argument("--max-brightness", type=float, default=0.98)
     parser.add_argument("--max-dets", type=int, default=3)
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[..., Any]
+    deps: tuple[str, ...] = field(default_factory=tuple)
+
+
+class StageGraph:
+    """Tiny dependency-graph runner for the stages of one scan.
+
+    Each stage function receives the results of its dependencies as keyword arguments
+    (plus any initial inputs it names) and its return value is stored under its own
+    name. Ready stages are fanned out to a shared executor; the calling thread runs
+    one of them itself so a request never idles while its stages execute.
+    """
+
+    def __init__(self):
+        self._stages: dict[str, Stage] = {}
+
+    def add(self, name: str, fn: Callable[..., Any], deps: tuple[str, ...] | list[str] = ()) -> "StageGraph":
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        self._stages[name] = Stage(name=name, fn=fn, deps=tuple(deps))
+        return self
+
+    def run(self, executor: ThreadPoolExecutor | None, inputs: dict[str, Any] | None = None) -> dict[str, Any]:
+        started = time.perf_counter()
+        values: dict[str, Any] = dict(inputs or {})
+        timings: dict[str, float] = {}
+        # Stages already supplied as inputs (e.g. batched detections) are not re-run.
+        remaining = {n: s for n, s in self._stages.items() if n not in values}
+        for s in remaining.values():
+            missing = [d for d in s.deps if d not in remaining and d not in values]
+            if missing:
+                raise ValueError(f"Stage {s.name} depends on unknown {missing}")
+
+        running: dict[Future, str] = {}
+
+        def _call(stage: Stage) -> Any:
+            t0 = time.perf_counter()
+            try:
+                return stage.fn(**{d: values[d] for d in stage.deps})
+            finally:
+                timings[stage.name] = round((time.perf_counter() - t0) * 1000.0, 3)
+
+        try:
+            while remaining or running:
+                ready = [s for s in remaining.values() if all(d in values for d in s.deps)]
+                for s in ready:
+                    remaining.pop(s.name)
+                inline = None
+                if ready:
+                    # Keep one ready stage for this thread; hand the rest to the executor.
+                    inline = ready.pop()
+                    for s in ready:
+                        if executor is None:
+                            values[s.name] = _call(s)
+                        else:
+                            running[executor.submit(_call, s)] = s.name
+                    values[inline.name] = _call(inline)
+
+                if running:
+                    done, _ = wait(list(running), timeout=0 if inline is not None else None, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        values[running.pop(f)] = f.result()
+                elif inline is None and remaining:
+                    raise ValueError(f"Unresolvable stages: {sorted(remaining)}")
+        finally:
+            for f in running:
+                f.cancel()
+
+        timings["_wall"] = round((time.perf_counter() - started) * 1000.0, 3)
+        _record_timings(timings)
+        values["_timings_ms"] = timings
+        return values
+
+
+_STATS: dict[str, dict[str, float]] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def _record_timings(timings: dict[str, float]) -> None:
+    with _STATS_LOCK:
+        for name, ms in timings.items():
+            st = _STATS.setdefault(name, {"count": 0, "ms_ewma": 0.0, "ms_max": 0.0})
+            st["count"] += 1
+            st["ms_ewma"] = ms if st["count"] == 1 else round((0.2 * ms) + (0.8 * st["ms_ewma"]), 3)
+            st["ms_max"] = max(st["ms_max"], ms)
+
+
+def stage_stats() -> dict[str, dict[str, float]]:
+    """Per-stage timing (EWMA/max in ms); `_wall` is the whole graph, for comparing against the sum."""
+    with _STATS_LOCK:
+        return {k: dict(v) for k, v in _STATS.items()}
+
+
+_EXECUTOR: ThreadPoolExecutor | None = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_stage_executor() -> ThreadPoolExecutor | None:
+    """Shared executor for intra-request stages; None when DRAGON_STAGE_WORKERS=0.
+
+    Sized well above the core count: model stages spend most of their time parked on
+    the YOLO micro-batcher, and a starved stage pool would serialise concurrent scans.
+    """
+    global _EXECUTOR
+    workers = int(os.environ.get("DRAGON_STAGE_WORKERS", str(max(16, (os.cpu_count() or 1) * 4))) or 0)
+    if workers <= 0:
+        return None
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stage")
+        return _EXECUTOR
+
+
+def shutdown_stage_executor() -> None:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        executor = _EXECUTOR
+        _EXECUTOR = None
+    if executor is not None:
+        executor.shutdown(wait=True)
@@ -0,0 +1,39 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_pool import AnalysisPool, PoolSaturated  # noqa: E402
+
+
+def test_cancelled_requests_keep_their_slot_until_the_job_ends():
+    async def scenario():
+        pool = AnalysisPool(workers=1, max_queue=1)
+        release = threading.Event()
+        running = asyncio.ensure_future(pool.run(release.wait, 5))
+        queued = asyncio.ensure_future(pool.run(time.sleep, 0))
+        await asyncio.sleep(0.05)
+        running.cancel()
+        queued.cancel()
+        await asyncio.sleep(0.05)
+
+        # The queued job never started and is gone; the running one still holds a worker.
+        stats = pool.stats()
+        assert (stats["in_flight"], stats["running"]) == (1, 1)
+        extra = asyncio.ensure_future(pool.run(time.sleep, 0))
+        await asyncio.sleep(0)
+        with pytest.raises(PoolSaturated):
+            await pool.run(time.sleep, 0)
+
+        release.set()
+        await extra
+        stats = pool.stats()
+        assert (stats["in_flight"], stats["running"]) == (0, 0)
+        pool.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+import os
+import sys
+import threading
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yolo_runtime import BatchScheduler  # noqa: E402
+
+
+def _image() -> Image.Image:
+    return Image.new("RGB", (8, 8))
+
+
+def test_lone_request_does_not_wait_for_a_batch():
+    scheduler = BatchScheduler(lambda ims, conf: [[] for _ in ims], max_wait_ms=2000, max_batch=8)
+    try:
+        started = time.monotonic()
+        assert scheduler.submit_many([_image(), _image()], 0.35) == [[], []]
+        assert time.monotonic() - started < 1.0
+        assert scheduler.stats()["batch_size_counts"] == {"2": 1}
+    finally:
+        scheduler.close()
+
+
+def test_requests_arriving_during_a_batch_share_the_next_one():
+    running = threading.Event()
+    release = threading.Event()
+
+    def predict_many(ims, conf):
+        running.set()
+        release.wait(5)
+        return [[] for _ in ims]
+
+    scheduler = BatchScheduler(predict_many, max_wait_ms=2000, max_batch=8)
+    try:
+        first = threading.Thread(target=scheduler.submit, args=(_image(), 0.35))
+        first.start()
+        assert running.wait(5)
+        # These queue up behind the running batch and go out together when it ends.
+        others = [threading.Thread(target=scheduler.submit, args=(_image(), 0.35)) for _ in range(3)]
+        for t in others:
+            t.start()
+        while scheduler.stats()["queued"] < 3:
+            time.sleep(0.001)
+        started = time.monotonic()
+        release.set()
+        for t in [first, *others]:
+            t.join(5)
+        assert time.monotonic() - started < 1.0
+        assert scheduler.stats()["batch_size_counts"] == {"1": 1, "3": 1}
+        assert scheduler.stats()["active_callers"] == 0
+    finally:
+        scheduler.close()
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calibration_sketch import CalibrationSketches  # noqa: E402
+
+
+def _features(rng: np.random.Generator, n: int, shift: float) -> list[dict]:
+    defect = rng.uniform(0, 40, n) + shift
+    quality = rng.uniform(60, 90, n) + shift / 4
+    return [{"defect_probability": float(d), "quality_score": float(q)} for d, q in zip(defect, quality)]
+
+
+def test_workers_saving_in_turn_give_the_quantiles_of_the_union(tmp_path):
+    path = str(tmp_path / "calibration_sketches.json")
+    rng = np.random.default_rng(11)
+    # Two workers on the same file, each seeing a different share of the scans; k is large
+    # enough that no compaction happens, so the percentiles are exact.
+    a = CalibrationSketches(path, k=4000, save_every=10_000)
+    b = CalibrationSketches(path, k=4000, save_every=10_000)
+    a.load()
+    b.load()
+    seen_a = _features(rng, 300, 0.0)
+    seen_b = _features(rng, 200, 25.0)
+    for features in seen_a:
+        a.observe(features)
+    for features in seen_b:
+        b.observe(features)
+
+    assert a.save()
+    assert b.save()
+    assert not a.save()  # nothing new: only re-reads the merged file
+
+    union = seen_a + seen_b
+    fresh = CalibrationSketches(path, k=4000)
+    fresh.load()
+    for sketches in (a, b, fresh):
+        assert sketches.n == len(union)
+        for name in CalibrationSketches.FIELDS:
+            values = [f[name] for f in union]
+            for q in (10, 25, 50, 75, 90):
+                assert sketches.percentile(name, q) == np.percentile(values, q)
+
+    # Later observations are merged in, not written over the other worker's.
+    extra = _features(rng, 50, 50.0)
+    for features in extra:
+        a.observe(features)
+    a.save()
+    b.save()
+    assert b.n == len(union) + len(extra)
+    assert b.stats()["unsaved"] == 0
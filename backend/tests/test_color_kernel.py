@@ -0,0 +1,89 @@
+import copy
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import color_kernel  # noqa: E402
+from color_kernel import _DEFAULT_RULES, _classify_loop, _classify_lut, _classify_numpy, _rule_bits, build_color_lut  # noqa: E402
+
+
+def _all_colours() -> np.ndarray:
+    # Every 24-bit colour once, as a 4096 x 4096 image: pixel i is (i >> 16, i >> 8 & 255, i & 255).
+    i = np.arange(1 << 24, dtype=np.uint32).reshape(4096, 4096)
+    return np.stack([(i >> 16) & 255, (i >> 8) & 255, i & 255], axis=-1).astype(np.uint8)
+
+
+def _reference(img: np.ndarray, rules: dict) -> np.ndarray:
+    out = np.empty(img.shape[:2], dtype=np.uint8)
+    for y0 in range(0, img.shape[0], 256):
+        tile = img[y0:y0 + 256]
+        out[y0:y0 + 256] = _rule_bits(tile[..., 0], tile[..., 1], tile[..., 2], rules)
+    return out
+
+
+def _check(labels: np.ndarray, hist: np.ndarray, expected: np.ndarray) -> None:
+    mismatched = np.count_nonzero(labels != expected)
+    assert mismatched == 0, f"{mismatched} colours differ"
+    assert np.array_equal(hist, np.bincount(expected.ravel(), minlength=16))
+
+
+@pytest.fixture(scope="module")
+def every_colour():
+    img = _all_colours()
+    return img, _reference(img, _DEFAULT_RULES)
+
+
+def test_numpy_kernel_matches_reference_on_every_colour(every_colour):
+    img, expected = every_colour
+    _check(*_classify_numpy(img), expected)
+
+
+def test_lut_matches_reference_on_every_colour(every_colour):
+    img, expected = every_colour
+    _check(*_classify_lut(img, build_color_lut(_DEFAULT_RULES)), expected)
+
+
+def test_loop_kernel_matches_reference(every_colour):
+    img, expected = every_colour
+    if color_kernel.numba is not None:
+        sample, want = img, expected
+        kernel = color_kernel._numba_kernel()
+    else:
+        # Plain Python is slow: a dense random sample of colours plus every white-test
+        # candidate (R, G, B > 150), where the uint8 wraparound matters.
+        rng = np.random.default_rng(7)
+        flat, flat_want = img.reshape(-1, 3), expected.reshape(-1)
+        bright = np.flatnonzero((flat > 150).all(axis=1))[::7]
+        pick = np.concatenate([rng.choice(flat.shape[0], 20_000, replace=False), bright])
+        sample, want = flat[pick][None], flat_want[pick][None]
+        kernel = _classify_loop
+    labels = np.empty(sample.shape[:2], dtype=np.uint8)
+    hist = np.zeros(16, dtype=np.int64)
+    kernel(sample, labels, hist)
+    _check(labels, hist, want)
+
+
+def test_white_uses_uint8_wraparound():
+    # np.abs(R - G) on uint8 wraps, so only R >= G (and G >= B) within 30 count as white.
+    img = np.array([[[200, 180, 170], [180, 200, 190], [200, 190, 210], [255, 254, 226]]], dtype=np.uint8)
+    expected = _reference(img, _DEFAULT_RULES)
+    assert [bool(v & color_kernel.WHITE) for v in expected[0]] == [True, False, False, True]
+    _check(*_classify_numpy(img), expected)
+    _check(*_classify_lut(img, build_color_lut(_DEFAULT_RULES)), expected)
+    labels = np.empty(img.shape[:2], dtype=np.uint8)
+    hist = np.zeros(16, dtype=np.int64)
+    _classify_loop(img, labels, hist)
+    _check(labels, hist, expected)
+
+
+def test_lut_follows_tuned_rules():
+    rules = copy.deepcopy(_DEFAULT_RULES)
+    rules["pink_red"]["r_over_g"] = 1.5
+    rules["white"]["max_diff"] = 12
+    rng = np.random.default_rng(3)
+    img = rng.integers(0, 256, (256, 512, 3), dtype=np.uint8)
+    _check(*_classify_lut(img, build_color_lut(rules)), _reference(img, rules))
@@ -0,0 +1,86 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from histogram_stats import Histogram, channel_histograms, gray_codes  # noqa: E402
+
+QS = (0, 1, 8, 10, 25, 33.3, 50, 75, 90, 99.5, 100)
+
+
+def _old_stats(pixels: np.ndarray) -> dict:
+    # The ROI statistics as _grade_fruit / _estimate_insect_risk computed them before
+    # histograms: float channel means, np.percentile of the gray, and elementwise counts.
+    gray = np.mean(pixels, axis=1)
+    stats = {"means": [float(v) for v in pixels.mean(axis=0).tolist()], "n": int(gray.size)}
+    if gray.size:
+        p10 = float(np.percentile(gray, 10))
+        p8 = float(np.percentile(gray, 8))
+        stats["defect_dark"] = int(np.sum(gray < max(35.0, p10 - 18.0)))
+        stats["insect_dark"] = int(np.count_nonzero(gray < max(20.0, p8 - 12.0)))
+        stats["percentiles"] = [float(np.percentile(gray, q)) for q in QS]
+    return stats
+
+
+def _new_stats(pixels: np.ndarray) -> dict:
+    hist = Histogram.gray(pixels)
+    stats = {"means": [h.mean() for h in channel_histograms(pixels)], "n": hist.n}
+    if hist.n:
+        stats["defect_dark"] = hist.count_below(max(35.0, hist.percentile(10) - 18.0))
+        stats["insect_dark"] = hist.count_below(max(20.0, hist.percentile(8) - 12.0))
+        stats["percentiles"] = [hist.percentile(q) for q in QS]
+    return stats
+
+
+def _images() -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(14)
+    frame = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    mask = rng.random((120, 160)) < 0.3
+    shaded = np.clip(rng.normal(90, 30, (64, 64, 3)), 0, 255).astype(np.uint8)
+    return {
+        "uniform": frame.reshape(-1, 3),
+        "masked": frame[mask],
+        "shaded": shaded.reshape(-1, 3),
+        "narrow": rng.integers(40, 44, (5000, 3), dtype=np.uint8),
+        "odd_count": rng.integers(0, 256, (7, 3), dtype=np.uint8),
+        "all_black": np.zeros((50, 3), dtype=np.uint8),
+        "all_white": np.full((50, 3), 255, dtype=np.uint8),
+        "single_pixel": np.array([[200, 31, 77]], dtype=np.uint8),
+    }
+
+
+@pytest.mark.parametrize("name", list(_images()))
+def test_histogram_stats_match_the_numpy_reference(name):
+    pixels = _images()[name]
+    assert _new_stats(pixels) == _old_stats(pixels)
+
+
+@pytest.mark.parametrize("name", list(_images()))
+def test_dark_mask_matches_elementwise_threshold(name):
+    pixels = _images()[name]
+    gray = np.mean(pixels, axis=1)
+    hist = Histogram.gray(pixels)
+    for thr in (20.0, 35.0, 41.0, 41.0 + 1 / 3, float(gray[0]), 255.0, 256.0):
+        assert np.array_equal(gray_codes(pixels) < hist.code_below(thr), gray < thr)
+        assert hist.count_below(thr) == int(np.sum(gray < thr))
+
+
+def test_masked_empty_region():
+    frame = np.random.default_rng(3).integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    pixels = frame[np.zeros((8, 8), dtype=bool)]
+    hist = Histogram.gray(pixels)
+    assert hist.n == 0
+    assert hist.count_below(100.0) == 0
+    assert np.isnan(hist.mean())
+    with pytest.raises(ValueError):
+        hist.percentile(10)
+    # The callers guard on n, as the old code guarded on size; both means are NaN.
+    with np.errstate(invalid="ignore", divide="ignore"), pytest.warns(RuntimeWarning):
+        old = _old_stats(pixels)
+    new = _new_stats(pixels)
+    assert old.keys() == new.keys() == {"means", "n"}
+    assert new["n"] == old["n"] == 0
+    assert np.isnan(old["means"]).all() and np.isnan(new["means"]).all()
@@ -0,0 +1,104 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jsonl_writer import JsonlWriter  # noqa: E402
+
+
+def _failing_open(writer: JsonlWriter, failures: int):
+    real_open = writer._open
+    state = {"left": failures}
+
+    def _open():
+        if state["left"] > 0:
+            state["left"] -= 1
+            raise OSError("disk full")
+        return real_open()
+
+    return _open
+
+
+def _lines(path) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_failed_batch_is_retried_once(tmp_path):
+    path = tmp_path / "scans.jsonl"
+    writer = JsonlWriter(str(path), max_delay_s=0.0, retry_delay_s=0.0)
+    writer._open = _failing_open(writer, 1)
+    try:
+        writer.append({"id": 1})
+        assert writer.flush()
+        assert _lines(path) == [{"id": 1}]
+        stats = writer.stats()
+        assert (stats["written"], stats["dropped"], stats["retries"], stats["errors"]) == (1, 0, 1, 1)
+    finally:
+        writer.close()
+
+
+def test_batch_failing_twice_is_dropped_and_flush_reports_it(tmp_path):
+    path = tmp_path / "scans.jsonl"
+    writer = JsonlWriter(str(path), max_delay_s=0.0, retry_delay_s=0.0)
+    writer._open = _failing_open(writer, 2)
+    try:
+        writer.append({"id": 1})
+        assert not writer.flush()
+        stats = writer.stats()
+        assert (stats["written"], stats["dropped"]) == (0, 1)
+
+        # Later records are written, and a flush that only waited for them succeeds.
+        writer.append({"id": 2})
+        assert writer.flush()
+        assert _lines(path) == [{"id": 2}]
+        assert writer.stats()["written"] == 1
+    finally:
+        writer.close()
+
+
+def test_retry_after_a_partial_write_keeps_the_batch_readable(tmp_path):
+    path = tmp_path / "scans.jsonl"
+    writer = JsonlWriter(str(path), max_delay_s=0.0, retry_delay_s=0.0)
+    real_open = writer._open
+    state = {"torn": False}
+
+    class _TornFile:
+        # Writes half of the first batch, then fails like a full disk would.
+        def __init__(self, f):
+            self._f = f
+
+        def write(self, data):
+            self._f.write(data[: len(data) // 2])
+            self._f.flush()
+            raise OSError("disk full")
+
+        def close(self):
+            self._f.close()
+
+    def _open():
+        f = real_open()
+        if not state["torn"]:
+            state["torn"] = True
+            writer._file = None
+            return _TornFile(f)
+        return f
+
+    writer._open = _open
+    try:
+        for i in range(3):
+            writer.append({"id": i, "pad": "x" * 40})
+        assert writer.flush()
+        with open(path, encoding="utf-8") as f:
+            raw = [line for line in f.read().split("\n") if line.strip()]
+        parsed = []
+        for line in raw:
+            try:
+                parsed.append(json.loads(line)["id"])
+            except ValueError:
+                pass  # the torn prefix, skipped by readers
+        assert parsed == [0, 1, 2]
+        assert (writer.stats()["written"], writer.stats()["dropped"]) == (3, 0)
+    finally:
+        writer.close()
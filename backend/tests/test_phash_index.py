@@ -0,0 +1,69 @@
+import io
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phash_index import NearDuplicateIndex, NearDuplicateSessions, dhash  # noqa: E402
+
+
+def _fruit(center: tuple[float, float], seed: int = 0, size: tuple[int, int] = (640, 480)) -> Image.Image:
+    # A shaded fruit on a side-lit table: every region has some gradient, as in a real photo
+    # (dHash bits over perfectly flat fills are decided by compression noise).
+    rng = np.random.default_rng(seed)
+    w, h = size
+    yy, xx = np.mgrid[0:h, 0:w].astype(float)
+    cx, cy = center[0] * w, center[1] * h
+    rx, ry = 0.3 * w, 0.3 * h
+    r2 = ((xx - cx) / rx) ** 2 + ((yy - cy) / ry) ** 2
+    shade = 1 - 0.5 * np.sqrt(np.clip(r2, 0, 1)) * (0.5 + 0.5 * (xx - cx) / rx)
+    table = 60 + 50 * xx / w + 20 * yy / h
+    arr = np.where(
+        (r2 <= 1)[..., None],
+        np.array([215, 40, 110]) * shade[..., None],
+        np.stack([table, table * 0.85, table * 0.7], -1),
+    )
+    arr = arr + rng.integers(-12, 12, (h, w, 3))
+    return Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+
+
+def _reencode(image: Image.Image, quality: int) -> Image.Image:
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality)
+    buf.seek(0)
+    return Image.open(buf).convert("RGB")
+
+
+def test_reencoded_copy_hits_and_different_image_misses():
+    index = NearDuplicateIndex.from_env()
+    assert index.enabled and index.max_distance > 0
+    original = _reencode(_fruit((0.35, 0.5), seed=1), 92)
+    index.add(dhash(original), original.size, "boxes-1", tag=0.35)
+
+    for quality in (60, 75, 85):
+        copy = _reencode(original, quality)
+        assert index.lookup(dhash(copy), copy.size, tag=0.35) == "boxes-1"
+
+    other = _reencode(_fruit((0.65, 0.45), seed=2), 92)
+    assert index.lookup(dhash(other), other.size, tag=0.35) is None
+    # Same frame, other model threshold: never reused.
+    assert index.lookup(dhash(original), original.size, tag=0.45) is None
+
+
+def test_sessions_do_not_share_frames():
+    sessions = NearDuplicateSessions(max_sessions=2, max_items=8, max_distance=2, ttl_s=10)
+    frame = _reencode(_fruit((0.5, 0.5), seed=3), 92)
+    a = sessions.get(("mobile_app", "batch-a"))
+    assert sessions.get(("mobile_app", "batch-a")) is a
+    a.add(dhash(frame), frame.size, "boxes-3")
+
+    b = sessions.get(("mobile_app", "batch-b"))
+    assert b.lookup(dhash(frame), frame.size) is None
+    assert a.lookup(dhash(_reencode(frame, 70)), frame.size) == "boxes-3"
+
+    sessions.get(("mobile_app", "batch-c"))  # evicts the least recently used session (a)
+    assert sessions.get(("mobile_app", "batch-a")).lookup(dhash(frame), frame.size) is None
+    assert sessions.get(None) is None
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preview import PreviewStore, preview_etag, render_preview  # noqa: E402
+
+
+def _scene() -> tuple[Image.Image, np.ndarray, tuple[int, int, int, int]]:
+    rng = np.random.default_rng(10)
+    image = Image.fromarray(rng.integers(0, 256, (120, 160, 3), dtype=np.uint8))
+    mask = np.zeros((120, 160), dtype=bool)
+    mask[30:90, 40:120] = True
+    return image, mask, (40, 30, 119, 89)
+
+
+def _workers(tmp_path, n: int = 2, **kw) -> list[PreviewStore]:
+    # Separate stores on one directory stand in for separate worker processes.
+    return [PreviewStore(16, 1 << 20, directory=str(tmp_path), **kw) for _ in range(n)]
+
+
+def test_rendered_preview_is_served_by_another_worker(tmp_path):
+    a, b = _workers(tmp_path)
+    jpeg = render_preview(*_scene())
+    assert a.put_jpeg("scan-1", jpeg)
+    assert b.get("scan-1") == (jpeg, preview_etag(jpeg))
+    assert b.stats()["disk_hits"] == 1
+    # Blobs are content-addressed: a second scan with the same preview adds no blob.
+    a.put_jpeg("scan-2", jpeg)
+    assert len(os.listdir(tmp_path / "blobs")) == 1
+    assert b.get("scan-2")[0] == jpeg
+
+
+def test_lazy_preview_renders_on_another_worker(tmp_path):
+    a, b = _workers(tmp_path)
+    image, mask, bbox = _scene()
+    assert a.put_source("scan-lazy", image, mask, bbox)
+    jpeg, etag = b.get("scan-lazy")
+    assert jpeg == render_preview(image, mask, bbox)
+    assert not os.listdir(tmp_path / "pending")
+    # The first worker now reads the same bytes, whichever copy it finds.
+    assert a.get("scan-lazy") == (jpeg, etag)
+    assert PreviewStore(16, 1 << 20, directory=str(tmp_path)).get("scan-lazy") == (jpeg, etag)
+
+
+def test_unknown_and_unsafe_ids_miss(tmp_path):
+    (store,) = _workers(tmp_path, n=1)
+    assert store.get("missing") is None
+    assert store.get("../scans/x") is None
+    store.put_jpeg("../escape", b"x")  # cached in memory only, never used as a path
+    assert not (tmp_path.parent / "escape").exists()
+    assert not os.path.exists(tmp_path / "scans")
+    assert PreviewStore(16, 1 << 20, directory=str(tmp_path)).get("../escape") is None
+
+
+def test_disk_is_pruned_oldest_first(tmp_path):
+    (store,) = _workers(tmp_path, n=1, max_disk_bytes=4096)
+    rng = np.random.default_rng(0)
+    for i in range(70):
+        store.put_jpeg(f"scan-{i}", rng.bytes(1024))
+    # Pruned on the 64th write; the six after it are still on disk.
+    total = sum(e.stat().st_size for sub in ("blobs", "scans") for e in os.scandir(tmp_path / sub))
+    assert total <= 4096 + 6 * 2048
+    assert store.stats()["disk_pruned"] > 0
+    assert PreviewStore(16, 1 << 20, directory=str(tmp_path)).get("scan-0") is None
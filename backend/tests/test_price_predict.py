@@ -0,0 +1,72 @@
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+os.environ.setdefault("DRAGON_DATA_DIR", tempfile.mkdtemp(prefix="dragon-test-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+PRICE_COLUMNS = {
+    "estimated_price_per_kg": "estimated_price_per_kg",
+    "model_price_per_kg": "model_estimated_price_per_kg",
+    "baseline_price_per_kg": "baseline_estimated_price_per_kg",
+}
+
+
+def _fruit_jpeg(seed: int, size: tuple[int, int] = (640, 480), frac: float = 0.5) -> bytes:
+    rng = np.random.default_rng(seed)
+    w, h = size
+    im = Image.new("RGB", size, (70, 60, 50))
+    d = ImageDraw.Draw(im)
+    rx, ry = int(w * frac / 2), int(h * frac / 2)
+    body = tuple(int(c) for c in rng.integers([190, 20, 90], [235, 60, 130]))
+    d.ellipse([w // 2 - rx, h // 2 - ry, w // 2 + rx, h // 2 + ry], fill=body)
+    for _ in range(int(rng.integers(0, 60))):
+        x, y = rng.integers(w // 2 - rx // 2, w // 2 + rx // 2), rng.integers(h // 2 - ry // 2, h // 2 + ry // 2)
+        d.ellipse([x, y, x + 4, y + 4], fill=(25, 20, 20))
+    arr = np.asarray(im).astype(np.int16) + rng.integers(-12, 12, (h, w, 3))
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def test_price_predict_matches_detect_on_unclamped_rows(monkeypatch):
+    # A fitted model at full blend weight that prices inside the grade band, so prices
+    # move with the second decimal of quality_score and the third of color_score.
+    model = dict(main.PRICE_MODEL, coef=[-60.0, 2.0, 0.0, -0.5, 40.0, 10.0, 5.0, 3.0], n_samples=120, version=7)
+    monkeypatch.setattr(main, "PRICE_MODEL", model)
+
+    with TestClient(main.app) as client:
+        results = []
+        for seed in range(8):
+            r = client.post("/detect", files={"file": (f"fruit{seed}.jpg", _fruit_jpeg(seed, frac=0.3 + 0.05 * seed), "image/jpeg")})
+            assert r.status_code == 200, r.text
+            results.append(r.json())
+        graded = [res for res in results if res["grade"] != "N/A"]
+        assert graded
+
+        quote = client.post("/price/predict", json={"rows": [res["price_inputs"] for res in graded]})
+        assert quote.status_code == 200, quote.text
+        columns = quote.json()["columns"]
+
+        unclamped = 0
+        for i, res in enumerate(graded):
+            lo, hi = columns["price_lo"][i], columns["price_hi"][i]
+            if lo < columns["model_price_per_kg"][i] < hi:
+                unclamped += 1
+            for quoted, detected in PRICE_COLUMNS.items():
+                assert columns[quoted][i] == res[detected], (quoted, res["price_inputs"])
+        assert unclamped > 0
+
+        # The scans log carries the same record, so logged scans can be re-quoted too.
+        main.JSONL_WRITERS.flush(main.SCANS_JSONL_PATH)
+        logged = {rec["id"]: rec for rec in main._read_jsonl(main.SCANS_JSONL_PATH)}
+        for res in graded:
+            assert logged[res["id"]]["price_inputs"] == res["price_inputs"]
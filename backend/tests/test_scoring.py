@@ -0,0 +1,388 @@
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scoring  # noqa: E402
+from scoring import PH_GRADE_PRICE_BANDS, PH_RETAIL_BAD_MIN, PH_RETAIL_GOOD_MAX  # noqa: E402
+
+# The scalar grading chain of _grade_fruit as it was before the vectorized engine,
+# kept verbatim (module globals turned into arguments) as the reference for score_rows.
+_ORDER = ["A", "B", "C", "D", "E"]
+
+
+def _grade_num(grade):
+    return {"A": 5.0, "B": 4.0, "C": 3.0, "D": 2.0, "E": 1.0}.get((grade or "").upper(), 0.0)
+
+
+def _size_num(size_category):
+    return {"large": 3.0, "medium": 2.0, "small": 1.0}.get((size_category or "").lower(), 0.0)
+
+
+def _grade_rank(grade):
+    g = (grade or "").upper()
+    return _ORDER.index(g) if g in _ORDER else len(_ORDER) - 1
+
+
+def _downgrade_grade(grade, steps=1):
+    return _ORDER[min(len(_ORDER) - 1, _grade_rank(grade) + max(1, int(steps)))]
+
+
+def _upgrade_grade_floor(grade, floor_grade):
+    g = (grade or "E").upper()
+    f = (floor_grade or "E").upper()
+    g = g if g in _ORDER else "E"
+    f = f if f in _ORDER else "E"
+    return f if _ORDER.index(g) > _ORDER.index(f) else g
+
+
+def _grade_cap_by_area(grade, area_grade):
+    g = (grade or "E").upper()
+    a = (area_grade or "E").upper()
+    g = g if g in _ORDER else "E"
+    a = a if a in _ORDER else "E"
+    return _ORDER[max(_ORDER.index(g), _ORDER.index(a))]
+
+
+def _grade_from_index_abc(score):
+    s = float(np.clip(score, 0.0, 100.0))
+    if s >= 75:
+        return "A"
+    if s >= 55:
+        return "B"
+    return "C"
+
+
+def _grade_from_area_ratio(fruit_area_ratio):
+    ratio = float(np.clip(float(fruit_area_ratio), 0.0, 1.0))
+    if ratio <= 0.0:
+        return "N/A"
+    if ratio < 0.03:
+        return "C"
+    if ratio < 0.10:
+        return "B"
+    return "A"
+
+
+def _clamp(v, lo, hi):
+    return lo if v < lo else (hi if v > hi else v)
+
+
+def _predict_price_per_kg(features, price_model):
+    coef = price_model.get("coef") or []
+    if not isinstance(coef, list) or not coef:
+        return 0.0
+    x = np.array(
+        [1.0] + [float(features.get(k) or 0.0) for k in (
+            "quality_score", "ripeness_score", "defect_probability", "fruit_area_ratio",
+            "color_score", "grade_num", "size_num",
+        )],
+        dtype=float,
+    )
+    c = np.array(coef, dtype=float)
+    return float(x @ c) if x.shape[0] == c.shape[0] else 0.0
+
+
+def _price_bounds_per_kg(grade, defect_level, insect_risk_level):
+    lo, hi = (float(v) for v in PH_GRADE_PRICE_BANDS.get((grade or "").upper(), PH_GRADE_PRICE_BANDS["C"]))
+    if defect_level == "high":
+        lo, hi = lo * 0.88, hi * 0.82
+    elif defect_level == "medium":
+        lo, hi = lo * 0.95, hi * 0.92
+    risk = str(insect_risk_level or "low").lower()
+    if risk == "high":
+        lo, hi = lo * 0.90, hi * 0.88
+    elif risk == "medium":
+        lo, hi = lo * 0.96, hi * 0.95
+    lo = max(float(PH_RETAIL_BAD_MIN), lo)
+    hi = max(lo + 1.0, min(float(PH_RETAIL_GOOD_MAX), hi))
+    return (float(lo), float(hi))
+
+
+def _baseline_price_per_kg(grade, quality_score, ripeness_score, defect_probability, defect_level, insect_risk_level):
+    q = float(np.clip(float(quality_score) / 100.0, 0.0, 1.0))
+    d = float(np.clip(float(defect_probability) / 100.0, 0.0, 1.0))
+    r = float(np.clip(float(ripeness_score), 0.0, 100.0))
+    lo, hi = _price_bounds_per_kg(grade, defect_level, insect_risk_level)
+    anchor = (lo + hi) / 2.0
+    ripeness_penalty = min(0.35, abs(r - 88.0) / 100.0)
+    risk = str(insect_risk_level or "low").lower()
+    insect_factor = 0.84 if risk == "high" else (0.93 if risk == "medium" else 1.0)
+    price = anchor * (0.74 + (0.34 * q)) * (1.0 - (0.28 * d)) * (1.0 - ripeness_penalty) * insect_factor
+    return float(_clamp(float(price), lo, hi))
+
+
+def _assess_disease_status(defect_probability, yolo_bad_best_conf, yolo_bad_count, quality_score,
+                           ripeness_score, insect_risk_level, insect_risk_score, cal):
+    defect = float(np.clip(float(defect_probability), 0.0, 100.0))
+    conf = float(np.clip(float(yolo_bad_best_conf), 0.0, 1.0))
+    q = float(np.clip(float(quality_score), 0.0, 100.0))
+    i_score = int(np.clip(int(insect_risk_score), 0, 100))
+    i_level = str(insect_risk_level or "low").lower()
+    bad_count = max(0, int(yolo_bad_count))
+    defect_medium_gate = float(cal.get("defect_medium_gate", 42.0))
+    defect_high_gate = float(cal.get("defect_high_gate", 60.0))
+
+    strong_model_evidence = bool(conf >= 0.90 or (conf >= 0.80 and bad_count >= 2))
+    moderate_model_evidence = bool(conf >= 0.72 or (conf >= 0.66 and bad_count >= 2))
+    weak_model_evidence = bool(conf >= 0.58 or bad_count >= 1)
+    low_light_context = q < 74.0
+    high_defect_context = defect >= defect_high_gate and low_light_context and i_score >= 72
+    medium_defect_context = defect >= defect_medium_gate and (low_light_context or i_score >= 72)
+
+    if strong_model_evidence:
+        return ("high", "High disease risk (rot/fungal)")
+    if moderate_model_evidence and defect >= max(30.0, defect_medium_gate - 10.0):
+        return ("medium", "Possible early disease signs")
+    if high_defect_context and (i_level == "high" or i_score >= 80):
+        return ("high", "High disease risk (rot/fungal)")
+    if medium_defect_context or (weak_model_evidence and defect >= max(36.0, defect_medium_gate)):
+        return ("medium", "Surface blemish detected")
+    return ("low", "Healthy")
+
+
+def _compute_quality_index(quality_score, ripeness_score, defect_probability, fruit_area_ratio, insect_risk_score,
+                           yolo_bad_best_conf, best_yolo_conf, shape_score, size_category, color_score, defect_level):
+    q = float(np.clip(float(quality_score), 0.0, 100.0))
+    ripeness_fit = float(np.clip(100.0 - (abs(float(ripeness_score) - 88.0) * 2.0), 0.0, 100.0))
+    defect_component = float(np.clip(100.0 - (float(defect_probability) * 1.15), 0.0, 100.0))
+    insect_component = float(np.clip(100.0 - (float(insect_risk_score) * 0.75), 0.0, 100.0))
+    shape_component = float(np.clip((float(shape_score) / 10.0) * 100.0, 0.0, 100.0))
+    detect_component = float(np.clip(float(best_yolo_conf) * 100.0, 45.0, 100.0))
+    area_component = float(np.clip(((float(fruit_area_ratio) - 0.06) / 0.38) * 100.0, 0.0, 100.0))
+    quality_index = (
+        (0.30 * q)
+        + (0.19 * ripeness_fit)
+        + (0.21 * defect_component)
+        + (0.09 * insect_component)
+        + (0.07 * shape_component)
+        + (0.06 * detect_component)
+        + (0.08 * area_component)
+    )
+    quality_index += 1.5 if size_category == "Large" else (0.8 if size_category == "Medium" else -0.8)
+    if float(color_score) >= 7.0:
+        quality_index += 0.8
+    elif float(color_score) <= 2.5:
+        quality_index -= 0.8
+    if defect_level == "high":
+        quality_index -= 7.0
+    elif defect_level == "medium":
+        quality_index -= 2.5
+    if float(yolo_bad_best_conf) >= 0.86:
+        quality_index -= 5.0
+    elif float(yolo_bad_best_conf) >= 0.68:
+        quality_index -= 2.0
+    return float(np.clip(quality_index, 0.0, 100.0))
+
+
+def _scalar_score(row, cal, price_model):
+    quality_score = row["quality_score"]
+    ripeness_score = row["ripeness_score"]
+    defect_probability = row["defect_probability"]
+    fruit_area_ratio = row["fruit_area_ratio"]
+    color_score = row["color_score"]
+    best_yolo_conf = row["best_yolo_conf"]
+    yolo_bad_best_conf = row["yolo_bad_best_conf"]
+    yolo_bad_count = row["yolo_bad_count"]
+    insect_risk_level = row["insect_risk_level"]
+    insect_risk_score = row["insect_risk_score"]
+    is_valid_fruit = row["is_valid_fruit"]
+
+    size_category = "Small" if fruit_area_ratio < 0.08 else ("Medium" if fruit_area_ratio < 0.18 else "Large")
+    area_grade_anchor = _grade_from_area_ratio(fruit_area_ratio)
+    defect_level, disease_status = _assess_disease_status(
+        defect_probability, yolo_bad_best_conf, yolo_bad_count, quality_score, ripeness_score,
+        insect_risk_level, insect_risk_score, cal,
+    )
+    fresh_candidate = bool(
+        quality_score >= cal["fresh_quality_floor"]
+        and ripeness_score >= 75
+        and yolo_bad_best_conf < 0.52
+        and yolo_bad_count == 0
+        and defect_probability < cal["fresh_defect_cap"]
+    )
+    if fresh_candidate:
+        defect_level = "low"
+        disease_status = "Healthy"
+        if insect_risk_level == "high":
+            insect_risk_level = "medium"
+            insect_risk_score = min(int(insect_risk_score), 55)
+        elif insect_risk_level == "medium":
+            insect_risk_score = min(int(insect_risk_score), 45)
+    if insect_risk_level == "high" and yolo_bad_best_conf < 0.68 and defect_level == "low":
+        insect_risk_level = "medium"
+        insect_risk_score = min(int(insect_risk_score), 55)
+    elif (
+        insect_risk_level == "high"
+        and defect_level == "medium"
+        and yolo_bad_best_conf < 0.68
+        and disease_status != "Healthy"
+    ):
+        disease_status = "Minor spotting with possible insect stress"
+    if is_valid_fruit and defect_level == "low" and yolo_bad_best_conf < 0.45:
+        if best_yolo_conf >= 0.72 and ripeness_score >= 70:
+            quality_score = max(quality_score, 90.0)
+        elif best_yolo_conf >= 0.58 and ripeness_score >= 65:
+            quality_score = max(quality_score, 85.0)
+
+    quality_index = _compute_quality_index(
+        quality_score, ripeness_score, defect_probability, fruit_area_ratio, insect_risk_score,
+        yolo_bad_best_conf, best_yolo_conf, row["shape_score"], size_category, color_score, defect_level,
+    )
+    if not is_valid_fruit:
+        grade = "N/A"
+    else:
+        grade = _grade_from_index_abc(quality_index)
+        if defect_level == "high" and grade in ("A", "B"):
+            grade = _downgrade_grade(grade, 1)
+        if insect_risk_level == "high" and grade in ("A", "B"):
+            grade = _downgrade_grade(grade, 1)
+        if yolo_bad_best_conf >= 0.86 and grade in ("A", "B"):
+            grade = _downgrade_grade(grade, 1)
+        if (
+            disease_status == "Healthy"
+            and defect_level == "low"
+            and quality_score >= cal["grade_floor_c_quality"]
+            and ripeness_score >= 65
+        ):
+            grade = _upgrade_grade_floor(grade, "C")
+        if fresh_candidate and defect_level == "low":
+            grade = _upgrade_grade_floor(grade, "B")
+        elif (
+            disease_status == "Healthy"
+            and defect_level == "low"
+            and quality_score >= cal["grade_floor_b_quality"]
+            and ripeness_score >= 75
+        ):
+            grade = _upgrade_grade_floor(grade, "B")
+        if area_grade_anchor == "A" and defect_level == "low" and insect_risk_level != "high":
+            grade = _upgrade_grade_floor(grade, "B")
+            if quality_score >= 80 and yolo_bad_best_conf < 0.62:
+                grade = _upgrade_grade_floor(grade, "A")
+        elif area_grade_anchor == "B" and defect_level == "low" and insect_risk_level != "high":
+            grade = _upgrade_grade_floor(grade, "B")
+        grade = _upgrade_grade_floor(grade, "C")
+        if area_grade_anchor == "C" and (fruit_area_ratio < 0.03 or best_yolo_conf < 0.42):
+            grade = _grade_cap_by_area(grade, "C")
+        elif area_grade_anchor == "B" and defect_level != "low":
+            grade = _grade_cap_by_area(grade, "B")
+
+    features = {
+        "quality_score": float(round(quality_score, 3)),
+        "ripeness_score": float(round(ripeness_score, 3)),
+        "defect_probability": float(round(defect_probability, 3)),
+        "fruit_area_ratio": float(round(fruit_area_ratio, 6)),
+        "color_score": float(round(color_score, 4)),
+        "grade_num": _grade_num(grade),
+        "size_num": _size_num(size_category),
+    }
+    model_price = 0.0
+    baseline_price = 0.0
+    if is_valid_fruit:
+        lo_price, hi_price = _price_bounds_per_kg(grade, defect_level, insect_risk_level)
+        model_price = _predict_price_per_kg(features, price_model)
+        baseline_price = _baseline_price_per_kg(
+            grade, quality_score, ripeness_score, defect_probability, defect_level, insect_risk_level,
+        )
+        model_samples = int(price_model.get("n_samples") or 0)
+        model_weight = 0.20 if model_samples >= 120 else (0.12 if model_samples >= 40 else 0.0)
+        if model_price > 0 and model_weight > 0:
+            model_price = float(_clamp(float(model_price), lo_price, hi_price))
+            estimated_price_per_kg = float((model_weight * model_price) + ((1.0 - model_weight) * baseline_price))
+        else:
+            estimated_price_per_kg = float(baseline_price)
+        area_price_factor = float(np.clip(0.82 + (float(fruit_area_ratio) * 1.10), 0.82, 1.16))
+        estimated_price_per_kg = float(estimated_price_per_kg * area_price_factor)
+        model_price = float(model_price * area_price_factor) if model_price else 0.0
+        baseline_price = float(baseline_price * area_price_factor) if baseline_price else 0.0
+        model_price = float(_clamp(float(model_price), lo_price, hi_price)) if model_price else 0.0
+        baseline_price = float(_clamp(float(baseline_price), lo_price, hi_price)) if baseline_price else 0.0
+        estimated_price_per_kg = float(_clamp(float(estimated_price_per_kg), lo_price, hi_price))
+    else:
+        estimated_price_per_kg = 0.0
+
+    lanes = {
+        "A": "Export / Premium",
+        "B": "Local Market",
+        "C": "Processing / Reject check",
+        "D": "Low-grade / Processing",
+    }
+    sorting_lane = "Rejected" if not is_valid_fruit else lanes.get(grade, "Reject / Compost")
+    return {
+        "grade": grade,
+        "sorting_lane": sorting_lane,
+        "defect_level": defect_level,
+        "disease_status": disease_status,
+        "insect_risk_level": insect_risk_level,
+        "insect_risk_score": insect_risk_score,
+        "quality_score": quality_score,
+        "quality_index": quality_index,
+        "estimated_price_per_kg": estimated_price_per_kg,
+        "model_price_per_kg": model_price,
+        "baseline_price_per_kg": baseline_price,
+    }
+
+
+def _records(n: int, seed: int) -> list[dict]:
+    # Random signals with every threshold the chain compares against mixed in.
+    rng = random.Random(seed)
+
+    def conf():
+        return rng.choice([rng.random(), rng.choice([0.0, 0.42, 0.45, 0.52, 0.58, 0.62, 0.66, 0.68, 0.72, 0.8, 0.86, 0.9, 1.0])])
+
+    return [
+        {
+            "is_valid_fruit": rng.random() < 0.9,
+            "quality_score": rng.choice([rng.uniform(20, 99), 74.0, 80.0, 82.0, 85.0, 88.0, 90.0]),
+            "ripeness_score": rng.choice([rng.uniform(10, 99), 65.0, 70.0, 75.0, 88.0]),
+            "defect_probability": rng.choice([rng.uniform(0, 90), 0.0, 28.0, 30.0, 32.0, 35.0, 36.0, 42.0, 58.0, 60.0]),
+            "fruit_area_ratio": rng.choice([rng.uniform(0, 0.6), 0.0, 0.03, 0.08, 0.1, 0.18]),
+            "color_score": rng.choice([rng.uniform(0, 10), 2.5, 7.0]),
+            "shape_score": rng.choice([5, 8, 10]),
+            "best_yolo_conf": conf(),
+            "yolo_bad_best_conf": conf(),
+            "yolo_bad_count": rng.choice([0, 0, 1, 2, 3]),
+            "insect_risk_level": rng.choice(["low", "medium", "high"]),
+            "insect_risk_score": rng.randint(0, 100),
+        }
+        for _ in range(n)
+    ]
+
+
+CALIBRATIONS = [
+    dict(scoring.DEFAULT_CALIBRATION),
+    {
+        "defect_medium_gate": 36.0,
+        "defect_high_gate": 58.0,
+        "fresh_quality_floor": 80.0,
+        "fresh_defect_cap": 28.0,
+        "grade_floor_c_quality": 75.0,
+        "grade_floor_b_quality": 88.0,
+    },
+]
+PRICE_MODELS = [
+    {"coef": [], "n_samples": 0},
+    {"coef": [50.0, 1.1, 0.2, -3.0, 80.0, 5.0, 10.0, 4.0], "n_samples": 50},
+    {"coef": [-60.0, 2.0, 0.0, -0.5, 40.0, 10.0, 5.0, 3.0], "n_samples": 200},
+]
+
+
+@pytest.mark.parametrize("cal", CALIBRATIONS)
+@pytest.mark.parametrize("price_model", PRICE_MODELS)
+def test_score_rows_matches_scalar_chain(cal, price_model):
+    records = _records(3000, seed=16)
+    scored = scoring.score_rows(scoring.rows_from_records(records), cal, price_model)
+    for i, record in enumerate(records):
+        want = _scalar_score(record, cal, price_model)
+        got = scoring.scored_row(scored, i)
+        for key in ("grade", "sorting_lane", "defect_level", "disease_status", "insect_risk_level", "insect_risk_score"):
+            assert got[key] == want[key], (key, record)
+        assert got["quality_index"] == pytest.approx(want["quality_index"], abs=1e-9), record
+        for key in ("estimated_price_per_kg", "model_price_per_kg", "baseline_price_per_kg"):
+            # /detect reports prices to the cent; the engine may differ in the last ulp.
+            assert got[key] == pytest.approx(want[key], abs=1e-9), (key, record)
+            assert round(got[key], 2) == round(want[key], 2), (key, record)
@@ -1,10 +1,16 @@
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from dataclasses import dataclass
 from typing import Any
 
 import numpy as np
 from PIL import Image
 
+from phash_index import NearDuplicateIndex
+
 
 @dataclass
 class Detection:
@@ -81,6 +87,168 @@ def _weights_path(model: str | None = None) -> str | None:
   return None
 
 
+def _group_items(items: list) -> dict:
+  # Ultralytics letterboxes a batch to one shape (minimal padding only when every image
+  # matches), so mixing sizes would make a scan's detections depend on its batch-mates.
+  groups: dict[tuple, list[tuple[Image.Image, float, Future, object]]] = {}
+  for it in items:
+    groups.setdefault((it[1], it[0].size), []).append(it)
+  return groups
+
+
+class BatchScheduler:
+  """Dynamic micro-batcher in front of one model.
+
+  Callers block on `submit`; a single dispatcher thread gathers requests that arrive
+  within `max_wait_ms` (or until `max_batch` images are queued), runs them as one
+  batched forward pass and hands each caller its own detections. It only waits while
+  another caller is in flight whose images are not in the batch yet, so a lone request
+  runs at once. Because all model calls go through the dispatcher, the underlying
+  model is never used concurrently.
+  After `close()` the dispatcher still serves everything queued before the sentinel;
+  later calls run the model directly. Callers wait at most `result_timeout_s`.
+  """
+
+  def __init__(
+    self,
+    predict_many,
+    max_wait_ms: float,
+    max_batch: int,
+    name: str = "yolo",
+    result_timeout_s: float = 60.0,
+  ):
+    self._predict_many = predict_many
+    self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+    self.max_batch = max(1, int(max_batch))
+    self.result_timeout_s = max(0.001, float(result_timeout_s))
+    self._queue: queue.Queue = queue.Queue()
+    self._lock = threading.Lock()
+    # Guards `_closed` together with enqueueing, so nothing is queued behind the sentinel.
+    self._submit_lock = threading.Lock()
+    self._closed = False
+    # Images not yet answered, per caller (guarded by _submit_lock); its size is the
+    # number of callers in flight.
+    self._outstanding: dict[object, int] = {}
+    self._batches = 0
+    self._images = 0
+    self._max_seen = 0
+    self._sizes: dict[int, int] = {}
+    self._thread = threading.Thread(target=self._loop, name=f"{name}-batcher", daemon=True)
+    self._thread.start()
+
+  def submit_many(self, images: list[Image.Image], conf: float) -> list[list[Detection]]:
+    futures = []
+    caller = object()
+    with self._submit_lock:
+      if not self._closed and images:
+        self._outstanding[caller] = len(images)
+        for im in images:
+          f: Future = Future()
+          self._queue.put((im, float(conf), f, caller))
+          futures.append(f)
+    if not futures:
+      return self._predict_many(images, conf)
+    deadline = time.monotonic() + self.result_timeout_s
+    return [f.result(timeout=max(0.0, deadline - time.monotonic())) for f in futures]
+
+  def submit(self, image: Image.Image, conf: float) -> list[Detection]:
+    return self.submit_many([image], conf)[0]
+
+  def _loop(self) -> None:
+    while True:
+      first = self._queue.get()
+      if first is None:
+        self._drain()
+        return
+      items = [first]
+      callers = {first[3]}
+      deadline = time.monotonic() + self.max_wait_s
+      while len(items) < self.max_batch:
+        # Take what is queued; wait for more only while another caller has nothing in this batch.
+        remaining = deadline - time.monotonic()
+        waiting = remaining > 0 and len(self._outstanding) > len(callers)
+        try:
+          nxt = self._queue.get(timeout=remaining) if waiting else self._queue.get_nowait()
+        except queue.Empty:
+          break
+        if nxt is None:
+          self._queue.put(None)
+          break
+        items.append(nxt)
+        callers.add(nxt[3])
+
+      for key, group in _group_items(items).items():
+        self._run(key[0], group)
+
+  def _drain(self) -> None:
+    # Nothing can be enqueued after the sentinel, but serve anything that raced ahead of it.
+    pending = []
+    while True:
+      try:
+        item = self._queue.get_nowait()
+      except queue.Empty:
+        break
+      if item is not None:
+        pending.append(item)
+    for i in range(0, len(pending), self.max_batch):
+      for key, group in _group_items(pending[i : i + self.max_batch]).items():
+        self._run(key[0], group)
+
+  def _run(self, conf: float, group: list[tuple[Image.Image, float, Future, object]]) -> None:
+    with self._lock:
+      n = len(group)
+      self._batches += 1
+      self._images += n
+      self._max_seen = max(self._max_seen, n)
+      self._sizes[n] = self._sizes.get(n, 0) + 1
+    try:
+      per_image = self._predict_many([item[0] for item in group], conf)
+    except Exception as e:
+      for item in group:
+        item[2].set_exception(e)
+    else:
+      for item, dets in zip(group, per_image):
+        item[2].set_result(dets)
+    finally:
+      with self._submit_lock:
+        for item in group:
+          left = self._outstanding.get(item[3], 0) - 1
+          if left > 0:
+            self._outstanding[item[3]] = left
+          else:
+            self._outstanding.pop(item[3], None)
+
+  def stats(self) -> dict:
+    with self._lock:
+      return {
+        "max_wait_ms": round(self.max_wait_s * 1000.0, 3),
+        "max_batch": self.max_batch,
+        "batches": self._batches,
+        "images": self._images,
+        "avg_batch_size": round(self._images / self._batches, 3) if self._batches else 0.0,
+        "max_batch_size_seen": self._max_seen,
+        "batch_size_counts": {str(k): v for k, v in sorted(self._sizes.items())},
+        "queued": self._queue.qsize(),
+        "active_callers": len(self._outstanding),
+      }
+
+  def close(self) -> None:
+    with self._submit_lock:
+      if self._closed:
+        return
+      self._closed = True
+      self._queue.put(None)
+
+
+def _scheduler_from_env(predict_many, name: str) -> BatchScheduler | None:
+  wait_ms = float(os.environ.get("DRAGON_YOLO_BATCH_WAIT_MS", "10") or 0)
+  max_batch = int(os.environ.get("DRAGON_YOLO_BATCH_MAX", "8") or 1)
+  timeout_s = float(os.environ.get("DRAGON_YOLO_BATCH_TIMEOUT_S", "60") or 60)
+  if wait_ms <= 0 and max_batch <= 1:
+    return None
+  return BatchScheduler(predict_many, max_wait_ms=wait_ms, max_batch=max_batch, name=name, result_timeout_s=timeout_s)
+
+
 class YoloRuntime:
   def __init__(self, weights_path: str):
     YOLO = _try_import_ultralytics()
@@ -88,36 +256,116 @@ class YoloRuntime:
       raise RuntimeError("Ultralytics is not installed.")
     self.weights_path = os.path.abspath(weights_path)
     self._yolo = YOLO(self.weights_path)
+    self._scheduler = _scheduler_from_env(self._predict_many, os.path.basename(self.weights_path))
+
+  def predict(
+    self,
+    image: Image.Image,
+    conf: float = 0.35,
+    phash: int | None = None,
+    near_dups: NearDuplicateIndex | None = None,
+  ) -> list[Detection]:
+    """Detections for one image. With `phash` (see phash_index.dhash) and the caller's
+    `near_dups` index, a near-duplicate of a frame already in that index reuses its
+    detections instead of running the model."""
+    index = near_dups
+    if phash is not None and index is not None:
+      reused = index.lookup(phash, image.size, tag=float(conf))
+      if reused is not None:
+        return list(reused)
+    dets = self._predict_one(image, conf)
+    if phash is not None and index is not None:
+      index.add(phash, image.size, tuple(dets), tag=float(conf))
+    return dets
 
-  def predict(self, image: Image.Image, conf: float = 0.35) -> list[Detection]:
+  def _predict_one(self, image: Image.Image, conf: float) -> list[Detection]:
+    scheduler = getattr(self, "_scheduler", None)
+    if scheduler is not None:
+      return scheduler.submit(image, conf)
     im = image.convert("RGB")
     results = self._yolo.predict(source=im, conf=float(conf), verbose=False)
     if not results:
       return []
+    return _detections_from_result(results[0])
 
-    r0 = results[0]
-    names = getattr(r0, "names", None)
-    boxes = getattr(r0, "boxes", None)
-    if boxes is None:
+  def predict_batch(
+    self,
+    images: list[Image.Image],
+    conf: float = 0.35,
+    phashes: list[int | None] | None = None,
+    near_dups: NearDuplicateIndex | None = None,
+  ) -> list[list[Detection]]:
+    """Detections per input image, in order; goes through the micro-batcher when enabled.
+    Near-duplicates (by `phashes`) of frames in the caller's `near_dups` index are
+    answered from it."""
+    if not images:
       return []
+    index = near_dups
+    out: list[list[Detection] | None] = [None] * len(images)
+    if phashes is not None and index is not None:
+      for i, (im, h) in enumerate(zip(images, phashes)):
+        if h is not None:
+          reused = index.lookup(h, im.size, tag=float(conf))
+          out[i] = list(reused) if reused is not None else None
+    todo = [i for i, dets in enumerate(out) if dets is None]
+    if todo:
+      batch = [images[i] for i in todo]
+      scheduler = getattr(self, "_scheduler", None)
+      fresh = scheduler.submit_many(batch, conf) if scheduler is not None else self._predict_many(batch, conf)
+      for i, dets in zip(todo, fresh):
+        out[i] = dets
+        h = phashes[i] if phashes is not None else None
+        if h is not None and index is not None:
+          index.add(h, images[i].size, tuple(dets), tag=float(conf))
+    return out
+
+  def _predict_many(self, images: list[Image.Image], conf: float) -> list[list[Detection]]:
+    # One forward pass per image size, so batched results equal single-image results.
+    by_size: dict[tuple[int, int], list[int]] = {}
+    for i, im in enumerate(images):
+      by_size.setdefault(im.size, []).append(i)
+    out: list[list[Detection]] = [[] for _ in images]
+    for idx in by_size.values():
+      ims = [images[i].convert("RGB") for i in idx]
+      results = self._yolo.predict(source=ims, conf=float(conf), verbose=False) or []
+      for i, r in zip(idx, results):
+        out[i] = _detections_from_result(r)
+    return out
+
+  def batching_stats(self) -> dict | None:
+    scheduler = getattr(self, "_scheduler", None)
+    return scheduler.stats() if scheduler is not None else None
+
+  def close(self) -> None:
+    scheduler = getattr(self, "_scheduler", None)
+    if scheduler is not None:
+      scheduler.close()
 
-    xyxy = boxes.xyxy.cpu().numpy() if hasattr(boxes.xyxy, "cpu") else np.array(boxes.xyxy)
-    confs = boxes.conf.cpu().numpy() if hasattr(boxes.conf, "cpu") else np.array(boxes.conf)
-    clss = boxes.cls.cpu().numpy() if hasattr(boxes.cls, "cpu") else np.array(boxes.cls)
-
-    dets: list[Detection] = []
-    for i in range(xyxy.shape[0]):
-      x0, y0, x1, y1 = [int(round(v)) for v in xyxy[i].tolist()]
-      c = float(confs[i])
-      k = int(clss[i])
-      name = None
-      if isinstance(names, dict) and k in names:
-        name = str(names[k])
-      dets.append(Detection(x0=x0, y0=y0, x1=x1, y1=y1, conf=c, cls=k, name=name))
-    return dets
+
+def _detections_from_result(r0: Any) -> list[Detection]:
+  names = getattr(r0, "names", None)
+  boxes = getattr(r0, "boxes", None)
+  if boxes is None:
+    return []
+
+  xyxy = boxes.xyxy.cpu().numpy() if hasattr(boxes.xyxy, "cpu") else np.array(boxes.xyxy)
+  confs = boxes.conf.cpu().numpy() if hasattr(boxes.conf, "cpu") else np.array(boxes.conf)
+  clss = boxes.cls.cpu().numpy() if hasattr(boxes.cls, "cpu") else np.array(boxes.cls)
+
+  dets: list[Detection] = []
+  for i in range(xyxy.shape[0]):
+    x0, y0, x1, y1 = [int(round(v)) for v in xyxy[i].tolist()]
+    c = float(confs[i])
+    k = int(clss[i])
+    name = None
+    if isinstance(names, dict) and k in names:
+      name = str(names[k])
+    dets.append(Detection(x0=x0, y0=y0, x1=x1, y1=y1, conf=c, cls=k, name=name))
+  return dets
 
 
 _RUNTIMES: dict[str, YoloRuntime] = {}
+_RUNTIMES_LOCK = threading.Lock()
 
 
 def get_yolo_runtime(model: str | None = None) -> YoloRuntime | None:
@@ -127,23 +375,29 @@ def get_yolo_runtime(model: str | None = None) -> YoloRuntime | None:
   if w in _RUNTIMES:
     return _RUNTIMES[w]
 
-  try:
-    runtime = YoloRuntime(w)
-    _RUNTIMES[w] = runtime
-    return runtime
-  except Exception:
-    return None
+  with _RUNTIMES_LOCK:
+    if w in _RUNTIMES:
+      return _RUNTIMES[w]
+    try:
+      runtime = YoloRuntime(w)
+      _RUNTIMES[w] = runtime
+      return runtime
+    except Exception:
+      return None
 
 
 def reset_yolo_runtime(model: str | None = None) -> None:
   global _RUNTIMES
-  if model is None:
-    _RUNTIMES = {}
-    return
+  with _RUNTIMES_LOCK:
+    if model is None:
+      for rt in _RUNTIMES.values():
+        rt.close()
+      _RUNTIMES = {}
+      return
 
-  w = _weights_path(model)
-  if w and w in _RUNTIMES:
-    _RUNTIMES.pop(w, None)
+    w = _weights_path(model)
+    if w and w in _RUNTIMES:
+      _RUNTIMES.pop(w).close()
 
 
 def detections_to_mask(detections: list[Detection], width: int, height: int) -> np.ndarray: